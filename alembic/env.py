@@ -13,6 +13,8 @@ import app.modules.log.models
 import app.modules.room.models
 import app.modules.users.models
 import app.modules.access.models
+import app.modules.matching.models
+import app.modules.jobs.models
 
 
 # this is the Alembic Config object, which provides
@@ -0,0 +1,41 @@
+"""log keyset indexes
+
+Revision ID: 3f9a1c7d2b8e
+Revises: bc556b52c255
+Create Date: 2026-10-17 09:12:40.118342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a1c7d2b8e'
+down_revision: Union[str, Sequence[str], None] = 'bc556b52c255'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = [
+    ('ix_logs_datetime_id', ['datetime', 'id']),
+    ('ix_logs_room_id_datetime_id', ['room_id', 'datetime', 'id']),
+    ('ix_logs_user_id_datetime_id', ['user_id', 'datetime', 'id']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # logs is large and written on every door swipe, so build the indexes without locking it
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES:
+            op.create_index(name, 'logs', columns, unique=False,
+                            postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, _ in INDEXES:
+            op.drop_index(name, table_name='logs', postgresql_concurrently=True, if_exists=True)
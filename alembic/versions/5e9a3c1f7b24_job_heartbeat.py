@@ -0,0 +1,37 @@
+"""job heartbeat
+
+Revision ID: 5e9a3c1f7b24
+Revises: d41b8e6f2a97
+Create Date: 2026-10-17 19:02:41.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e9a3c1f7b24'
+down_revision: Union[str, Sequence[str], None] = 'd41b8e6f2a97'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('jobs', sa.Column('crashes', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('jobs', sa.Column('available_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False))
+    op.add_column('jobs', sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+    op.execute("UPDATE jobs SET heartbeat_at = started_at WHERE status = 'RUNNING'")
+    op.drop_index('ix_jobs_status_started_at', table_name='jobs')
+    op.create_index('ix_jobs_status_heartbeat_at', 'jobs', ['status', 'heartbeat_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_jobs_status_heartbeat_at', table_name='jobs')
+    op.create_index('ix_jobs_status_started_at', 'jobs', ['status', 'started_at'], unique=False)
+    op.drop_column('jobs', 'heartbeat_at')
+    op.drop_column('jobs', 'available_at')
+    op.drop_column('jobs', 'crashes')
@@ -0,0 +1,42 @@
+"""fingerprint templates
+
+Revision ID: 7c2e4b9a1d3f
+Revises: 3f9a1c7d2b8e
+Create Date: 2026-10-17 14:03:27.504118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2e4b9a1d3f'
+down_revision: Union[str, Sequence[str], None] = '3f9a1c7d2b8e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('fingerprint_templates',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('finger', sa.SmallInteger(), nullable=False),
+    sa.Column('version', sa.String(), nullable=False),
+    sa.Column('template', sa.LargeBinary(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'finger', 'version', name='uq_fingerprint_templates_user_id_finger_version')
+    )
+    op.create_index(op.f('ix_fingerprint_templates_id'), 'fingerprint_templates', ['id'], unique=False)
+    op.create_index(op.f('ix_fingerprint_templates_version'), 'fingerprint_templates', ['version'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_fingerprint_templates_version'), table_name='fingerprint_templates')
+    op.drop_index(op.f('ix_fingerprint_templates_id'), table_name='fingerprint_templates')
+    op.drop_table('fingerprint_templates')
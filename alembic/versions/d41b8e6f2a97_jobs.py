@@ -0,0 +1,51 @@
+"""jobs
+
+Revision ID: d41b8e6f2a97
+Revises: 7c2e4b9a1d3f
+Create Date: 2026-10-17 16:21:08.731950
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41b8e6f2a97'
+down_revision: Union[str, Sequence[str], None] = '7c2e4b9a1d3f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('jobs',
+    sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('params', sa.JSON(), nullable=False),
+    sa.Column('status', sa.Enum('QUEUED', 'RUNNING', 'DONE', 'FAILED', name='jobstatus'), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('worker', sa.String(), nullable=True),
+    sa.Column('input', sa.LargeBinary(), nullable=True),
+    sa.Column('result', sa.LargeBinary(), nullable=True),
+    sa.Column('result_headers', sa.JSON(), nullable=True),
+    sa.Column('timings', sa.JSON(), nullable=True),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_jobs_queued_created_at', 'jobs', ['created_at'], unique=False,
+                    postgresql_where=sa.text("status = 'QUEUED'"))
+    op.create_index('ix_jobs_status_started_at', 'jobs', ['status', 'started_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_jobs_status_started_at', table_name='jobs')
+    op.drop_index('ix_jobs_queued_created_at', table_name='jobs', postgresql_where=sa.text("status = 'QUEUED'"))
+    op.drop_table('jobs')
+    sa.Enum(name='jobstatus').drop(op.get_bind(), checkfirst=True)
@@ -28,4 +28,47 @@ class Settings:
     SYNC_DATABASE_URL = _get("SYNC_DATABASE_URL")
     DB_ECHO = _get("DB_ECHO", "False").lower() == "true"
 
+    ACCESS_CACHE_TTL = float(_get("ACCESS_CACHE_TTL", "60"))
+
+    LOG_BATCH_SIZE = int(_get("LOG_BATCH_SIZE", "500"))
+    LOG_FLUSH_INTERVAL = float(_get("LOG_FLUSH_INTERVAL", "0.5"))
+    LOG_QUEUE_SIZE = int(_get("LOG_QUEUE_SIZE", "10000"))
+
+    PIPELINE_WORKERS = int(_get("PIPELINE_WORKERS", str(os.cpu_count() or 1)))
+    PIPELINE_MAX_PENDING = int(_get("PIPELINE_MAX_PENDING", "16"))
+    PIPELINE_MAX_BATCH = int(_get("PIPELINE_MAX_BATCH", "50"))
+    # Uncompressed limits for zip archives in batch uploads, checked before anything is inflated
+    PIPELINE_MAX_IMAGE_BYTES = int(_get("PIPELINE_MAX_IMAGE_BYTES", str(32 * 1024 * 1024)))
+    PIPELINE_MAX_BATCH_BYTES = int(_get("PIPELINE_MAX_BATCH_BYTES", str(256 * 1024 * 1024)))
+    PIPELINE_PNG_COMPRESSION = int(_get("PIPELINE_PNG_COMPRESSION", "1"))
+    PIPELINE_DENOISE = _get("PIPELINE_DENOISE", "nlm")
+    PIPELINE_TILE_MEMORY = int(_get("PIPELINE_TILE_MEMORY", str(64 * 1024 * 1024)))
+
+    # 1:1 decision, calibrated with the deployed nlm denoising on the benchmark's synthetic fingers:
+    # `python -m benchmarks.matching --fingers 150 --impressions 3 --seed 1000` gives FMR 1.03% and
+    # FNMR 12.2% over 100k impostor pairs; held out, 80 fingers with --seed 2000 give 0.88% and 14.2%.
+    # Recalibrate whenever PIPELINE_DENOISE or the template format changes
+    MATCH_THRESHOLD = float(_get("MATCH_THRESHOLD", "0.52"))
+    IDENTIFY_CANDIDATES = int(_get("IDENTIFY_CANDIDATES", "10"))
+    # 1:N decision: every enrolled user is another chance of a false match, so the best candidate
+    # must score higher than for 1:1 and lead the runner-up by a margin. With nlm, --identify 1000
+    # above lets 0.44% of 225 impostor probes through
+    IDENTIFY_THRESHOLD = float(_get("IDENTIFY_THRESHOLD", "0.65"))
+    IDENTIFY_MARGIN = float(_get("IDENTIFY_MARGIN", "0.05"))
+    FINGERPRINT_TEMPLATES_PATH = _get("FINGERPRINT_TEMPLATES_PATH", os.path.join(BASE_DIR, "fingerprint_templates.bin"))
+    FINGERPRINT_INDEX_PATH = _get("FINGERPRINT_INDEX_PATH", os.path.join(BASE_DIR, "fingerprint_index.npz"))
+
+    JOB_POLL_INTERVAL = float(_get("JOB_POLL_INTERVAL", "0.5"))
+    JOB_MAX_WAIT = float(_get("JOB_MAX_WAIT", "30"))
+    # Seconds a running job may go without a heartbeat from its worker
+    JOB_TIMEOUT = float(_get("JOB_TIMEOUT", "60"))
+    JOB_MAX_ATTEMPTS = int(_get("JOB_MAX_ATTEMPTS", "3"))
+    # Delay before a failed job is retried, doubled with every attempt
+    JOB_RETRY_DELAY = float(_get("JOB_RETRY_DELAY", "5"))
+    JOB_RETENTION = float(_get("JOB_RETENTION", str(24 * 3600)))
+
+    RESULT_CACHE_BYTES = int(_get("RESULT_CACHE_BYTES", str(64 * 1024 * 1024)))
+    RESULT_CACHE_DIR = _get("RESULT_CACHE_DIR")
+    RESULT_CACHE_DISK_BYTES = int(_get("RESULT_CACHE_DISK_BYTES", str(1024 * 1024 * 1024)))
+
 settings = Settings()
\ No newline at end of file
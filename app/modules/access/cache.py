@@ -0,0 +1,84 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import time as dtime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.modules.access.models import Access
+from app.modules.room.models import Room, RoomState
+from app.modules.users.models import User
+
+
+@dataclass(frozen=True)
+class AccessWindow:
+    from_hour: Optional[dtime]
+    to_hour: Optional[dtime]
+    all_time_access: bool
+
+
+class AccessDecisionCache:
+    """
+    Process-local snapshot of everything check-access needs: room states, user name -> id and
+    access windows. The snapshot is reloaded in one go after an invalidation (called by the
+    write handlers of the access, room and user routers) or once it is older than `ttl` seconds,
+    which bounds staleness when several worker processes serve the API.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._rooms: Dict[int, RoomState] = {}
+        self._users: Dict[str, int] = {}
+        self._access: Dict[Tuple[int, int], AccessWindow] = {}
+        self._loaded_at: Optional[float] = None
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self._generation += 1
+        self._loaded_at = None
+
+    def _is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def ensure_loaded(self, db: AsyncSession):
+        if self._is_fresh():
+            return
+
+        async with self._lock:
+            if self._is_fresh():
+                return
+
+            generation = self._generation
+            room_result = await db.execute(select(Room.id, Room.state))
+            user_result = await db.execute(select(User.id, User.name).order_by(User.id.desc()))
+            access_result = await db.execute(
+                select(Access.user_id, Access.room_id, Access.from_hour, Access.to_hour, Access.all_time_access)
+            )
+
+            self._rooms = {room_id: state for room_id, state in room_result.all()}
+            # Names are not unique; iterating by descending id keeps the oldest user for a name
+            self._users = {name: user_id for user_id, name in user_result.all()}
+            self._access = {
+                (user_id, room_id): AccessWindow(from_hour, to_hour, bool(all_time_access))
+                for user_id, room_id, from_hour, to_hour, all_time_access in access_result.all()
+            }
+
+            # An invalidation that raced the load means the snapshot may already be stale
+            if generation == self._generation:
+                self._loaded_at = time.monotonic()
+
+    def room_state(self, room_id: int) -> Optional[RoomState]:
+        return self._rooms.get(room_id)
+
+    def user_id(self, user_name: str) -> Optional[int]:
+        return self._users.get(user_name)
+
+    def window(self, user_id: int, room_id: int) -> Optional[AccessWindow]:
+        return self._access.get((user_id, room_id))
+
+
+access_cache = AccessDecisionCache(ttl=settings.ACCESS_CACHE_TTL)
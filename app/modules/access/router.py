@@ -1,13 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select
 from typing import List, Optional
 from datetime import time, datetime
 from app.core.database import get_db
+from app.modules.access.cache import access_cache
 from app.modules.access.models import Access
 from app.modules.users.models import User
 from app.modules.room.models import Room, RoomState
-from app.modules.log.models import Log
+from app.modules.log.writer import log_writer
+from app.modules.matching.constants import identified_user
+from app.modules.matching.router import identify_capture
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/access", tags=["access"])
@@ -57,6 +60,7 @@ async def upsert_access(access: AccessCreate, db: AsyncSession = Depends(get_db)
         db.add(user)
         await db.commit()
         await db.refresh(user)
+        access_cache.invalidate()
 
     # Check if room exists
     room_result = await db.execute(select(Room).where(Room.id == access.room_id))
@@ -83,6 +87,7 @@ async def upsert_access(access: AccessCreate, db: AsyncSession = Depends(get_db)
         existing_access.all_time_access = access.all_time_access
         await db.commit()
         await db.refresh(existing_access)
+        access_cache.invalidate()
 
         return AccessResponse(
             id=existing_access.id,
@@ -106,6 +111,7 @@ async def upsert_access(access: AccessCreate, db: AsyncSession = Depends(get_db)
         db.add(db_access)
         await db.commit()
         await db.refresh(db_access)
+        access_cache.invalidate()
 
         return AccessResponse(
             id=db_access.id,
@@ -199,6 +205,7 @@ async def update_user_access(user_id: int, access_update: AccessUpdate, db: Asyn
     access.all_time_access = access_update.all_time_access
     await db.commit()
     await db.refresh(access)
+    access_cache.invalidate()
 
     # Get user and room details for response
     user_result = await db.execute(select(User).where(User.id == user_id))
@@ -227,70 +234,73 @@ async def delete_user_access(user_id: int, db: AsyncSession = Depends(get_db)):
 
     await db.delete(access)
     await db.commit()
+    access_cache.invalidate()
     return {"message": "Access deleted successfully"}
 
 
 @router.get("/check-access/{user_name}/{room_id}", response_model=CanAccessResponse)
 async def check_can_access(user_name: str, room_id: int, db: AsyncSession = Depends(get_db)):
-    # Get the room to check if it's locked
-    room_result = await db.execute(select(Room).where(Room.id == room_id))
-    room = room_result.scalar_one_or_none()
-
-    if not room:
+    # Rooms, users and access windows come from the in-process snapshot, not from Postgres
+    await access_cache.ensure_loaded(db)
+    return await _check_access(access_cache.user_id(user_name), room_id)
+
+
+@router.post("/check-access-fingerprint/{room_id}", response_model=CanAccessResponse)
+async def check_can_access_by_fingerprint(room_id: int, file: UploadFile = File(...),
+                                          db: AsyncSession = Depends(get_db)):
+    """check-access for whoever is at the reader, identified from a fingerprint capture."""
+    await access_cache.ensure_loaded(db)
+    try:
+        candidates, _ = await identify_capture(file)
+    except HTTPException as e:
+        if e.status_code != 400:
+            raise
+        # An unreadable capture identifies nobody
+        candidates = []
+    return await _check_access(identified_user(candidates), room_id)
+
+
+async def _check_access(user_id: Optional[int], room_id: int) -> CanAccessResponse:
+    room_state = access_cache.room_state(room_id)
+
+    if room_state is None:
         return CanAccessResponse(
             can_access=False,
             message="Room not found",
         )
 
     # If room is locked, deny access completely
-    if room.state == RoomState.LOCKED:
-        # Get user for logging
-        user_result = await db.execute(select(User).where(User.name == user_name))
-        user = user_result.scalar_one_or_none()
-
-        if user:
+    if room_state == RoomState.LOCKED:
+        if user_id is not None:
             # Log declined access
-            log_entry = Log(
+            await log_writer.submit(
                 datetime=datetime.now(),
-                user_id=user.id,
+                user_id=user_id,
                 room_id=room_id,
                 access_type="declined"
             )
-            db.add(log_entry)
-            await db.commit()
 
         return CanAccessResponse(
             can_access=False,
             message="Room is locked",
         )
 
-    # Get user by name first
-    user_result = await db.execute(select(User).where(User.name == user_name))
-    user = user_result.scalar_one_or_none()
-
-    if not user:
+    if user_id is None:
         return CanAccessResponse(
             can_access=False,
             message="User not found",
         )
 
     # Room is unlocked, now check user access permissions
-    access_result = await db.execute(
-        select(Access).where(
-            and_(Access.user_id == user.id, Access.room_id == room_id)
-        )
-    )
-    access = access_result.scalar_one_or_none()
+    access = access_cache.window(user_id, room_id)
 
     if not access:
-        log_entry = Log(
+        await log_writer.submit(
             datetime=datetime.now(),
-            user_id=user.id,
+            user_id=user_id,
             room_id=room_id,
             access_type="declined"
         )
-        db.add(log_entry)
-        await db.commit()
 
         return CanAccessResponse(
             can_access=False,
@@ -300,14 +310,12 @@ async def check_can_access(user_name: str, room_id: int, db: AsyncSession = Depe
     # If user has all_time_access, they can access when room is unlocked
     if access.all_time_access:
         # Log granted access
-        log_entry = Log(
+        await log_writer.submit(
             datetime=datetime.now(),
-            user_id=user.id,
+            user_id=user_id,
             room_id=room_id,
             access_type="granted"
         )
-        db.add(log_entry)
-        await db.commit()
 
         return CanAccessResponse(
             can_access=True,
@@ -317,14 +325,12 @@ async def check_can_access(user_name: str, room_id: int, db: AsyncSession = Depe
     # Check time-based access
     if access.from_hour is None or access.to_hour is None:
         # Log declined access
-        log_entry = Log(
+        await log_writer.submit(
             datetime=datetime.now(),
-            user_id=user.id,
+            user_id=user_id,
             room_id=room_id,
             access_type="declined"
         )
-        db.add(log_entry)
-        await db.commit()
 
         return CanAccessResponse(
             can_access=False,
@@ -344,14 +350,12 @@ async def check_can_access(user_name: str, room_id: int, db: AsyncSession = Depe
 
     # Log the access attempt
     access_type = "granted" if can_access else "declined"
-    log_entry = Log(
+    await log_writer.submit(
         datetime=datetime.now(),
-        user_id=user.id,
+        user_id=user_id,
         room_id=room_id,
         access_type=access_type
     )
-    db.add(log_entry)
-    await db.commit()
 
     if can_access:
         return CanAccessResponse(
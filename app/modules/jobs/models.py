@@ -0,0 +1,49 @@
+from sqlalchemy import Column, Integer, String, Enum, DateTime, Index, JSON, LargeBinary, func, text
+from sqlalchemy.dialects.postgresql import UUID
+import enum
+import uuid
+from app.core.database import Base
+
+
+class JobStatus(enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+# Written out rather than bound, so the planner matches it with the partial index even in a generic plan
+IS_QUEUED = text("status = 'QUEUED'")
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Workers only ever look for the oldest queued job; finished jobs stay out of this index
+        Index("ix_jobs_queued_created_at", "created_at", postgresql_where=IS_QUEUED),
+        Index("ix_jobs_status_heartbeat_at", "status", "heartbeat_at"),
+    )
+
+    # Random ids: results are only readable by whoever submitted the job and knows its id
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    kind = Column(String, nullable=False)
+    params = Column(JSON, nullable=False)
+    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.QUEUED)
+    attempts = Column(Integer, nullable=False, default=0)
+    # Claims lost to a crashed pipeline process; they do not count as attempts
+    crashes = Column(Integer, nullable=False, default=0, server_default="0")
+    worker = Column(String, nullable=True)
+    # The upload; cleared once the job is finished
+    input = Column(LargeBinary, nullable=True)
+    result = Column(LargeBinary, nullable=True)
+    result_headers = Column(JSON, nullable=True)
+    timings = Column(JSON, nullable=True)
+    error = Column(String, nullable=True)
+    # Database time, so stale jobs are detected the same way from every node
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    # Not claimed before then: retries back off
+    available_at = Column(DateTime, nullable=False, server_default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    # Touched by the worker while the job runs; a running job without one for `timeout` is stale
+    heartbeat_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
@@ -0,0 +1,156 @@
+import asyncio
+import uuid
+from datetime import timedelta
+from typing import List
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.modules.jobs.models import IS_QUEUED, Job, JobStatus
+
+FINISHED = (JobStatus.DONE, JobStatus.FAILED)
+
+# Everything but the upload and the result, which can be megabytes
+_STATUS_COLUMNS = (
+    Job.id, Job.kind, Job.params, Job.status, Job.attempts, Job.error, Job.timings,
+    Job.created_at, Job.started_at, Job.finished_at,
+)
+
+
+class JobQueue:
+    """
+    Durable queue of pipeline jobs in the `jobs` table. The API submits jobs and polls their status;
+    any number of worker processes (worker.py), on any number of machines, claim them with
+    SELECT ... FOR UPDATE SKIP LOCKED, so two workers never claim the same job and never wait on
+    each other's locks. Workers send a heartbeat while a job runs; a job without one for `timeout`
+    seconds (its worker died) is queued again, up to `max_attempts` claims. A failed job is retried
+    after `retry_delay` seconds, doubled with every attempt, and claims lost to a crashed pipeline
+    process are handed back without counting (up to `max_attempts` crashes). Finished jobs are
+    deleted after `retention` seconds.
+    """
+
+    def __init__(self, poll_interval: float, timeout: float, max_attempts: int, retry_delay: float,
+                 retention: float):
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.retention = retention
+
+    async def submit(self, db: AsyncSession, kind: str, jobs: List[tuple]) -> List[uuid.UUID]:
+        """Queue one job per (params, upload) pair, in one transaction; returns their ids in order."""
+        rows = [{"id": uuid.uuid4(), "kind": kind, "params": params, "input": contents} for params, contents in jobs]
+        await db.execute(insert(Job), rows)
+        await db.commit()
+        return [row["id"] for row in rows]
+
+    async def status(self, db: AsyncSession, job_id: uuid.UUID):
+        result = await db.execute(select(*_STATUS_COLUMNS).where(Job.id == job_id))
+        return result.one_or_none()
+
+    async def wait(self, job_id: uuid.UUID, timeout: float):
+        """Status of a job, polled until it is finished or `timeout` seconds have passed. Every poll
+        uses its own session, so a waiting client holds no pooled connection while it sleeps."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            async with AsyncSessionLocal() as db:
+                job = await self.status(db, job_id)
+            remaining = deadline - loop.time()
+            if job is None or job.status in FINISHED or remaining <= 0:
+                return job
+            await asyncio.sleep(min(self.poll_interval, remaining))
+
+    async def result(self, db: AsyncSession, job_id: uuid.UUID):
+        result = await db.execute(
+            select(Job.status, Job.error, Job.result, Job.result_headers, Job.timings).where(Job.id == job_id)
+        )
+        return result.one_or_none()
+
+    async def claim(self, db: AsyncSession, worker: str):
+        """Mark the oldest queued job as run by `worker` and return it, or None when the queue is empty.
+        The claim is committed at once: the row lock is only held for this statement."""
+        oldest = (
+            select(Job.id)
+            .where(IS_QUEUED, Job.available_at <= func.now())
+            .order_by(Job.created_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        result = await db.execute(
+            update(Job)
+            .where(Job.id == oldest)
+            .values(status=JobStatus.RUNNING, attempts=Job.attempts + 1, worker=worker, started_at=func.now(),
+                    heartbeat_at=func.now())
+            .returning(Job.id, Job.kind, Job.params, Job.input, Job.attempts, Job.crashes)
+        )
+        job = result.one_or_none()
+        await db.commit()
+        return job
+
+    async def _finish(self, db: AsyncSession, job_id: uuid.UUID, owner: str, **values) -> bool:
+        # Only while the job is still ours: after a timeout it may have been handed to another worker
+        result = await db.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.worker == owner, Job.status == JobStatus.RUNNING)
+            .values(**values)
+        )
+        await db.commit()
+        return result.rowcount == 1
+
+    async def heartbeat(self, db: AsyncSession, job_id: uuid.UUID, worker: str) -> bool:
+        """Mark a running job as still being worked on; False once it is no longer ours."""
+        return await self._finish(db, job_id, worker, heartbeat_at=func.now())
+
+    async def complete(self, db: AsyncSession, job_id: uuid.UUID, worker: str, body: bytes, headers: dict,
+                       timings: dict) -> bool:
+        return await self._finish(db, job_id, worker, status=JobStatus.DONE, result=body, result_headers=headers,
+                                  timings=timings, error=None, input=None, finished_at=func.now())
+
+    async def fail(self, db: AsyncSession, job, worker: str, error: str, retry: bool, crashed: bool = False) -> bool:
+        """Record the failure of a claimed `job`; it is queued again, after a delay, when `retry` and
+        it has claims left. When the pipeline process `crashed` the claim is handed back instead:
+        every job running on the pool fails with it, not only the one that brought it down."""
+        if crashed and job.crashes < self.max_attempts:
+            return await self._requeue(db, job, worker, error, self.retry_delay,
+                                       attempts=Job.attempts - 1, crashes=Job.crashes + 1)
+        if retry and job.attempts < self.max_attempts:
+            return await self._requeue(db, job, worker, error, self.retry_delay * 2 ** (job.attempts - 1))
+        return await self._finish(db, job.id, worker, status=JobStatus.FAILED, error=error, input=None,
+                                  finished_at=func.now())
+
+    async def _requeue(self, db: AsyncSession, job, worker: str, error: str, delay: float, **values) -> bool:
+        return await self._finish(db, job.id, worker, status=JobStatus.QUEUED, error=error, worker=None,
+                                  started_at=None, heartbeat_at=None,
+                                  available_at=func.now() + timedelta(seconds=delay), **values)
+
+    async def recover(self, db: AsyncSession) -> tuple[int, int, int]:
+        """Queue again the jobs whose worker stopped answering, fail those out of claims, and delete
+        finished jobs past retention; returns how many of each."""
+        stale = (Job.status == JobStatus.RUNNING) & (Job.heartbeat_at < func.now() - timedelta(seconds=self.timeout))
+        requeued = await db.execute(
+            update(Job).where(stale, Job.attempts < self.max_attempts)
+            .values(status=JobStatus.QUEUED, worker=None, started_at=None, heartbeat_at=None,
+                    available_at=func.now(), error="Worker timed out")
+        )
+        failed = await db.execute(
+            update(Job).where(stale)
+            .values(status=JobStatus.FAILED, input=None, finished_at=func.now(), error="Worker timed out")
+        )
+        purged = await db.execute(
+            delete(Job).where(Job.status.in_(FINISHED), Job.finished_at < func.now() - timedelta(seconds=self.retention))
+        )
+        await db.commit()
+        return requeued.rowcount, failed.rowcount, purged.rowcount
+
+
+job_queue = JobQueue(
+    poll_interval=settings.JOB_POLL_INTERVAL,
+    timeout=settings.JOB_TIMEOUT,
+    max_attempts=settings.JOB_MAX_ATTEMPTS,
+    retry_delay=settings.JOB_RETRY_DELAY,
+    retention=settings.JOB_RETENTION,
+)
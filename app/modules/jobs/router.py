@@ -0,0 +1,119 @@
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from fastapi.responses import Response
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import get_db
+from app.modules.jobs.models import JobStatus
+from app.modules.jobs.queue import job_queue
+from app.modules.normalize_phone.constants import OUTPUT_MEDIA_TYPES
+from app.modules.normalize_phone.router import batch_uploads, parse_stages, server_timing
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+# Job results are fetched as raw bodies; the base64 JSON form only exists for the synchronous endpoint
+JOB_MEDIA_TYPES = tuple(media_type for media_type in OUTPUT_MEDIA_TYPES if media_type != "application/json")
+
+
+class SubmittedJob(BaseModel):
+    job_id: uuid.UUID
+    filename: Optional[str]
+
+
+class SubmitResponse(BaseModel):
+    jobs: List[SubmittedJob]
+
+
+class JobResponse(BaseModel):
+    job_id: uuid.UUID
+    kind: str
+    filename: Optional[str]
+    status: str
+    attempts: int
+    error: Optional[str]
+    timings: Optional[Dict[str, float]]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+    result_url: Optional[str]
+
+
+def _job_response(job) -> JobResponse:
+    return JobResponse(
+        job_id=job.id,
+        kind=job.kind,
+        filename=job.params.get("filename"),
+        status=job.status.value,
+        attempts=job.attempts,
+        error=job.error,
+        timings=job.timings,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        result_url=router.url_path_for("get_job_result", job_id=job.id) if job.status == JobStatus.DONE else None,
+    )
+
+
+async def _submit(db: AsyncSession, kind: str, files: List[UploadFile], params: dict) -> SubmitResponse:
+    images = batch_uploads([(file.filename, await file.read()) for file in files])
+    if not images:
+        raise HTTPException(status_code=400, detail="No images in upload")
+    if len(images) > settings.PIPELINE_MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {settings.PIPELINE_MAX_BATCH} images per request")
+    job_ids = await job_queue.submit(db, kind, [({**params, "filename": name}, contents) for name, contents in images])
+    return SubmitResponse(jobs=[SubmittedJob(job_id=job_id, filename=name) for job_id, (name, _) in zip(job_ids, images)])
+
+
+@router.post("/enhance", response_model=SubmitResponse, status_code=202)
+async def submit_enhance(
+    files: List[UploadFile] = File(...),
+    media_type: str = Query("image/png", description=f"One of {', '.join(JOB_MEDIA_TYPES)}"),
+    stages: str = "skeleton",
+    compression: int = Query(settings.PIPELINE_PNG_COMPRESSION, ge=0, le=9),
+    db: AsyncSession = Depends(get_db),
+):
+    """Queue one enhancement job per capture (zip archives are expanded), like /normalize-phone/enhance_phone
+    but answered right away: poll GET /jobs/{job_id}, then fetch GET /jobs/{job_id}/result."""
+    if media_type not in JOB_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Supported types: {', '.join(JOB_MEDIA_TYPES)}")
+    requested = parse_stages(stages, media_type)
+    return await _submit(db, "enhance", files,
+                         {"media_type": media_type, "stages": list(requested), "compression": compression})
+
+
+@router.post("/templates", response_model=SubmitResponse, status_code=202)
+async def submit_templates(files: List[UploadFile] = File(...), db: AsyncSession = Depends(get_db)):
+    """Queue one template job per capture, for batch enrollment: each result is a template to post to
+    /users/{user_id}/fingerprints, which then skips the enhancement."""
+    return await _submit(db, "template", files, {})
+
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(job_id: uuid.UUID, wait: float = Query(0, ge=0, le=settings.JOB_MAX_WAIT)):
+    """Status of a job. With `wait`, long-polls: answers as soon as the job is finished, or after
+    `wait` seconds with its current status."""
+    job = await job_queue.wait(job_id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_response(job)
+
+
+@router.get("/{job_id}/result")
+async def get_job_result(job_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
+    job = await job_queue.result(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status == JobStatus.FAILED:
+        raise HTTPException(status_code=422, detail=job.error)
+    if job.status != JobStatus.DONE:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status.value}")
+
+    headers = dict(job.result_headers)
+    content_type = headers.pop("Content-Type")
+    headers["Server-Timing"] = server_timing(job.timings)
+    return Response(job.result, media_type=content_type, headers=headers)
@@ -0,0 +1,152 @@
+"""
+Standalone worker for the job queue (see queue.py). Run as many as needed, on as many machines as
+can reach the database:
+
+    python -m app.modules.jobs.worker --concurrency 4
+
+Each of `concurrency` loops claims the oldest queued job, runs it on this worker's own pipeline
+process pool and stores the result, then claims the next one right away; a loop only sleeps while
+the queue is empty. A running job gets a heartbeat a few times per JOB_TIMEOUT, so however long it
+takes it is not mistaken for the job of a dead worker. If a pipeline process crashes, the pool is
+replaced and the jobs it was running are handed back to the queue. SIGTERM or Ctrl-C stops claiming
+and lets the running jobs finish.
+
+Run workers with the same pipeline settings (PIPELINE_DENOISE) as the API: template jobs are stored
+by the API as templates of its own version. Their results carry the worker's in X-Template-Version.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.modules.jobs.queue import JobQueue, job_queue
+from app.modules.matching.constants import template_version
+from app.modules.normalize_phone.executor import InvalidUploadError, PipelineCrashedError, PipelineExecutor
+
+logger = logging.getLogger(__name__)
+
+# Pipeline entry points by job kind; only the pool's processes import them
+ENHANCE_UPLOAD_AS = "app.modules.normalize_phone.pipeline:enhance_phone_upload_as"
+ENROLL_UPLOAD = "app.modules.matching.matcher:enroll_upload"
+
+
+async def run_job(executor: PipelineExecutor, kind: str, params: dict, contents: bytes) -> tuple[bytes, dict, dict]:
+    """Response body, headers and per-stage timings of one job."""
+    if kind == "enhance":
+        return await executor.run(ENHANCE_UPLOAD_AS, contents, params["media_type"], tuple(params["stages"]),
+                                  params["compression"])
+    if kind == "template":
+        template, timings = await executor.run(ENROLL_UPLOAD, contents)
+        headers = {"Content-Type": "application/octet-stream", "X-Template-Version": template_version()}
+        return template, headers, timings
+    raise ValueError(f"Unknown job kind {kind!r}")
+
+
+async def heartbeat(queue: JobQueue, job_id, name: str):
+    """Keep a running job claimed until cancelled."""
+    while True:
+        await asyncio.sleep(queue.timeout / 4)
+        try:
+            async with AsyncSessionLocal() as db:
+                if not await queue.heartbeat(db, job_id, name):
+                    logger.warning("Job %s was handed to another worker while %s ran it", job_id, name)
+                    return
+        except Exception:
+            logger.exception("Could not send the heartbeat of job %s", job_id)
+
+
+async def work(queue: JobQueue, executor: PipelineExecutor, name: str, stopping: asyncio.Event):
+    while not stopping.is_set():
+        try:
+            async with AsyncSessionLocal() as db:
+                job = await queue.claim(db, name)
+        except Exception:
+            logger.exception("Could not claim a job")
+            job = None
+        if job is None:
+            try:
+                await asyncio.wait_for(stopping.wait(), queue.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        beating = asyncio.create_task(heartbeat(queue, job.id, name))
+        try:
+            body, headers, timings = await run_job(executor, job.kind, job.params, job.input)
+        except InvalidUploadError as e:
+            # Not a decodable capture: retrying will not help
+            outcome = dict(error=str(e), retry=False)
+        except PipelineCrashedError as e:
+            # The executor has replaced the pool already; the job may not be what brought it down
+            logger.warning("Pipeline process crashed while running job %s", job.id)
+            outcome = dict(error=str(e), retry=True, crashed=True)
+        except Exception as e:
+            logger.exception("Job %s failed on attempt %d", job.id, job.attempts)
+            outcome = dict(error=f"Error processing image: {str(e)}", retry=True)
+        else:
+            outcome = None
+        finally:
+            beating.cancel()
+
+        try:
+            async with AsyncSessionLocal() as db:
+                if outcome is None:
+                    stored = await queue.complete(db, job.id, name, body, headers, timings)
+                else:
+                    stored = await queue.fail(db, job, name, **outcome)
+            if not stored:
+                logger.warning("Job %s was handed to another worker before %s finished it", job.id, name)
+        except Exception:
+            # The job stays claimed by us; `recover` queues it again after the timeout
+            logger.exception("Could not store the outcome of job %s", job.id)
+
+
+async def recover(queue: JobQueue, stopping: asyncio.Event):
+    """Requeue jobs of dead workers and purge old ones, a few times per timeout."""
+    interval = max(queue.timeout / 4, queue.poll_interval)
+    while not stopping.is_set():
+        try:
+            async with AsyncSessionLocal() as db:
+                requeued, failed, purged = await queue.recover(db)
+            if requeued or failed:
+                logger.warning("Requeued %d and failed %d jobs of unresponsive workers", requeued, failed)
+            if purged:
+                logger.info("Deleted %d finished jobs", purged)
+        except Exception:
+            logger.exception("Could not recover stale jobs")
+        try:
+            await asyncio.wait_for(stopping.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def main(concurrency: int):
+    executor = PipelineExecutor(workers=concurrency, max_pending=concurrency)
+    executor.start()
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    logger.info("Worker %s processing jobs with %d pipeline processes", prefix, concurrency)
+    try:
+        await asyncio.gather(
+            recover(job_queue, stopping),
+            *(work(job_queue, executor, f"{prefix}:{i}", stopping) for i in range(concurrency)),
+        )
+    finally:
+        executor.shutdown()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Process queued enhancement jobs")
+    ap.add_argument("--concurrency", type=int, default=settings.PIPELINE_WORKERS,
+                    help="Jobs run at once, each in its own pipeline process")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    asyncio.run(main(args.concurrency))
@@ -1,10 +1,15 @@
-from sqlalchemy import Column, Integer, ForeignKey, DateTime, String
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, String, Index
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 
 
 class Log(Base):
     __tablename__ = "logs"
+    __table_args__ = (
+        Index("ix_logs_datetime_id", "datetime", "id"),
+        Index("ix_logs_room_id_datetime_id", "room_id", "datetime", "id"),
+        Index("ix_logs_user_id_datetime_id", "user_id", "datetime", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     datetime = Column(DateTime, nullable=False)
@@ -1,10 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+import base64
+import csv
+import io
+import json
+import zlib
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, tuple_
 from sqlalchemy.orm import selectinload
-from typing import List
+from typing import List, Literal, Optional, Tuple
 from datetime import datetime
-from app.core.database import get_db
+from app.core.database import AsyncSessionLocal, get_db
 from app.modules.log.models import Log
 from app.modules.users.models import User
 from app.modules.room.models import Room
@@ -68,90 +74,206 @@ async def create_log(log: LogCreate, db: AsyncSession = Depends(get_db)):
     return db_log
 
 
-@router.get("/", response_model=List[LogDetailResponse])
-async def get_all_logs(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(
-        select(Log, User.name.label("user_name"), Room.name.label("room_name"))
+class LogPage(BaseModel):
+    items: List[LogDetailResponse]
+    next_cursor: Optional[str] = None
+
+
+class LogFilters:
+    """Query-string filters shared by the log listing endpoints."""
+
+    def __init__(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        user_id: Optional[int] = None,
+        room_id: Optional[int] = None,
+        access_type: Optional[str] = None,
+    ):
+        self.since = since
+        self.until = until
+        self.user_id = user_id
+        self.room_id = room_id
+        self.access_type = access_type
+
+    def apply(self, query):
+        if self.since is not None:
+            query = query.where(Log.datetime >= self.since)
+        if self.until is not None:
+            query = query.where(Log.datetime < self.until)
+        if self.user_id is not None:
+            query = query.where(Log.user_id == self.user_id)
+        if self.room_id is not None:
+            query = query.where(Log.room_id == self.room_id)
+        if self.access_type is not None:
+            query = query.where(Log.access_type == self.access_type)
+        return query
+
+
+class RoomLogFilters(LogFilters):
+    """LogFilters of the per-room endpoints, without `room_id`: the room comes from the path."""
+
+    def __init__(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        user_id: Optional[int] = None,
+        access_type: Optional[str] = None,
+    ):
+        super().__init__(since=since, until=until, user_id=user_id, access_type=access_type)
+
+
+def encode_cursor(log_datetime: datetime, log_id: int) -> str:
+    raw = f"{log_datetime.isoformat()}|{log_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        log_datetime, log_id = raw.split("|")
+        return datetime.fromisoformat(log_datetime), int(log_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def log_detail_query(filters: LogFilters):
+    query = (
+        select(
+            Log.id,
+            Log.datetime,
+            Log.user_id,
+            User.name.label("user_name"),
+            Log.room_id,
+            Room.name.label("room_name"),
+            Log.access_type,
+        )
         .join(User, Log.user_id == User.id)
         .join(Room, Log.room_id == Room.id)
-        .order_by(Log.datetime.desc())
     )
+    return filters.apply(query)
+
+
+async def get_log_page(db: AsyncSession, filters: LogFilters, cursor: Optional[str], limit: int) -> LogPage:
+    # Newest first, keyed on (datetime, id) so each page is a range scan on the composite indexes
+    query = log_detail_query(filters)
+    if cursor is not None:
+        query = query.where(tuple_(Log.datetime, Log.id) < tuple_(*decode_cursor(cursor)))
+    query = query.order_by(Log.datetime.desc(), Log.id.desc()).limit(limit + 1)
+
+    rows = (await db.execute(query)).all()
+    items = [LogDetailResponse(**row._mapping) for row in rows[:limit]]
 
-    logs = []
-    for log, user_name, room_name in result.all():
-        logs.append(LogDetailResponse(
-            id=log.id,
-            datetime=log.datetime,
-            user_id=log.user_id,
-            user_name=user_name,
-            room_id=log.room_id,
-            room_name=room_name,
-            access_type=log.access_type
-        ))
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(items[-1].datetime, items[-1].id)
 
-    return logs
+    return LogPage(items=items, next_cursor=next_cursor)
 
 
-@router.get("/room/{room_id}", response_model=List[LogDetailResponse])
-async def get_logs_by_room_id(room_id: int, db: AsyncSession = Depends(get_db)):
+@router.get("/", response_model=LogPage)
+async def get_all_logs(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    filters: LogFilters = Depends(),
+    db: AsyncSession = Depends(get_db),
+):
+    return await get_log_page(db, filters, cursor, limit)
+
+
+@router.get("/room/{room_id}", response_model=LogPage)
+async def get_logs_by_room_id(
+    room_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    filters: RoomLogFilters = Depends(),
+    db: AsyncSession = Depends(get_db),
+):
     # Check if room exists
     room_result = await db.execute(select(Room).where(Room.id == room_id))
     room = room_result.scalar_one_or_none()
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
 
-    result = await db.execute(
-        select(Log, User.name.label("user_name"), Room.name.label("room_name"))
-        .join(User, Log.user_id == User.id)
-        .join(Room, Log.room_id == Room.id)
-        .where(Log.room_id == room_id)
-        .order_by(Log.datetime.desc())
-    )
-
-    logs = []
-    for log, user_name, room_name in result.all():
-        logs.append(LogDetailResponse(
-            id=log.id,
-            datetime=log.datetime,
-            user_id=log.user_id,
-            user_name=user_name,
-            room_id=log.room_id,
-            room_name=room_name,
-            access_type=log.access_type
-        ))
-
-    return logs
+    filters.room_id = room.id
+    return await get_log_page(db, filters, cursor, limit)
 
 
-@router.get("/room/name/{room_name}", response_model=List[LogDetailResponse])
-async def get_logs_by_room_name(room_name: str, db: AsyncSession = Depends(get_db)):
+@router.get("/room/name/{room_name}", response_model=LogPage)
+async def get_logs_by_room_name(
+    room_name: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    filters: RoomLogFilters = Depends(),
+    db: AsyncSession = Depends(get_db),
+):
     # Check if room exists
     room_result = await db.execute(select(Room).where(Room.name == room_name))
     room = room_result.scalar_one_or_none()
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
 
-    result = await db.execute(
-        select(Log, User.name.label("user_name"), Room.name.label("room_name"))
-        .join(User, Log.user_id == User.id)
-        .join(Room, Log.room_id == Room.id)
-        .where(Room.name == room_name)
-        .order_by(Log.datetime.desc())
+    filters.room_id = room.id
+    return await get_log_page(db, filters, cursor, limit)
+
+
+EXPORT_COLUMNS = ["id", "datetime", "user_id", "user_name", "room_id", "room_name", "access_type"]
+
+
+def _export_ndjson(rows) -> str:
+    return "".join(
+        json.dumps({**row._mapping, "datetime": row.datetime.isoformat()}) + "\n" for row in rows
     )
 
-    logs = []
-    for log, user_name, room_name in result.all():
-        logs.append(LogDetailResponse(
-            id=log.id,
-            datetime=log.datetime,
-            user_id=log.user_id,
-            user_name=user_name,
-            room_id=log.room_id,
-            room_name=room_name,
-            access_type=log.access_type
-        ))
-
-    return logs
+
+def _export_csv(rows) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(
+        (row.id, row.datetime.isoformat(), row.user_id, row.user_name, row.room_id, row.room_name, row.access_type)
+        for row in rows
+    )
+    return buffer.getvalue()
+
+
+async def _export_chunks(filters: LogFilters, export_format: str, compress: bool, batch_size: int = 1000):
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def encode(text: str) -> bytes:
+        data = text.encode()
+        if compressor is None:
+            return data
+        # Sync-flush so every batch reaches the client as soon as it is produced
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    if export_format == "csv":
+        yield encode(",".join(EXPORT_COLUMNS) + "\r\n")
+
+    serialize = _export_csv if export_format == "csv" else _export_ndjson
+    query = log_detail_query(filters).order_by(Log.datetime.desc(), Log.id.desc())
+
+    # The request-scoped session is closed before a streaming body finishes, so use our own
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(query.execution_options(yield_per=batch_size))
+        async for rows in result.partitions():
+            yield encode(serialize(rows))
+
+    if compressor is not None:
+        yield compressor.flush()
+
+
+@router.get("/export")
+async def export_logs(
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    compress: bool = Query(False, alias="gzip"),
+    filters: LogFilters = Depends(),
+):
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="logs.{export_format}"'}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+
+    return StreamingResponse(_export_chunks(filters, export_format, compress), media_type=media_type, headers=headers)
 
 
 @router.get("/{log_id}", response_model=LogDetailResponse)
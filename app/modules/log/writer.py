@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from typing import List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.modules.log.models import Log
+
+logger = logging.getLogger(__name__)
+
+
+class LogWriter:
+    """
+    Background sink for access log rows. Request handlers enqueue rows and return immediately;
+    a single flusher task writes them as multi-row INSERTs, one transaction per batch. A batch is
+    flushed once it holds `batch_size` rows or `flush_interval` seconds after its first row,
+    whichever comes first. The queue is bounded, so a stalled database slows producers down
+    instead of growing memory without limit.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, max_queue: int, max_retries: int = 3):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is not None and self._task.done():
+            # The flusher died; start a new one on the same queue so queued rows are not lost and
+            # producers do not block forever on a full queue
+            if not self._task.cancelled() and self._task.exception() is not None:
+                logger.error("Access log flusher stopped, restarting it", exc_info=self._task.exception())
+            self._task = None
+        if self._task is None:
+            if self._queue is None:
+                self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything queued so far and stop the flusher."""
+        if self._task is None:
+            return
+        self.start()
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        self._queue = None
+
+    async def submit(self, **values):
+        """Queue one `Log` row. Waits only while the queue is full."""
+        self.start()
+        await self._queue.put(values)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            row = await self._queue.get()
+            if row is None:
+                break
+
+            batch = [row]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[dict]):
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                async with AsyncSessionLocal() as session:
+                    await session.execute(insert(Log).values(batch))
+                    await session.commit()
+                return
+            except IntegrityError:
+                # A bad row (e.g. for a user deleted while the access cache was stale) fails the whole
+                # INSERT; retrying cannot help, so write the rows one by one and drop only the bad ones
+                if len(batch) == 1:
+                    logger.warning("Dropping access log row %s: it violates a constraint", batch[0])
+                    return
+                for row in batch:
+                    await self._flush([row])
+                return
+            except Exception:
+                if attempt == self.max_retries:
+                    logger.exception("Dropping %d access log rows after %d failed attempts", len(batch), attempt)
+                    return
+                await asyncio.sleep(0.1 * 2 ** attempt)
+
+
+log_writer = LogWriter(
+    batch_size=settings.LOG_BATCH_SIZE,
+    flush_interval=settings.LOG_FLUSH_INTERVAL,
+    max_queue=settings.LOG_QUEUE_SIZE,
+)
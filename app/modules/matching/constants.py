@@ -0,0 +1,29 @@
+# Kept free of heavy imports: the API process reads these without loading NumPy
+from app.core.config import settings
+from app.modules.normalize_phone.constants import PIPELINE_VERSION
+
+# Bump whenever a change to template.py or to the minutiae stage alters the templates built
+TEMPLATE_FORMAT_VERSION = 1
+
+# ANSI/NIST finger positions: 0 unknown, 1-5 right thumb to little finger, 6-10 left
+FINGER_POSITIONS = range(11)
+
+
+def template_version() -> str:
+    """Stored templates are only compared with templates built the same way: the pipeline, the
+    template format and the denoise mode all change the minutiae found."""
+    return f"{PIPELINE_VERSION}.{TEMPLATE_FORMAT_VERSION}.{settings.PIPELINE_DENOISE}"
+
+
+def identified_user(candidates, threshold: float | None = None, margin: float | None = None):
+    """The user a 1:N search identified, from its (user id, score) candidates, best first, or None.
+    The best candidate must reach the identification threshold, which is stricter than the 1:1
+    MATCH_THRESHOLD because every enrolled user is another chance of a false match, and must beat
+    the runner-up by `margin`, so two similar users never get resolved by noise."""
+    threshold = settings.IDENTIFY_THRESHOLD if threshold is None else threshold
+    margin = settings.IDENTIFY_MARGIN if margin is None else margin
+    if not candidates or candidates[0][1] < threshold:
+        return None
+    if len(candidates) > 1 and candidates[0][1] - candidates[1][1] < margin:
+        return None
+    return candidates[0][0]
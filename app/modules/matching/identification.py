@@ -0,0 +1,117 @@
+import asyncio
+import importlib
+import logging
+from typing import List, Optional, Tuple
+
+from app.core.config import settings
+from app.modules.matching.store import FingerprintTemplateStore, fingerprint_templates
+
+logger = logging.getLogger(__name__)
+
+
+class IndexNotReadyError(Exception):
+    """Raised by `identify` while the index is still being loaded at startup."""
+
+
+class FingerprintIdentifier:
+    """
+    Process-wide 1:N identification index (see index.py) over the template file of `store`, built in
+    the background at startup when there are templates and otherwise on first use, so the API
+    process only loads NumPy once fingerprints are enrolled or identified. Until the startup build is
+    done, `identify` fails fast with `IndexNotReadyError` rather than holding requests. Its hash
+    tables are reloaded from the snapshot at `snapshot_path` while the file is unchanged, and
+    snapshotted again after a rebuild. The index holds views of the mapped file rather than copies.
+    Lookups and updates run in a thread; the enroll and delete handlers keep the index in step with
+    the database. Like the access cache the index is process-local: changes made through another
+    API process show up after a restart.
+    """
+
+    def __init__(self, store: FingerprintTemplateStore, candidates: int, snapshot_path: Optional[str]):
+        self.store = store
+        self.candidates = candidates
+        self.snapshot_path = snapshot_path
+        self._index = None
+        self._load_lock = asyncio.Lock()
+        self._start_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Bring the store's template file up to date and build the index from it in the background,
+        so the API serves requests (door checks by name above all) meanwhile."""
+        if self._start_task is None:
+            self._start_task = asyncio.create_task(self._start())
+
+    async def _start(self):
+        await self.store.start()
+        template_file = self.store.file()
+        if template_file is None or not len(template_file):
+            return
+        try:
+            await self.index()
+        except Exception:
+            logger.exception("Could not build the fingerprint identification index")
+
+    @property
+    def ready(self) -> bool:
+        return self._start_task is None or self._start_task.done()
+
+    async def stop(self):
+        if self._start_task is not None:
+            self._start_task.cancel()
+            try:
+                await self._start_task
+            except asyncio.CancelledError:
+                pass
+            self._start_task = None
+
+    def _build(self, template_file):
+        module = importlib.import_module("app.modules.matching.index")
+        if template_file is None:
+            return module.IdentificationIndex()
+        templates = [(user_id, template) for user_id, _, template in template_file]
+        if self.snapshot_path:
+            index = module.IdentificationIndex.load(self.snapshot_path, template_file.stamp, templates)
+            if index is not None:
+                return index
+        index = module.IdentificationIndex()
+        index.add_many(templates)
+        if self.snapshot_path:
+            try:
+                index.save(self.snapshot_path, template_file.stamp)
+            except OSError:
+                logger.exception("Could not snapshot the fingerprint index to %s", self.snapshot_path)
+        return index
+
+    async def index(self):
+        if self._index is None:
+            async with self._load_lock:
+                if self._index is None:
+                    template_file = await self.store.refreshed()
+                    self._index = await asyncio.to_thread(self._build, template_file)
+        return self._index
+
+    async def update(self, user_id: int, templates: List[bytes]):
+        """Make `templates` (packed) the ones `user_id` is identified by."""
+        index = await self.index()
+        await asyncio.to_thread(index.replace, user_id, templates)
+
+    async def remove(self, user_id: int):
+        if self._index is None and not self._load_lock.locked():
+            # Built from the store once it is needed, without the user's templates by then
+            return
+        # A build in progress may have read the file before the user's templates were deleted
+        index = await self.index()
+        await asyncio.to_thread(index.remove, user_id)
+
+    async def identify(self, template: bytes) -> List[Tuple[int, float]]:
+        """(user id, score) of the best candidates, best first."""
+        if not self.ready:
+            raise IndexNotReadyError("Fingerprint index is loading")
+        index = await self.index()
+        return await asyncio.to_thread(index.identify, template, self.candidates)
+
+
+fingerprint_identifier = FingerprintIdentifier(
+    store=fingerprint_templates,
+    candidates=settings.IDENTIFY_CANDIDATES,
+    snapshot_path=settings.FINGERPRINT_INDEX_PATH,
+)
@@ -0,0 +1,245 @@
+"""
+1:N identification over enrolled templates, with locality-sensitive hashing to pick a handful of
+candidates before any cylinder is compared.
+
+Cylinders are sparse bit sets (a few dozen of several hundred bits set), and two cylinders of the
+same minutia share most of their set bits. MinHash estimates exactly that overlap (Jaccard
+similarity): under a random permutation of the bit positions, the first set bit of both cylinders
+coincides with probability |a & b| / |a | b|. Each of `tables` hash tables keys a cylinder by `band`
+such minima, so a genuine pair collides in some table with high probability and an unrelated pair
+almost never. A query votes for the owners of every cylinder its own cylinders collide with; only
+the best-voted users are scored with the full matcher.
+
+Tables are sorted key/owner arrays searched with np.searchsorted. New entries go to a small
+unsorted tail that is merged once it grows; removed users are masked out until the next compaction.
+Hashing every stored template takes seconds per ten thousand, so the tables of an index built from
+the template file are snapshotted next to it and reloaded while the file is unchanged.
+"""
+import os
+import threading
+from typing import Iterable
+
+import numpy as np
+
+from app.modules.matching.matcher import score
+from app.modules.matching.template import CYLINDER_BITS, Template, unpack_template
+
+# Cylinders with fewer set bits say too little to hash; empty ones are common at the finger border
+MIN_HASHED_BITS = 3
+# Merge the unsorted tail into the sorted tables beyond this many entries
+_TAIL_LIMIT = 4096
+# Cylinders hashed at once when building the index; bounds the (chunk, tables * band, bits) temporary
+_HASH_CHUNK = 1024
+
+
+def _as_template(template) -> Template:
+    return template if isinstance(template, Template) else unpack_template(template)
+
+
+class IdentificationIndex:
+    """
+    In-memory 1:N index of user id -> templates (one per enrolled finger). Thread-safe. Templates
+    may be given packed, e.g. as memoryviews of the template file, which they then stay views of.
+    """
+
+    def __init__(self, tables: int = 12, band: int = 3, seed: int = 0):
+        self.tables = tables
+        self.band = band
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        # Rank of every bit position under each of the tables * band permutations
+        self._ranks = np.argsort(rng.random((tables * band, CYLINDER_BITS)), axis=1).argsort(axis=1).astype(np.uint16)
+
+        self._templates: dict[int, list[Template]] = {}
+        self._slot_of: dict[int, int] = {}
+        self._slot_users: list[int] = []
+        self._removed = np.zeros(0, bool)
+        self._keys = [np.zeros(0, np.uint32) for _ in range(tables)]
+        self._owners = [np.zeros(0, np.int32) for _ in range(tables)]
+        self._tail_keys: list[list[np.ndarray]] = [[] for _ in range(tables)]
+        self._tail_owners: list[list[np.ndarray]] = [[] for _ in range(tables)]
+        self._tail_size = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._templates)
+
+    def __contains__(self, user_id):
+        return user_id in self._templates
+
+    def keys(self, cylinders: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """(n, tables) MinHash keys of packed cylinders, and which cylinders have enough bits to hash."""
+        bits = np.unpackbits(np.asarray(cylinders, np.uint8).reshape(-1, CYLINDER_BITS // 8), axis=1).astype(bool)
+        hashed = bits.sum(axis=1) >= MIN_HASHED_BITS
+        # First set bit under each permutation: (n, tables * band), a bounded number of cylinders at a time
+        minima = np.empty((len(bits), self._ranks.shape[0]), np.uint32)
+        for start in range(0, len(bits), _HASH_CHUNK):
+            chunk = bits[start:start + _HASH_CHUNK, np.newaxis, :]
+            minima[start:start + _HASH_CHUNK] = np.where(chunk, self._ranks, CYLINDER_BITS).min(axis=2)
+        minima = minima.reshape(-1, self.tables, self.band)
+        keys = np.zeros(minima.shape[:2], np.uint32)
+        for i in range(self.band):
+            keys = keys * CYLINDER_BITS + minima[..., i]
+        return keys, hashed
+
+    def add(self, user_id: int, template) -> int:
+        """Enroll one more template (or packed template) for `user_id`; returns how many it has now."""
+        with self._lock:
+            self.add_many([(user_id, template)])
+            return len(self._templates[user_id])
+
+    def add_many(self, items: Iterable[tuple]):
+        """Enroll (user id, template or packed template) pairs, hashed in one go and merged into the
+        sorted tables at most once: how the index is built from every stored template."""
+        items = [(user_id, _as_template(template)) for user_id, template in items]
+        if not items:
+            return
+        keys, hashed = self.keys(np.concatenate([template.cylinders for _, template in items]))
+        with self._lock:
+            slots = []
+            for user_id, template in items:
+                slot = self._slot_of.get(user_id)
+                if slot is None:
+                    slot = self._slot_of[user_id] = len(self._slot_users)
+                    self._slot_users.append(user_id)
+                    self._removed = np.append(self._removed, False)
+                self._templates.setdefault(user_id, []).append(template)
+                slots.append(slot)
+
+            owners = np.repeat(np.array(slots, np.int32), [len(template) for _, template in items])[hashed]
+            for table in range(self.tables):
+                self._tail_keys[table].append(keys[hashed, table])
+                self._tail_owners[table].append(owners)
+            self._tail_size += owners.size
+            if self._tail_size > _TAIL_LIMIT:
+                self._merge()
+
+    def replace(self, user_id: int, templates: Iterable):
+        """Make `templates` the only ones enrolled for `user_id`."""
+        with self._lock:
+            self.remove(user_id)
+            self.add_many((user_id, template) for template in templates)
+
+    def remove(self, user_id: int) -> bool:
+        """Forget every template of `user_id`; returns whether there were any."""
+        with self._lock:
+            if self._templates.pop(user_id, None) is None:
+                return False
+            slot = self._slot_of.pop(user_id)
+            self._removed[slot] = True
+            # Entries of removed users are only masked; drop them once they are a quarter of the index
+            if np.count_nonzero(self._removed) * 4 > self._removed.size:
+                self._compact()
+            return True
+
+    def _merge(self):
+        for table in range(self.tables):
+            keys = np.concatenate([self._keys[table], *self._tail_keys[table]])
+            owners = np.concatenate([self._owners[table], *self._tail_owners[table]])
+            order = np.argsort(keys, kind="stable")
+            self._keys[table], self._owners[table] = keys[order], owners[order]
+            self._tail_keys[table], self._tail_owners[table] = [], []
+        self._tail_size = 0
+
+    def _compact(self):
+        self._merge()
+        live = np.flatnonzero(~self._removed)
+        remap = np.full(self._removed.size, -1, np.int32)
+        remap[live] = np.arange(live.size, dtype=np.int32)
+        for table in range(self.tables):
+            owners = remap[self._owners[table]]
+            kept = owners >= 0
+            self._keys[table], self._owners[table] = self._keys[table][kept], owners[kept]
+        self._slot_users = [self._slot_users[slot] for slot in live]
+        self._slot_of = {user_id: slot for slot, user_id in enumerate(self._slot_users)}
+        self._removed = np.zeros(live.size, bool)
+
+    def save(self, path: str, stamp: bytes):
+        """Snapshot the hash tables to `path` (written atomically), for the templates of the file
+        stamped `stamp`; the templates themselves stay in that file."""
+        with self._lock:
+            self._compact()
+            arrays = {
+                "params": np.array([self.tables, self.band, self.seed], np.int64),
+                "stamp": np.frombuffer(stamp, np.uint8),
+                "slot_users": np.array(self._slot_users, np.int64),
+                "table_sizes": np.array([keys.size for keys in self._keys], np.int64),
+                "keys": np.concatenate(self._keys),
+                "owners": np.concatenate(self._owners),
+            }
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # Per-process temporary name: several API processes may snapshot at once
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, stamp: bytes, templates: Iterable[tuple]) -> "IdentificationIndex | None":
+        """Index of (user id, template) pairs from a snapshot that `save` wrote for them; nothing is
+        rehashed. None when there is no snapshot, or it was taken of another file or with other
+        parameters."""
+        try:
+            snapshot = np.load(path)
+        except (OSError, ValueError):
+            return None
+        with snapshot:
+            index = cls()
+            if (snapshot["stamp"].tobytes() != stamp
+                    or snapshot["params"].tolist() != [index.tables, index.band, index.seed]):
+                return None
+            for user_id, template in templates:
+                index._templates.setdefault(user_id, []).append(_as_template(template))
+            index._slot_users = [int(user_id) for user_id in snapshot["slot_users"]]
+            if set(index._slot_users) != index._templates.keys():
+                return None
+            index._slot_of = {user_id: slot for slot, user_id in enumerate(index._slot_users)}
+            index._removed = np.zeros(len(index._slot_users), bool)
+            bounds = np.cumsum(snapshot["table_sizes"])[:-1]
+            index._keys = np.split(snapshot["keys"], bounds)
+            index._owners = np.split(snapshot["owners"], bounds)
+        return index
+
+    def candidates(self, template, k: int = 10) -> list[int]:
+        """User ids of the `k` enrolled users whose cylinders collide most often with the probe's."""
+        keys, hashed = self.keys(_as_template(template).cylinders)
+        keys = keys[hashed]
+        with self._lock:
+            votes = np.zeros(len(self._slot_users), np.int64)
+            for table in range(self.tables):
+                query = keys[:, table]
+                sorted_keys, owners = self._keys[table], self._owners[table]
+                start = np.searchsorted(sorted_keys, query, side="left")
+                stop = np.searchsorted(sorted_keys, query, side="right")
+                lengths = stop - start
+                if lengths.any():
+                    # Every position of every matching run, without a Python loop over the runs
+                    positions = np.repeat(start - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+                    votes += np.bincount(owners[positions], minlength=votes.size)
+                if len(self._tail_keys[table]) > 1:
+                    # One array per add until the first query; a single lookup afterwards
+                    self._tail_keys[table] = [np.concatenate(self._tail_keys[table])]
+                    self._tail_owners[table] = [np.concatenate(self._tail_owners[table])]
+                for tail_keys, tail_owners in zip(self._tail_keys[table], self._tail_owners[table]):
+                    hits = np.isin(tail_keys, query)
+                    votes += np.bincount(tail_owners[hits], minlength=votes.size)
+            votes[self._removed] = 0
+
+            k = min(k, np.count_nonzero(votes))
+            if k == 0:
+                return []
+            best = np.argpartition(votes, -k)[-k:]
+            best = best[np.argsort(-votes[best], kind="stable")]
+            return [self._slot_users[slot] for slot in best]
+
+    def identify(self, template, k: int = 10) -> list[tuple[int, float]]:
+        """Candidates scored with the full matcher (best score over each user's templates), best first."""
+        template = _as_template(template)
+        results = []
+        for user_id in self.candidates(template, k):
+            with self._lock:
+                enrolled = list(self._templates.get(user_id, ()))
+            if enrolled:
+                results.append((user_id, max(score(template, other) for other in enrolled)))
+        return sorted(results, key=lambda result: result[1], reverse=True)
@@ -0,0 +1,106 @@
+"""
+1:1 verification on MCC-style binary templates (see template.py).
+
+Two cylinders are compared only over the cells valid in both; with a and b their bits restricted to
+those cells, their similarity is 1 - sqrt(|a ^ b|) / (sqrt(|a|) + sqrt(|b|)), |.| the popcount. All
+nA x nB cylinder pairs are scored in one broadcast over uint64 words, and the template score is the
+mean of the best few pair similarities (Local Similarity Sort).
+"""
+import numpy as np
+
+from app.modules.matching.template import (
+    CYLINDER_BYTES, ND, Template, _IN_DISK, build_template, is_template, pack_template, unpack_template,
+)
+from app.modules.matching.template_file import mapped_template_file
+
+# Pairs whose minutiae directions differ by more than this cannot correspond
+MAX_DIRECTION_DIFF = np.pi / 2
+# Share of a full disk of cells that must be valid in both cylinders for them to be compared
+MIN_MATCHABLE_CELLS = 0.6
+# Local Similarity Sort: how many of the best pairs are averaged, depending on the template sizes
+MIN_NP, MAX_NP, MU_P, TAU_P = 4, 12, 20, 0.4
+
+_WORDS = CYLINDER_BYTES // 8
+_MIN_MATCHABLE_BITS = MIN_MATCHABLE_CELLS * np.count_nonzero(_IN_DISK) * ND
+
+if hasattr(np, "bitwise_count"):
+    def _popcount(words, axis=-1):
+        return np.bitwise_count(words).sum(axis=axis, dtype=np.int32)
+else:
+    _BYTE_COUNTS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, np.newaxis], axis=1).sum(axis=1).astype(np.int32)
+
+    def _popcount(words, axis=-1):
+        return _BYTE_COUNTS[words.view(np.uint8)].sum(axis=axis)
+
+
+def _words(packed):
+    return np.ascontiguousarray(packed).view(np.uint64).reshape(-1, _WORDS)
+
+
+def similarity_matrix(a: Template, b: Template) -> np.ndarray:
+    """(len(a), len(b)) cylinder similarities, 0 for pairs that cannot match."""
+    cyl_a, mask_a = _words(a.cylinders)[:, np.newaxis], _words(a.masks)[:, np.newaxis]
+    cyl_b, mask_b = _words(b.cylinders)[np.newaxis], _words(b.masks)[np.newaxis]
+
+    common = mask_a & mask_b
+    bits_a = cyl_a & common
+    bits_b = cyl_b & common
+    norm = np.sqrt(_popcount(bits_a)) + np.sqrt(_popcount(bits_b))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        similarity = 1 - np.sqrt(_popcount(bits_a ^ bits_b)) / norm
+
+    direction = np.abs(np.mod(a.minutiae["angle"][:, np.newaxis].astype(np.float64)
+                              - b.minutiae["angle"][np.newaxis] + np.pi, 2 * np.pi) - np.pi)
+    comparable = (norm > 0) & (_popcount(common) >= _MIN_MATCHABLE_BITS) & (direction <= MAX_DIRECTION_DIFF)
+    return np.where(comparable, similarity, 0.0)
+
+
+def _pairs_considered(n_a, n_b):
+    z = 1 / (1 + np.exp(-TAU_P * (min(n_a, n_b) - MU_P)))
+    return MIN_NP + int(round(z * (MAX_NP - MIN_NP)))
+
+
+def score(a: Template, b: Template) -> float:
+    """Similarity in [0, 1] of two templates: mean of the best pair similarities."""
+    if not len(a) or not len(b):
+        return 0.0
+    similarities = similarity_matrix(a, b).ravel()
+    n_p = min(_pairs_considered(len(a), len(b)), similarities.size)
+    return float(np.partition(similarities, -n_p)[-n_p:].mean())
+
+
+def template_from_upload(contents: bytes, timings: dict | None = None) -> Template:
+    """A template from either a packed template or a capture to enhance. Raises InvalidUploadError
+    for anything else."""
+    if is_template(contents):
+        return unpack_template(contents)
+
+    # Imported here: scoring alone (the API process's identification index) must not load OpenCV
+    from app.modules.normalize_phone.pipeline import decode_upload, phone_pipeline, timed_stage
+    with timed_stage(timings, "decode"):
+        img = decode_upload(contents)
+    outputs = phone_pipeline(img, outputs=("minutiae", "segmentation"), timings=timings)
+    with timed_stage(timings, "template"):
+        return build_template(outputs["minutiae"], outputs["segmentation"][1])
+
+
+def enroll_upload(contents: bytes) -> tuple[bytes, dict]:
+    """Worker entry point: packed template of an uploaded capture, and the per-stage timings."""
+    timings = {}
+    return pack_template(template_from_upload(contents, timings)), timings
+
+
+def verify_templates(probe: bytes, reference: bytes) -> float:
+    """Worker entry point: score of two packed templates."""
+    return score(unpack_template(probe), unpack_template(reference))
+
+
+def verify_enrolled(probe: bytes, user_id: int, path: str) -> float | None:
+    """Worker entry point: best score of a packed template against the stored templates of
+    `user_id`, read from the template file every worker maps; None when the user has none."""
+    template_file = mapped_template_file(path)
+    enrolled = template_file.user_templates(user_id) if template_file is not None else []
+    if not enrolled:
+        return None
+    probe = unpack_template(probe)
+    return max(score(probe, unpack_template(template)) for template in enrolled)
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, LargeBinary, SmallInteger, String, UniqueConstraint
+from sqlalchemy.orm import relationship
+from app.core.database import Base
+
+
+class FingerprintTemplate(Base):
+    __tablename__ = "fingerprint_templates"
+    __table_args__ = (
+        UniqueConstraint("user_id", "finger", "version", name="uq_fingerprint_templates_user_id_finger_version"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    # Deleting a user deletes their templates in the database
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    finger = Column(SmallInteger, nullable=False)
+    version = Column(String, nullable=False, index=True)
+    template = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+    user = relationship("User")
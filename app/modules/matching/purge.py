@@ -0,0 +1,37 @@
+"""
+Delete fingerprint templates of old template versions once no API process uses them any more, e.g.
+after a rolling deploy has finished:
+
+    python -m app.modules.matching.purge            # templates per version, deletes nothing
+    python -m app.modules.matching.purge --delete   # keeps only the version of these settings
+
+The version kept is the one built with this process's pipeline settings (PIPELINE_DENOISE), so run
+it with the same environment as the API; `--keep` names the versions to keep instead. Users whose
+templates are deleted have to enroll again.
+"""
+import argparse
+import asyncio
+
+from app.core.database import AsyncSessionLocal
+from app.modules.matching.constants import template_version
+from app.modules.matching.store import fingerprint_templates
+
+
+async def main(keep: list[str], remove: bool):
+    async with AsyncSessionLocal() as db:
+        counts = await fingerprint_templates.version_counts(db)
+        for version, count in sorted(counts.items()):
+            print(f"{count:8d}  {version}{'  (kept)' if version in keep else ''}")
+        if not remove:
+            return
+        purged = await fingerprint_templates.purge_versions(db, keep)
+    print(f"Deleted {purged} templates")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Delete fingerprint templates of other template versions")
+    ap.add_argument("--keep", action="append",
+                    help=f"Template version to keep, may be repeated (default: {template_version()})")
+    ap.add_argument("--delete", action="store_true", help="Delete the others; without it, only list them")
+    args = ap.parse_args()
+    asyncio.run(main(args.keep or [template_version()], args.delete))
@@ -0,0 +1,121 @@
+import asyncio
+import time
+
+from fastapi import APIRouter, File, HTTPException, UploadFile
+from fastapi.responses import JSONResponse, Response
+
+from app.core.config import settings
+from app.modules.matching.constants import identified_user
+from app.modules.matching.identification import IndexNotReadyError, fingerprint_identifier
+from app.modules.normalize_phone.executor import (
+    InvalidUploadError, PipelineBusyError, PipelineCrashedError, pipeline_executor,
+)
+from app.modules.normalize_phone.router import server_timing
+
+# Enhancement and matching run in the pipeline worker processes; the API process never imports them
+ENROLL_UPLOAD = "app.modules.matching.matcher:enroll_upload"
+VERIFY_TEMPLATES = "app.modules.matching.matcher:verify_templates"
+VERIFY_ENROLLED = "app.modules.matching.matcher:verify_enrolled"
+
+router = APIRouter(prefix="/matching", tags=["matching"])
+
+
+async def _run(fn, *args):
+    try:
+        return await pipeline_executor.run(fn, *args)
+    except PipelineCrashedError:
+        raise HTTPException(status_code=503, detail="Enhancement worker crashed, retry later",
+                            headers={"Retry-After": "1"})
+    except PipelineBusyError:
+        raise HTTPException(status_code=503, detail="Enhancement queue is full, retry later",
+                            headers={"Retry-After": "1"})
+    except InvalidUploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
+
+
+async def capture_template(file: UploadFile) -> tuple[bytes, dict]:
+    """Packed template of an uploaded capture (or template), computed on the pipeline workers."""
+    return await _run(ENROLL_UPLOAD, await file.read())
+
+
+async def identify_capture(file: UploadFile) -> tuple[list, dict]:
+    """Best enrolled candidates for an uploaded capture, as (user id, score) pairs, best first."""
+    template, timings = await capture_template(file)
+    start = time.perf_counter()
+    try:
+        candidates = await fingerprint_identifier.identify(template)
+    except IndexNotReadyError:
+        raise HTTPException(status_code=503, detail="Fingerprint index is loading, retry later",
+                            headers={"Retry-After": "1"})
+    timings["identify"] = (time.perf_counter() - start) * 1e3
+    return candidates, timings
+
+
+@router.post("/template")
+async def create_template(file: UploadFile = File(...)):
+    """Binary template of one capture, to store and later pass to /matching/verify as `reference`."""
+    template, timings = await capture_template(file)
+    return Response(template, media_type="application/octet-stream",
+                    headers={"Server-Timing": server_timing(timings)})
+
+
+@router.post("/verify")
+async def verify(probe: UploadFile = File(...), reference: UploadFile = File(...)):
+    """1:1 verification: do `probe` and `reference` come from the same finger?
+
+    Each upload may be a capture or a template from /matching/template; the two captures are
+    enhanced in parallel.
+    """
+    (probe_template, probe_timings), (reference_template, reference_timings) = await asyncio.gather(
+        _run(ENROLL_UPLOAD, await probe.read()),
+        _run(ENROLL_UPLOAD, await reference.read()),
+    )
+    score = await _run(VERIFY_TEMPLATES, probe_template, reference_template)
+
+    timings = {f"probe-{name}": duration for name, duration in probe_timings.items()}
+    timings.update({f"reference-{name}": duration for name, duration in reference_timings.items()})
+    return JSONResponse(
+        {"score": score, "match": score >= settings.MATCH_THRESHOLD, "threshold": settings.MATCH_THRESHOLD},
+        headers={"Server-Timing": server_timing(timings)},
+    )
+
+
+@router.post("/verify/{user_id}")
+async def verify_user(user_id: int, file: UploadFile = File(...)):
+    """1:1 verification against the fingerprints stored for `user_id`.
+
+    Scored on the pipeline workers, which share the stored templates through the template file; a
+    fingerprint enrolled a moment ago may take until its background rewrite to be found.
+    """
+    template, timings = await capture_template(file)
+    start = time.perf_counter()
+    score = await _run(VERIFY_ENROLLED, template, user_id, settings.FINGERPRINT_TEMPLATES_PATH)
+    timings["verify"] = (time.perf_counter() - start) * 1e3
+    if score is None:
+        raise HTTPException(status_code=404, detail="No fingerprints enrolled for this user")
+    return JSONResponse(
+        {"user_id": user_id, "score": score, "match": score >= settings.MATCH_THRESHOLD,
+         "threshold": settings.MATCH_THRESHOLD},
+        headers={"Server-Timing": server_timing(timings)},
+    )
+
+
+@router.post("/identify")
+async def identify(file: UploadFile = File(...)):
+    """1:N identification: which enrolled user does this capture belong to?
+
+    Only the best-hashed candidates are scored. `user_id` is null unless the best one reaches
+    IDENTIFY_THRESHOLD and leads the runner-up by IDENTIFY_MARGIN.
+    """
+    candidates, timings = await identify_capture(file)
+    user_id = identified_user(candidates)
+    return JSONResponse(
+        {
+            "user_id": user_id,
+            "score": candidates[0][1] if user_id is not None else None,
+            "candidates": [{"user_id": user_id, "score": score} for user_id, score in candidates],
+        },
+        headers={"Server-Timing": server_timing(timings)},
+    )
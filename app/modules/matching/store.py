@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import logging
+from datetime import datetime
+from typing import Collection, Dict, List, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.modules.matching.constants import template_version
+from app.modules.matching.models import FingerprintTemplate
+from app.modules.matching.template_file import (
+    STAMP_SIZE, TemplateFile, mapped_template_file, template_file_stamp, write_template_file,
+)
+
+logger = logging.getLogger(__name__)
+
+# pg_advisory_xact_lock key held while the template file is rewritten
+_REWRITE_LOCK = 0x46505431
+
+
+class FingerprintTemplateStore:
+    """
+    Templates stored per user, finger and template version, and a process-local cache of all those
+    of the current version in one memory-mapped file (see template_file.py), which the identification index and
+    the pipeline workers read without copying. The file is brought up to date with the database at
+    startup and, in the background, after every change made through this process; changes made while
+    a rewrite is running share the next one, and `stop` waits for the last one.
+
+    API processes sharing the file rewrite it one at a time, under a Postgres advisory lock, each
+    from a read made while holding it: a process that read the table before another committed can
+    no longer replace the file after that one. The file is stamped with the state it was read from
+    and only rewritten when that state changed.
+
+    Templates of other versions are left alone, since processes with other pipeline settings (e.g.
+    the old ones during a rolling deploy) still use them; they are deleted on request only, with
+    `python -m app.modules.matching.purge`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file: Optional[TemplateFile] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._dirty = False
+
+    async def start(self):
+        """Bring the cache up to date with the database; at startup the identifier does so in the
+        background. Without a database (or before the migration) this only logs; the file is then
+        written on the first change."""
+        try:
+            await self._load()
+        except Exception:
+            logger.exception("Could not load the fingerprint templates into %s", self.path)
+
+    @staticmethod
+    async def version_counts(db: AsyncSession) -> Dict[str, int]:
+        """Number of stored templates per template version."""
+        result = await db.execute(
+            select(FingerprintTemplate.version, func.count()).group_by(FingerprintTemplate.version)
+        )
+        return dict(result.all())
+
+    @staticmethod
+    async def purge_versions(db: AsyncSession, keep: Collection[str]) -> int:
+        """Delete the templates of every version but `keep`; returns how many. Not run by the API:
+        only the operator knows which versions no process uses any more."""
+        result = await db.execute(delete(FingerprintTemplate).where(FingerprintTemplate.version.not_in(keep)))
+        await db.commit()
+        return result.rowcount
+
+    @staticmethod
+    async def _stamp(db: AsyncSession, version: str) -> bytes:
+        # Inserts raise the max id, deletes change the count and id sum, re-enrollments the max created_at
+        result = await db.execute(
+            select(func.count(), func.max(FingerprintTemplate.id), func.sum(FingerprintTemplate.id),
+                   func.max(FingerprintTemplate.created_at))
+            .where(FingerprintTemplate.version == version)
+        )
+        state = "|".join(str(value) for value in (version, *result.one()))
+        return hashlib.blake2b(state.encode(), digest_size=STAMP_SIZE).digest()
+
+    async def _load(self):
+        version = template_version()
+        async with AsyncSessionLocal() as db:
+            # Held until the commit below, across the read and the file replacement
+            await db.execute(select(func.pg_advisory_xact_lock(_REWRITE_LOCK)))
+            stamp = await self._stamp(db, version)
+            if await asyncio.to_thread(template_file_stamp, self.path) != stamp:
+                result = await db.execute(
+                    select(FingerprintTemplate.id, FingerprintTemplate.user_id, FingerprintTemplate.finger,
+                           FingerprintTemplate.template)
+                    .where(FingerprintTemplate.version == version)
+                    .order_by(FingerprintTemplate.user_id, FingerprintTemplate.finger)
+                )
+                await asyncio.to_thread(write_template_file, self.path, result.all(), stamp)
+            await db.commit()
+        self._file = await asyncio.to_thread(mapped_template_file, self.path)
+
+    def file(self) -> Optional[TemplateFile]:
+        return self._file
+
+    async def refreshed(self) -> Optional[TemplateFile]:
+        """The file once the rewrites scheduled so far are done."""
+        if self._refresh_task is not None:
+            await asyncio.shield(self._refresh_task)
+        return self._file
+
+    async def user_templates(self, db: AsyncSession, user_id: int) -> List[bytes]:
+        result = await db.execute(
+            select(FingerprintTemplate.template)
+            .where(FingerprintTemplate.user_id == user_id, FingerprintTemplate.version == template_version())
+            .order_by(FingerprintTemplate.finger)
+        )
+        return list(result.scalars().all())
+
+    async def save(self, db: AsyncSession, user_id: int, finger: int, template: bytes) -> List[bytes]:
+        """Store the template of one finger, replacing the one enrolled before; returns all the
+        user's templates of the current version."""
+        statement = insert(FingerprintTemplate).values(
+            user_id=user_id, finger=finger, version=template_version(), template=template, created_at=datetime.now(),
+        )
+        statement = statement.on_conflict_do_update(
+            constraint="uq_fingerprint_templates_user_id_finger_version",
+            set_={"template": statement.excluded.template, "created_at": statement.excluded.created_at},
+        )
+        await db.execute(statement)
+        await db.commit()
+        self.invalidate()
+        return await self.user_templates(db, user_id)
+
+    async def delete(self, db: AsyncSession, user_id: int, finger: Optional[int] = None) -> int:
+        """Delete the user's templates (of every version), or only those of `finger`; returns how many."""
+        statement = delete(FingerprintTemplate).where(FingerprintTemplate.user_id == user_id)
+        if finger is not None:
+            statement = statement.where(FingerprintTemplate.finger == finger)
+        result = await db.execute(statement)
+        await db.commit()
+        if result.rowcount:
+            self.invalidate()
+        return result.rowcount
+
+    def invalidate(self):
+        """Rewrite the file after a change, e.g. templates deleted along with their user."""
+        self._dirty = True
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh())
+
+    async def _refresh(self):
+        while self._dirty:
+            self._dirty = False
+            try:
+                await self._load()
+            except Exception:
+                logger.exception("Could not rewrite the fingerprint templates in %s", self.path)
+
+    async def stop(self):
+        if self._refresh_task is not None:
+            await self._refresh_task
+            self._refresh_task = None
+
+
+fingerprint_templates = FingerprintTemplateStore(path=settings.FINGERPRINT_TEMPLATES_PATH)
@@ -0,0 +1,147 @@
+"""
+Fixed-size binary fingerprint templates in the style of Minutia Cylinder-Code (MCC).
+
+Every minutia gets a cylinder: a NS x NS grid of cells rotated with the minutia direction and
+centred on it, each split into ND direction bins. A bin is set when neighbouring minutiae near the
+cell have that direction relative to the central minutia, so the cylinder describes the local
+minutiae arrangement invariantly to translation and rotation. A validity mask marks the cells that
+fall inside the cylinder's disk and inside the fingerprint.
+Cylinders and masks are packed into NS * NS * ND / 8 bytes each, which lets two templates be
+compared with AND/XOR/popcount only (see matcher.py).
+R. Cappelli, M. Ferrara and D. Maltoni, "Minutia Cylinder-Code: a new representation and matching
+technique for fingerprint recognition", IEEE TPAMI 32(12), 2010
+"""
+import struct
+from typing import NamedTuple
+
+import numpy as np
+
+from app.modules.normalize_phone.executor import InvalidUploadError
+from app.modules.normalize_phone.utils.minutia_format import MINUTIA_DTYPE
+
+# Cylinder geometry, in pixels of the 512x512 enhanced image
+RADIUS = 64
+NS = 8
+ND = 6
+SIGMA_S = 9.0
+SIGMA_D = 2 * np.pi / 9
+# A bin is set when its contribution reaches this share of a single perfectly placed neighbour
+BIT_THRESHOLD = 0.25
+# Cylinders with fewer valid cells (share of the disk) or neighbours carry too little to match on
+MIN_VALID_CELLS = 0.75
+MIN_NEIGHBOURS = 2
+
+CYLINDER_BITS = NS * NS * ND
+CYLINDER_BYTES = CYLINDER_BITS // 8
+
+TEMPLATE_MAGIC = b"MCC1"
+_HEADER = struct.Struct("<4sHH")
+
+
+class Template(NamedTuple):
+    """Minutiae of the valid cylinders, and their packed cylinder bits and validity masks."""
+    minutiae: np.ndarray
+    cylinders: np.ndarray
+    masks: np.ndarray
+
+    def __len__(self):
+        return len(self.minutiae)
+
+
+def _cell_offsets():
+    cell = 2 * RADIUS / NS
+    centres = (np.arange(NS) - (NS - 1) / 2) * cell
+    dy, dx = np.meshgrid(centres, centres, indexing="ij")
+    return dx.ravel(), dy.ravel()
+
+
+_CELL_DX, _CELL_DY = _cell_offsets()
+_IN_DISK = np.hypot(_CELL_DX, _CELL_DY) <= RADIUS
+# Relative direction at the centre of each bin
+_BIN_ANGLES = -np.pi + (np.arange(ND) + 0.5) * 2 * np.pi / ND
+
+
+def _angle_diff(a, b):
+    """a - b wrapped to [-pi, pi)."""
+    return np.mod(a - b + np.pi, 2 * np.pi) - np.pi
+
+
+def build_template(minutiae: np.ndarray, mask: np.ndarray) -> Template:
+    """
+    Cylinders of every minutia, all at once: contributions of each neighbour to each cell and bin
+    are a (n, cells, n, ND) product of a spatial and a directional Gaussian.
+    :param minutiae: MINUTIA_DTYPE array, as produced by the pipeline's minutiae stage
+    :param mask: segmentation mask of the capture the minutiae come from
+    """
+    x = minutiae["x"].astype(np.float64)
+    y = minutiae["y"].astype(np.float64)
+    theta = minutiae["angle"].astype(np.float64)
+    n = x.size
+
+    # Cell centres of every cylinder, rotated with its minutia: (n, cells)
+    cos, sin = np.cos(theta)[:, np.newaxis], np.sin(theta)[:, np.newaxis]
+    cx = x[:, np.newaxis] + cos * _CELL_DX - sin * _CELL_DY
+    cy = y[:, np.newaxis] + sin * _CELL_DX + cos * _CELL_DY
+
+    # Spatial weight of neighbour j at each cell of cylinder i: (n, cells, n), the minutia itself excluded
+    distance2 = (cx[..., np.newaxis] - x) ** 2 + (cy[..., np.newaxis] - y) ** 2
+    spatial = np.exp(-distance2 / (2 * SIGMA_S ** 2))
+    spatial[distance2 > (3 * SIGMA_S) ** 2] = 0
+    spatial[np.arange(n), :, np.arange(n)] = 0
+
+    # Directional weight of neighbour j in each bin of cylinder i: (n, n, ND)
+    relative = _angle_diff(theta[:, np.newaxis], theta[np.newaxis, :])
+    directional = np.exp(-_angle_diff(_BIN_ANGLES, relative[..., np.newaxis]) ** 2 / (2 * SIGMA_D ** 2))
+
+    bits = np.einsum("icj,ijd->icd", spatial, directional) >= BIT_THRESHOLD
+
+    # Valid cells: inside the disk and on the fingerprint
+    rows, cols = mask.shape
+    iy, ix = np.rint(cy).astype(np.intp), np.rint(cx).astype(np.intp)
+    inside = (iy >= 0) & (iy < rows) & (ix >= 0) & (ix < cols)
+    valid = _IN_DISK & inside
+    valid[inside] &= np.asarray(mask)[iy[inside], ix[inside]] > 0
+
+    neighbours = np.count_nonzero(np.hypot(x[:, np.newaxis] - x, y[:, np.newaxis] - y)
+                                  <= RADIUS + 3 * SIGMA_S, axis=1) - 1
+    keep = ((np.count_nonzero(valid, axis=1) >= MIN_VALID_CELLS * np.count_nonzero(_IN_DISK))
+            & (neighbours >= MIN_NEIGHBOURS))
+
+    cell_valid = np.repeat(valid[keep], ND, axis=1).reshape(-1, NS * NS, ND)
+    return Template(
+        minutiae=np.ascontiguousarray(minutiae[keep]),
+        cylinders=np.packbits((bits[keep] & cell_valid).reshape(-1, CYLINDER_BITS), axis=1),
+        masks=np.packbits(cell_valid.reshape(-1, CYLINDER_BITS), axis=1),
+    )
+
+
+def pack_template(template: Template) -> bytes:
+    """Serialise to header + minutiae + cylinders + masks: 4 + 9 + 2 * CYLINDER_BYTES bytes per minutia."""
+    return b"".join((
+        _HEADER.pack(TEMPLATE_MAGIC, len(template), 0),
+        template.minutiae.astype(MINUTIA_DTYPE).tobytes(),
+        np.ascontiguousarray(template.cylinders, np.uint8).tobytes(),
+        np.ascontiguousarray(template.masks, np.uint8).tobytes(),
+    ))
+
+
+def is_template(data: bytes) -> bool:
+    return data[:len(TEMPLATE_MAGIC)] == TEMPLATE_MAGIC
+
+
+def unpack_template(data: bytes) -> Template:
+    """Inverse of `pack_template`; the arrays are read-only views of `data`. Raises InvalidUploadError
+    when `data` is not a template."""
+    if len(data) < _HEADER.size or not is_template(data):
+        raise InvalidUploadError("Not a fingerprint template")
+    _, n, _ = _HEADER.unpack_from(data)
+    minutiae_end = _HEADER.size + n * MINUTIA_DTYPE.itemsize
+    if len(data) != minutiae_end + 2 * n * CYLINDER_BYTES:
+        raise InvalidUploadError("Truncated fingerprint template")
+    cylinders = np.frombuffer(data, np.uint8, n * CYLINDER_BYTES, minutiae_end)
+    masks = np.frombuffer(data, np.uint8, n * CYLINDER_BYTES, minutiae_end + n * CYLINDER_BYTES)
+    return Template(
+        minutiae=np.frombuffer(data, MINUTIA_DTYPE, n, _HEADER.size),
+        cylinders=cylinders.reshape(n, CYLINDER_BYTES),
+        masks=masks.reshape(n, CYLINDER_BYTES),
+    )
@@ -0,0 +1,108 @@
+"""
+Every stored template in one file, written by the API process and memory-mapped read-only by every
+process that matches: the identification index of the API process and the pipeline workers. The
+templates are then in memory once, in the page cache, however many processes read them.
+
+Layout: a header (magic, record count, stamp), one fixed-size record per template (row id, user id,
+finger, offset and length of its packed bytes), then the packed templates back to back. The stamp
+identifies the database state the file was written from, so an up-to-date file is not rewritten and
+what was derived from it (the identification index snapshot) stays valid. A new file is
+written next to the old one and renamed over it, so processes still mapping the old file keep
+reading it until they reopen the path.
+Kept free of NumPy: `unpack_template` turns the memoryviews handed out here into arrays without
+copying.
+"""
+import mmap
+import os
+import struct
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+FILE_MAGIC = b"FPT2"
+STAMP_SIZE = 32
+_HEADER = struct.Struct(f"<4sI{STAMP_SIZE}s")
+# Row id, user id, finger, offset, length
+_RECORD = struct.Struct("<qiiQQ")
+
+
+def write_template_file(path: str, rows: Iterable[Tuple[int, int, int, bytes]], stamp: bytes = b"") -> int:
+    """Write (row id, user id, finger, packed template) rows to `path`, atomically; returns their count.
+    `stamp` (at most STAMP_SIZE bytes) identifies what they were read from."""
+    rows = list(rows)
+    offset = _HEADER.size + len(rows) * _RECORD.size
+    records = []
+    for row_id, user_id, finger, template in rows:
+        records.append(_RECORD.pack(row_id, user_id, finger, offset, len(template)))
+        offset += len(template)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    # Per-process temporary name: several API processes may rewrite the file at once
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(FILE_MAGIC, len(rows), stamp))
+        f.writelines(records)
+        f.writelines(template for *_, template in rows)
+    os.replace(tmp, path)
+    return len(rows)
+
+
+class TemplateFile:
+    """Read-only mapping of a file written by `write_template_file`."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.identity = (stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+        self.data = memoryview(self._map)
+
+        magic, count, self.stamp = _HEADER.unpack_from(self.data)
+        if magic != FILE_MAGIC:
+            raise ValueError(f"{path} is not a fingerprint template file")
+        self.records = list(_RECORD.iter_unpack(self.data[_HEADER.size:_HEADER.size + count * _RECORD.size]))
+        self._by_user = {}
+        for i, (_, user_id, *_) in enumerate(self.records):
+            self._by_user.setdefault(user_id, []).append(i)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[Tuple[int, int, memoryview]]:
+        """(user id, finger, packed template) of every template."""
+        for i, (_, user_id, finger, _, _) in enumerate(self.records):
+            yield user_id, finger, self.template(i)
+
+    def template(self, i: int) -> memoryview:
+        _, _, _, offset, length = self.records[i]
+        return self.data[offset:offset + length]
+
+    def user_templates(self, user_id: int) -> List[memoryview]:
+        return [self.template(i) for i in self._by_user.get(user_id, ())]
+
+
+def template_file_stamp(path: str) -> Optional[bytes]:
+    """Stamp of the file at `path`, without mapping it; None when it is missing or of another format."""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(_HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(header) < _HEADER.size or header[:4] != FILE_MAGIC:
+        return None
+    return _HEADER.unpack(header)[2]
+
+
+_mapped = {}
+
+
+def mapped_template_file(path: str) -> Optional[TemplateFile]:
+    """This process's mapping of `path`, reopened once the file has been replaced; None while
+    there is no file yet."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    current = _mapped.get(path)
+    if current is None or current.identity != (stat.st_dev, stat.st_ino, stat.st_mtime_ns):
+        current = _mapped[path] = TemplateFile(path)
+    return current
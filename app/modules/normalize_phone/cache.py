@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app.core.config import settings
+
+CacheEntry = Tuple[bytes, dict]
+
+
+class ResultCache:
+    """
+    Content-addressed cache of encoded enhancement results: an in-memory LRU tier bounded by
+    `max_bytes`, backed by an optional directory tier bounded by `max_disk_bytes`. Keys are BLAKE2
+    digests of the uploaded bytes and every parameter that changes the output, so an entry never
+    needs invalidating; the disk tier is shared by all worker processes on the host.
+
+    Every process looks entries up by path, so it hits what the others wrote, and evicts by scanning
+    the directory, so `max_disk_bytes` bounds the directory rather than each process's share of it.
+    """
+
+    def __init__(self, max_bytes: int, disk_dir: Optional[str] = None, max_disk_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._size = 0
+        # Directory size as of the last scan plus what this process wrote since
+        self._disk_size = 0
+        self._disk_entries = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_size, self._disk_entries = self._evict()
+
+    @staticmethod
+    def key(contents: bytes, *params) -> str:
+        digest = hashlib.blake2b(contents, digest_size=20)
+        digest.update(json.dumps(params, separators=(",", ":")).encode())
+        return digest.hexdigest()
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        if self.disk_dir:
+            entry = await asyncio.to_thread(self._read, key)
+            if entry is not None:
+                self.disk_hits += 1
+                self._remember(key, entry)
+                return entry
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, body: bytes, headers: dict):
+        entry = (body, headers)
+        self._remember(key, entry)
+        if not self.disk_dir or len(body) > self.max_disk_bytes:
+            return
+
+        self._disk_size += await asyncio.to_thread(self._write, key, entry)
+        self._disk_entries += 1
+        if self._disk_size > self.max_disk_bytes:
+            self._disk_size, self._disk_entries = await asyncio.to_thread(self._evict)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "disk_entries": self._disk_entries,
+            "disk_bytes": self._disk_size,
+        }
+
+    def _remember(self, key: str, entry: CacheEntry):
+        size = len(entry[0])
+        if size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous[0])
+        self._entries[key] = entry
+        self._size += size
+        while self._size > self.max_bytes:
+            _, (body, _) = self._entries.popitem(last=False)
+            self._size -= len(body)
+
+    # Disk tier: one file per entry, "<headers json>\n<body>", evicted oldest-first by mtime (a hit
+    # touches its file). All of it runs in threads.
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], key)
+
+    def _evict(self) -> tuple[int, int]:
+        """Scan the directory and delete the oldest entries until it is back under 90% of
+        `max_disk_bytes`, so the next scan is some writes away; returns its size and entry count."""
+        files = []
+        now = time.time()
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                    if name.endswith(".tmp"):
+                        # Left behind by a writer that died; live ones are renamed within moments
+                        if stat.st_mtime < now - 3600:
+                            os.remove(path)
+                        continue
+                except OSError:
+                    # Removed by another process meanwhile
+                    continue
+                files.append((stat.st_mtime, path, stat.st_size))
+        files.sort()
+        total = sum(size for _, _, size in files)
+        count = len(files)
+        if total > self.max_disk_bytes:
+            for _, path, size in files:
+                if total <= self.max_disk_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
+                count -= 1
+        return total, count
+
+    def _read(self, key: str) -> Optional[CacheEntry]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                headers, body = f.read().split(b"\n", 1)
+            headers = json.loads(headers)
+            os.utime(path)
+        except (OSError, ValueError):
+            # Missing, evicted meanwhile, or corrupt: a miss either way
+            return None
+        return body, headers
+
+    def _write(self, key: str, entry: CacheEntry) -> int:
+        body, headers = entry
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(json.dumps(headers).encode() + b"\n" + body)
+            size = f.tell()
+        os.replace(tmp_path, path)
+        return size
+
+
+
+result_cache = ResultCache(
+    max_bytes=settings.RESULT_CACHE_BYTES,
+    disk_dir=settings.RESULT_CACHE_DIR,
+    max_disk_bytes=settings.RESULT_CACHE_DISK_BYTES,
+)
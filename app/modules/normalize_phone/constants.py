@@ -0,0 +1,12 @@
+# Kept free of heavy imports: the API process reads these without loading the pipeline
+
+# Public outputs of phone_pipeline, in pipeline order
+PHONE_PIPELINE_STAGES = (
+    "preprocessed", "background_removed", "contrast_enhanced", "sharpened", "binary",
+    "aligned", "aligned_upper23", "skeleton", "skeleton_upper23",
+)
+
+# Part of every result cache key: bump whenever a change to the pipeline alters its output
+PIPELINE_VERSION = 2
+
+OUTPUT_MEDIA_TYPES = ("application/json", "application/octet-stream", "image/png", "image/webp", "multipart/mixed")
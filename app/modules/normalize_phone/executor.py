@@ -0,0 +1,156 @@
+import asyncio
+import functools
+import importlib
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.core.config import settings
+
+
+class PipelineBusyError(Exception):
+    """Raised when the enhancement queue already holds `max_pending` requests."""
+
+
+class PipelineCrashedError(PipelineBusyError):
+    """Raised when a worker process died (OOM kill, segfault) during the call. The pool has been
+    replaced by then, so a retry runs on fresh workers."""
+
+
+class InvalidUploadError(ValueError):
+    """Raised by worker entry points for uploads that are not what they claim to be: undecodable
+    images, truncated templates. Any other exception from the pipeline is an internal error."""
+
+
+def _warm_worker():
+    # Pay for the OpenCV/SciPy imports once per worker, not on the first request it serves
+    importlib.import_module("app.modules.normalize_phone.pipeline")
+
+
+def _ready():
+    return True
+
+
+def _call(target: str, *args):
+    # Resolve "module:function" inside the worker, so callers never import the module themselves
+    module, _, name = target.partition(":")
+    return getattr(importlib.import_module(module), name)(*args)
+
+
+def _resolve(fn):
+    return functools.partial(_call, fn) if isinstance(fn, str) else fn
+
+
+class PipelineExecutor:
+    """
+    Bounded process pool for the CPU-bound enhancement pipeline, so it never runs on the event loop.
+    Workers are spawned and warmed up front; at most `max_pending` calls may be queued or running
+    at once, beyond that `run` fails fast with `PipelineBusyError`. Functions may be given as
+    "module:function" strings so the API process never has to import the pipeline.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pool = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def start(self):
+        if self._pool is not None:
+            return
+        # spawn rather than fork: the API process runs an event loop and threads
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_worker,
+        )
+        # One task per worker makes the pool start every process now
+        for _ in range(self.workers):
+            self._pool.submit(_ready)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def _replace_broken(self, pool):
+        # One dead worker breaks the whole pool for good; only the first caller to notice replaces it
+        if self._pool is pool:
+            # Its queued calls have already failed with BrokenProcessPool, so there is nothing to cancel
+            pool.shutdown(wait=False)
+            self._pool = None
+            self.start()
+
+    def _release(self, _future):
+        self._pending -= 1
+
+    def check_capacity(self):
+        if self._pending >= self.max_pending:
+            raise PipelineBusyError(f"{self._pending} enhancement requests already queued")
+
+    async def run(self, fn, *args):
+        self.check_capacity()
+        self.start()
+        pool = self._pool
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, _resolve(fn), *args)
+        except BrokenProcessPool as e:
+            # Not retried here: the same input may well kill the new workers too
+            self._replace_broken(pool)
+            raise PipelineCrashedError("An enhancement worker crashed") from e
+        finally:
+            self._pending -= 1
+
+    async def map_unordered(self, fn, items, window: int | None = None):
+        """
+        Run `fn` over `items`, yielding `(index, future)` pairs in completion order. At most `window`
+        items (default: one per worker) are in flight at a time, and never more than the pending budget
+        has room for, so a large batch shares the pool with other requests instead of monopolising it.
+        A batch always keeps one item in flight, so it makes progress even while the budget is full.
+        """
+        self.check_capacity()
+        self.start()
+        pool = self._pool
+        fn = _resolve(fn)
+        window = window or self.workers
+        remaining = iter(enumerate(items))
+        in_flight = {}
+        try:
+            while True:
+                # Negative once overlapping batches have each kept their one item in flight
+                room = max(min(window - len(in_flight), self.max_pending - self._pending), 0)
+                for index, item in itertools.islice(remaining, room if in_flight else max(room, 1)):
+                    work = pool.submit(fn, item)
+                    in_flight[asyncio.wrap_future(work)] = index, work
+                    self._pending += 1
+                if not in_flight:
+                    return
+
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                if any(isinstance(future.exception(), BrokenProcessPool) for future in done):
+                    # Every item still on the dead pool fails with it; the rest of the batch gets a new one
+                    self._replace_broken(pool)
+                    pool = self._pool
+                for future in done:
+                    self._pending -= 1
+                    yield in_flight.pop(future)[0], future
+        finally:
+            # The consumer went away (e.g. client disconnect): drop whatever is still queued. Items
+            # already running cannot be stopped, so they keep their share of the budget until they end
+            for future, (_, work) in in_flight.items():
+                if work.cancel():
+                    self._pending -= 1
+                else:
+                    future.add_done_callback(self._release)
+
+
+pipeline_executor = PipelineExecutor(
+    workers=settings.PIPELINE_WORKERS,
+    max_pending=settings.PIPELINE_MAX_PENDING,
+)
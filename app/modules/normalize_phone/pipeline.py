@@ -1,281 +1,583 @@
-# # normal_phone.py
-# import os
-# import cv2
-# import numpy as np
-# import base64
-# from skimage.filters import threshold_sauvola
-# from PIL import Image
-# from fastapi import APIRouter, File, UploadFile, HTTPException
-#
-# from app.modules.normalize_phone.utils.normalization import normalize as iitk_normalize
-# from app.modules.normalize_phone.utils.segmentation import create_segmented_and_variance_images
-# from app.modules.normalize_phone.utils.orientation import calculate_angles
-# from app.modules.normalize_phone.utils.frequency import ridge_freq
-# from .utils.gabor_filter import gabor_filter
-#
-# # -------------------------
-# # Utilities
-# # -------------------------
-# def to_gray(img: np.ndarray) -> np.ndarray:
-#     if img.ndim == 3:
-#         img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-#     return img
-#
-# def pad_to_square(img: np.ndarray, size: int = 512) -> np.ndarray:
-#     h, w = img.shape[:2]
-#     scale = size / max(h, w)
-#     new_w, new_h = int(round(w * scale)), int(round(h * scale))
-#     resized = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
-#     canvas = np.full((size, size), 255, dtype=np.uint8)
-#     x0 = (size - new_w) // 2
-#     y0 = (size - new_h) // 2
-#     canvas[y0:y0+new_h, x0:x0+new_w] = resized
-#     return canvas
-#
-# def remove_background(img: np.ndarray, sigma: int = 35) -> np.ndarray:
-#     f = img.astype(np.float32)
-#     bg = cv2.GaussianBlur(f, (0, 0), sigma)
-#     diff = cv2.subtract(f, bg)
-#     norm = cv2.normalize(diff, None, 0, 255, cv2.NORM_MINMAX)
-#     return norm.astype(np.uint8)
-#
-# def enhance_contrast(img: np.ndarray, clip_limit=2.0, tile_grid_size=(4, 4)) -> np.ndarray:
-#     clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid_size)
-#     return clahe.apply(img)
-#
-# def unsharp_mask(img, ksize=(5, 5), amount=1.5):
-#     blur = cv2.GaussianBlur(img, ksize, 0)
-#     return cv2.addWeighted(img, 1 + amount, blur, -amount, 0)
-#
-# def adaptive_binarize(img):
-#     win_size = 25
-#     thresh = threshold_sauvola(img, window_size=win_size)
-#     binary = (img > thresh).astype(np.uint8) * 255
-#     return binary
-#
-# def deskew(img: np.ndarray) -> np.ndarray:
-#     coords = np.column_stack(np.where(img > 0))
-#     if coords.size == 0:
-#         return img
-#     angle = cv2.minAreaRect(coords)[-1]
-#     if angle < -45:
-#         angle = -(90 + angle)
-#     else:
-#         angle = -angle
-#     (h, w) = img.shape[:2]
-#     M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
-#     return cv2.warpAffine(img, M, (w, h), flags=cv2.INTER_CUBIC,
-#                           borderMode=cv2.BORDER_REPLICATE)
-#
-# def _fingerprint_bbox(binary_img: np.ndarray) -> tuple[int, int, int, int]:
-#     """Estimate bounding box of the fingerprint area on a binary/near-binary image.
-#     Assumes background is mostly white. Returns (x, y, w, h).
-#     Fallbacks to center box if nothing is found.
-#     """
-#     h, w = binary_img.shape[:2]
-#     # Consider anything not white as foreground
-#     mask = (binary_img < 250).astype(np.uint8) * 255
-#     if mask.sum() == 0:
-#         # fallback: center box
-#         cw, ch = int(w * 0.6), int(h * 0.6)
-#         cx, cy = w // 2, h // 2
-#         return max(0, cx - cw // 2), max(0, cy - ch // 2), cw, ch
-#
-#     # Connect ridges and remove tiny noise
-#     kernel = np.ones((5, 5), np.uint8)
-#     mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
-#     mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
-#
-#     cnts, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-#     if not cnts:
-#         cw, ch = int(w * 0.6), int(h * 0.6)
-#         cx, cy = w // 2, h // 2
-#         return max(0, cx - cw // 2), max(0, cy - ch // 2), cw, ch
-#
-#     c = max(cnts, key=cv2.contourArea)
-#     x, y, bw, bh = cv2.boundingRect(c)
-#     return x, y, bw, bh
-#
-# def crop_upper_two_thirds(img: np.ndarray, ref_for_bbox: np.ndarray | None = None,
-#                           zoom_factor: float = 1.15, pad: int = 8) -> np.ndarray:
-#     """Crop a zoomed region centered on the fingerprint and keep only the upper 2/3.
-#
-#     - ref_for_bbox: image used to detect bbox (binary preferred). If None, uses img.
-#     - zoom_factor > 1.0: values slightly >1 reduce the bbox (zoom in).
-#     - pad: small margin around the crop.
-#     """
-#     src = ref_for_bbox if ref_for_bbox is not None else img
-#     if src.ndim == 3:
-#         src_gray = cv2.cvtColor(src, cv2.COLOR_BGR2GRAY)
-#     else:
-#         src_gray = src
-#
-#     x, y, bw, bh = _fingerprint_bbox(src_gray)
-#
-#     # Zoom: shrink bbox around its center
-#     cx, cy = x + bw / 2.0, y + bh / 2.0
-#     zw, zh = int(round(bw / zoom_factor)), int(round(bh / zoom_factor))
-#     zx, zy = int(round(cx - zw / 2.0)), int(round(cy - zh / 2.0))
-#
-#     # Keep only upper 2/3 of the zoomed bbox
-#     upper_h = int(round(zh * (2.0 / 3.0)))
-#     x1 = max(0, zx - pad)
-#     y1 = max(0, zy - pad)
-#     x2 = min(img.shape[1], zx + zw + pad)
-#     y2 = min(img.shape[0], zy + upper_h + pad)
-#
-#     # Guard against invalid ranges
-#     if x2 <= x1 or y2 <= y1:
-#         return img.copy()
-#     return img[y1:y2, x1:x2].copy()
-#
-# def preprocess_phone_capture(img, size=512):
-#     gray = to_gray(img)
-#     gray = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
-#     return pad_to_square(gray, size)
-#
-# def save_with_dpi(path, arr, dpi=(500, 500)):
-#     im = Image.fromarray(arr)
-#     im.save(path, dpi=dpi)
-#
-# # -------------------------
-# # Phone capture pipeline
-# # -------------------------
-# def phone_pipeline(img: np.ndarray, block_size: int = 16):
-#     pre = preprocess_phone_capture(img)
-#     nobg = remove_background(pre)
-#     contrast = enhance_contrast(nobg)
-#     sharpened = unsharp_mask(contrast)
-#     binary = adaptive_binarize(sharpened)
-#     aligned = deskew(binary)
-#
-#     # Crop: zoom on center and keep upper 2/3 of the fingerprint
-#     aligned_upper23 = crop_upper_two_thirds(aligned, ref_for_bbox=aligned,
-#                                             zoom_factor=1.15, pad=8)
-#
-#     normalized = iitk_normalize(aligned.copy(), 100.0, 100.0)
-#     segmented, normim, mask = create_segmented_and_variance_images(normalized, block_size, 0.2)
-#     angles = calculate_angles(normalized, W=block_size, smoth=False)
-#     freq = ridge_freq(normim, mask, angles, block_size,
-#                       kernel_size=5, minWaveLength=5, maxWaveLength=15)
-#
-#     gabor_img = gabor_filter(normim, angles, freq)
-#     gabor_img = np.nan_to_num(gabor_img)
-#     gabor_img = cv2.normalize(gabor_img, None, 0, 255,
-#                               cv2.NORM_MINMAX).astype(np.uint8)
-#
-#     # Also provide a cropped version of the final skeleton-like output
-#     skeleton_upper23 = crop_upper_two_thirds(gabor_img, ref_for_bbox=aligned,
-#                                              zoom_factor=1.15, pad=8)
-#
-#     return {
-#         "preprocessed": pre,
-#         "background_removed": nobg,
-#         "contrast_enhanced": contrast,
-#         "sharpened": sharpened,
-#         "binary": binary,
-#         "aligned": aligned,
-#         "aligned_upper23": aligned_upper23,
-#         "skeleton": gabor_img,
-#         "skeleton_upper23": skeleton_upper23,
-#     }
-#
-# def phone_pipeline_base64(img: np.ndarray, block_size: int = 16) -> str:
-#     pre = preprocess_phone_capture(img)
-#     nobg = remove_background(pre)
-#     contrast = enhance_contrast(nobg)
-#     sharpened = unsharp_mask(contrast)
-#     binary = adaptive_binarize(sharpened)
-#     aligned = deskew(binary)
-#
-#     normalized = iitk_normalize(aligned.copy(), 100.0, 100.0)
-#     segmented, normim, mask = create_segmented_and_variance_images(normalized, block_size, 0.2)
-#     angles = calculate_angles(normalized, W=block_size, smoth=False)
-#     freq = ridge_freq(normim, mask, angles, block_size,
-#                       kernel_size=5, minWaveLength=5, maxWaveLength=15)
-#
-#     gabor_img = gabor_filter(normim, angles, freq)
-#     gabor_img = np.nan_to_num(gabor_img)
-#     gabor_img = cv2.normalize(gabor_img, None, 0, 255,
-#                               cv2.NORM_MINMAX).astype(np.uint8)
-#
-#     # Convert to base64
-#     _, buffer = cv2.imencode('.png', gabor_img)
-#     img_base64 = base64.b64encode(buffer).decode('utf-8')
-#
-#     return img_base64
-#
-# # -------------------------
-# # FastAPI Router
-# # -------------------------
-# router = APIRouter(prefix="/normalize-phone", tags=["normalize-phone"])
-#
-# @router.post("/enhance_phone")
-# async def enhance_fingerprint(file: UploadFile = File(...)):
-#     try:
-#         # Read uploaded file
-#         contents = await file.read()
-#         nparr = np.frombuffer(contents, np.uint8)
-#         img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-#
-#         if img is None:
-#             raise HTTPException(status_code=400, detail="Invalid image file")
-#
-#         # Rotate image 90 degrees clockwise
-#         rotated_img = cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
-#
-#         # Process image and get base64 result
-#         enhanced_image_base64 = phone_pipeline_base64(rotated_img)
-#
-#         return {
-#             "status": "success",
-#             "enhanced_image": enhanced_image_base64
-#         }
-#
-#     except Exception as e:
-#         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
-#
-# # -------------------------
-# # Augmentations
-# # -------------------------
-# def generate_rotations_and_flips(img: np.ndarray):
-#     """Generate rotated and flipped variants."""
-#     results = {}
-#     for angle in [90, 180, 270]:
-#         rot = cv2.rotate(img, {
-#             90: cv2.ROTATE_90_CLOCKWISE,
-#             180: cv2.ROTATE_180,
-#             270: cv2.ROTATE_90_COUNTERCLOCKWISE
-#         }[angle])
-#         results[f"rot{angle}"] = rot
-#         results[f"rot{angle}_flip"] = cv2.flip(rot, 1)  # horizontal flip
-#     return results
-#
-# # -------------------------
-# # CLI
-# # -------------------------
-# if __name__ == "__main__":
-#     import argparse
-#     ap = argparse.ArgumentParser()
-#     ap.add_argument("--input", required=True, help="Path to fingerprint image (phone capture on paper)")
-#     ap.add_argument("--outdir", default="out_phone", help="Output directory")
-#     args = ap.parse_args()
-#
-#     os.makedirs(args.outdir, exist_ok=True)
-#     img = cv2.imread(args.input, cv2.IMREAD_UNCHANGED)
-#     if img is None:
-#         raise FileNotFoundError(f"Could not read {args.input}")
-#
-#     outputs = phone_pipeline(img)
-#     stem = os.path.splitext(os.path.basename(args.input))[0]
-#
-#     # Save main pipeline outputs
-#     for key, arr in outputs.items():
-#         save_with_dpi(os.path.join(args.outdir, f"{stem}_{key}.png"), arr)
-#
-#     # Generate rotations + flips of final skeleton
-#     augments = generate_rotations_and_flips(outputs["skeleton"])
-#     for key, arr in augments.items():
-#         save_with_dpi(os.path.join(args.outdir, f"{stem}_{key}.png"), arr)
-#
-#     print(f"[OK] Saved results in {os.path.abspath(args.outdir)}")
+# normal_phone.py
+import os
+import io
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+import cv2
+import numpy as np
+import base64
+from PIL import Image
+
+from app.core.config import settings
+from app.modules.normalize_phone.constants import PHONE_PIPELINE_STAGES
+from app.modules.normalize_phone.executor import InvalidUploadError
+from app.modules.normalize_phone.tiled import tiled_skeleton
+
+from app.modules.normalize_phone.utils.binarization import sauvola_binarize
+from app.modules.normalize_phone.utils.normalization import normalize as iitk_normalize
+from app.modules.normalize_phone.utils.segmentation import create_segmented_and_variance_images
+from app.modules.normalize_phone.utils.orientation import calculate_angles
+from app.modules.normalize_phone.utils.frequency import ridge_freq
+from app.modules.normalize_phone.utils.minutiae import extract_minutiae
+from .utils.gabor_filter import gabor_filter
+
+# -------------------------
+# Utilities
+# -------------------------
+def to_gray(img: np.ndarray) -> np.ndarray:
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return img
+
+def pad_to_square(img: np.ndarray, size: int = 512) -> np.ndarray:
+    h, w = img.shape[:2]
+    scale = size / max(h, w)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    resized = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
+    canvas = np.full((size, size), 255, dtype=np.uint8)
+    x0 = (size - new_w) // 2
+    y0 = (size - new_h) // 2
+    canvas[y0:y0+new_h, x0:x0+new_w] = resized
+    return canvas
+
+def remove_background(img: np.ndarray, sigma: int = 35) -> np.ndarray:
+    f = img.astype(np.float32)
+    bg = cv2.GaussianBlur(f, (0, 0), sigma)
+    diff = cv2.subtract(f, bg)
+    norm = cv2.normalize(diff, None, 0, 255, cv2.NORM_MINMAX)
+    return norm.astype(np.uint8)
+
+@lru_cache(maxsize=8)
+def _clahe(clip_limit, tile_grid_size):
+    # CLAHE objects are reusable; build each configuration once per process
+    return cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid_size)
+
+def enhance_contrast(img: np.ndarray, clip_limit=2.0, tile_grid_size=(4, 4)) -> np.ndarray:
+    clahe = _clahe(clip_limit, tuple(tile_grid_size))
+    return clahe.apply(img)
+
+def unsharp_mask(img, ksize=(5, 5), amount=1.5):
+    blur = cv2.GaussianBlur(img, ksize, 0)
+    return cv2.addWeighted(img, 1 + amount, blur, -amount, 0)
+
+def adaptive_binarize(img):
+    win_size = 25
+    return sauvola_binarize(img, window_size=win_size)
+
+def deskew(img: np.ndarray) -> np.ndarray:
+    coords = np.column_stack(np.where(img > 0))
+    if coords.size == 0:
+        return img
+    angle = cv2.minAreaRect(coords)[-1]
+    if angle < -45:
+        angle = -(90 + angle)
+    else:
+        angle = -angle
+    (h, w) = img.shape[:2]
+    M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
+    return cv2.warpAffine(img, M, (w, h), flags=cv2.INTER_CUBIC,
+                          borderMode=cv2.BORDER_REPLICATE)
+
+def _fingerprint_bbox(binary_img: np.ndarray) -> tuple[int, int, int, int]:
+    """Estimate bounding box of the fingerprint area on a binary/near-binary image.
+    Assumes background is mostly white. Returns (x, y, w, h).
+    Fallbacks to center box if nothing is found.
+    """
+    h, w = binary_img.shape[:2]
+    # Consider anything not white as foreground
+    mask = (binary_img < 250).astype(np.uint8) * 255
+    if mask.sum() == 0:
+        # fallback: center box
+        cw, ch = int(w * 0.6), int(h * 0.6)
+        cx, cy = w // 2, h // 2
+        return max(0, cx - cw // 2), max(0, cy - ch // 2), cw, ch
+
+    # Connect ridges and remove tiny noise
+    kernel = np.ones((5, 5), np.uint8)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
+
+    cnts, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not cnts:
+        cw, ch = int(w * 0.6), int(h * 0.6)
+        cx, cy = w // 2, h // 2
+        return max(0, cx - cw // 2), max(0, cy - ch // 2), cw, ch
+
+    c = max(cnts, key=cv2.contourArea)
+    x, y, bw, bh = cv2.boundingRect(c)
+    return x, y, bw, bh
+
+def crop_upper_two_thirds(img: np.ndarray, ref_for_bbox: np.ndarray | None = None,
+                          zoom_factor: float = 1.15, pad: int = 8) -> np.ndarray:
+    """Crop a zoomed region centered on the fingerprint and keep only the upper 2/3.
+
+    - ref_for_bbox: image used to detect bbox (binary preferred). If None, uses img.
+    - zoom_factor > 1.0: values slightly >1 reduce the bbox (zoom in).
+    - pad: small margin around the crop.
+    """
+    src = ref_for_bbox if ref_for_bbox is not None else img
+    if src.ndim == 3:
+        src_gray = cv2.cvtColor(src, cv2.COLOR_BGR2GRAY)
+    else:
+        src_gray = src
+
+    x, y, bw, bh = _fingerprint_bbox(src_gray)
+
+    # Zoom: shrink bbox around its center
+    cx, cy = x + bw / 2.0, y + bh / 2.0
+    zw, zh = int(round(bw / zoom_factor)), int(round(bh / zoom_factor))
+    zx, zy = int(round(cx - zw / 2.0)), int(round(cy - zh / 2.0))
+
+    # Keep only upper 2/3 of the zoomed bbox
+    upper_h = int(round(zh * (2.0 / 3.0)))
+    x1 = max(0, zx - pad)
+    y1 = max(0, zy - pad)
+    x2 = min(img.shape[1], zx + zw + pad)
+    y2 = min(img.shape[0], zy + upper_h + pad)
+
+    # Guard against invalid ranges
+    if x2 <= x1 or y2 <= y1:
+        return img.copy()
+    return img[y1:y2, x1:x2].copy()
+
+# "nlm" denoises the full-resolution capture with non-local means before downsizing (the original
+# behaviour); the other modes downsize first, which already averages most sensor noise away, and
+# then clean up the small image
+DENOISE_MODES = ("nlm", "nlm_small", "bilateral", "gaussian", "none")
+
+def denoise_small(img: np.ndarray, mode: str) -> np.ndarray:
+    if mode == "nlm_small":
+        return cv2.fastNlMeansDenoising(img, None, 4, 7, 21)
+    if mode == "bilateral":
+        return cv2.bilateralFilter(img, 5, 25, 5)
+    if mode == "gaussian":
+        return cv2.GaussianBlur(img, (3, 3), 0)
+    return img
+
+def preprocess_phone_capture(img, size=512, denoise: str | None = None):
+    """Grayscale, denoise and pad to a size x size square; size=None keeps the native resolution."""
+    mode = denoise or settings.PIPELINE_DENOISE
+    if mode not in DENOISE_MODES:
+        raise ValueError(f"Unknown denoise mode {mode!r}; choose from {', '.join(DENOISE_MODES)}")
+    gray = to_gray(img)
+    if mode == "nlm":
+        gray = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
+        return pad_to_square(gray, size) if size else gray
+    return denoise_small(pad_to_square(gray, size) if size else gray, mode)
+
+def save_with_dpi(path, arr, dpi=(500, 500)):
+    im = Image.fromarray(arr)
+    im.save(path, dpi=dpi)
+
+# -------------------------
+# Phone capture pipeline
+# -------------------------
+# Stage graph: name -> (inputs, fn(block_size, *inputs)). "capture" is the input image; every other
+# name is the result of its stage. The public outputs are listed in PHONE_PIPELINE_STAGES.
+PHONE_PIPELINE_GRAPH = {
+    "preprocessed": (("capture",), lambda bs, capture: preprocess_phone_capture(capture)),
+    "background_removed": (("preprocessed",), lambda bs, pre: remove_background(pre)),
+    "contrast_enhanced": (("background_removed",), lambda bs, nobg: enhance_contrast(nobg)),
+    "sharpened": (("contrast_enhanced",), lambda bs, contrast: unsharp_mask(contrast)),
+    "binary": (("sharpened",), lambda bs, sharpened: adaptive_binarize(sharpened)),
+    "aligned": (("binary",), lambda bs, binary: deskew(binary)),
+    # Crop: zoom on center and keep upper 2/3 of the fingerprint
+    "aligned_upper23": (("aligned",), lambda bs, aligned: crop_upper_two_thirds(
+        aligned, ref_for_bbox=aligned, zoom_factor=1.15, pad=8)),
+    "normalized": (("aligned",), lambda bs, aligned: iitk_normalize(aligned, 100.0, 100.0)),
+    # (normim, mask); the segmented image itself is not used downstream
+    "segmentation": (("normalized",), lambda bs, normalized: create_segmented_and_variance_images(
+        normalized, bs, 0.2)[1:]),
+    "orientation": (("normalized",), lambda bs, normalized: calculate_angles(normalized, W=bs, smoth=False)),
+    "frequency": (("segmentation", "orientation"), lambda bs, seg, angles: ridge_freq(
+        seg[0], seg[1], angles, bs, kernel_size=5, minWaveLength=5, maxWaveLength=15)),
+    "skeleton": (("segmentation", "orientation", "frequency"), lambda bs, seg, angles, freq: cv2.normalize(
+        np.nan_to_num(gabor_filter(seg[0], angles, freq)), None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)),
+    # Also provide a cropped version of the final skeleton-like output
+    "skeleton_upper23": (("skeleton", "aligned"), lambda bs, gabor_img, aligned: crop_upper_two_thirds(
+        gabor_img, ref_for_bbox=aligned, zoom_factor=1.15, pad=8)),
+    # Template rather than an image, so not one of PHONE_PIPELINE_STAGES
+    "minutiae": (("skeleton", "segmentation", "orientation"), lambda bs, gabor_img, seg, angles: extract_minutiae(
+        gabor_img, seg[1], angles, bs)),
+}
+
+# Side the block size and ridge wavelength bounds above are tuned for (preprocess_phone_capture's default)
+TUNED_SIZE = 512
+
+def native_skeleton(block_size: int, aligned: np.ndarray) -> np.ndarray:
+    """Tiled skeleton of a capture kept at its own resolution. The capture is max(h, w) / 512 times
+    larger than what the 512x512 settings expect, and so are its ridge periods, so the frequency
+    blocks, wavelength bounds and peak kernel grow by the same factor. The orientation blocks stay
+    put: the Gabor stage reads orientations on its fixed 16 pixel grid."""
+    scale = max(max(aligned.shape) / TUNED_SIZE, 1.0)
+    return tiled_skeleton(
+        aligned,
+        block_size,
+        frequency_block_size=block_size * max(int(round(scale)), 1),
+        kernel_size=int(round(5 * scale)) | 1,
+        min_wave_length=5 * scale,
+        max_wave_length=15 * scale,
+    )
+
+# Native resolution: no padding to 512x512, and the float-heavy skeleton chain runs tile by tile
+# within PIPELINE_TILE_MEMORY
+PHONE_PIPELINE_NATIVE_GRAPH = {
+    **PHONE_PIPELINE_GRAPH,
+    "preprocessed": (("capture",), lambda bs, capture: preprocess_phone_capture(capture, size=None)),
+    "skeleton": (("aligned",), native_skeleton),
+}
+
+def _stage_order(outputs, graph=PHONE_PIPELINE_GRAPH) -> list[str]:
+    """Stages needed for `outputs`, each after its inputs."""
+    order, seen = [], {"capture"}
+
+    def visit(name):
+        if name in seen:
+            return
+        if name not in graph:
+            raise ValueError(f"Unknown pipeline stage {name!r}")
+        seen.add(name)
+        for dep in graph[name][0]:
+            visit(dep)
+        order.append(name)
+
+    for name in outputs:
+        visit(name)
+    return order
+
+def phone_pipeline(img: np.ndarray, block_size: int = 16, outputs=PHONE_PIPELINE_STAGES,
+                   timings: dict | None = None, graph=PHONE_PIPELINE_GRAPH) -> dict:
+    """Run the stages `outputs` depend on and return those outputs by name.
+
+    Each intermediate is released as soon as the last stage reading it has run, so asking for
+    the skeleton alone keeps only a few 512x512 buffers alive at a time.
+    """
+    order = _stage_order(outputs, graph)
+    readers = {}
+    for name in order:
+        for dep in graph[name][0]:
+            readers[dep] = readers.get(dep, 0) + 1
+
+    results = {"capture": img}
+    for name in order:
+        deps, fn = graph[name]
+        with timed_stage(timings, name):
+            results[name] = fn(block_size, *(results[dep] for dep in deps))
+        for dep in deps:
+            readers[dep] -= 1
+            if readers[dep] == 0 and dep not in outputs:
+                del results[dep]
+
+    return {name: results[name] for name in outputs}
+
+@contextmanager
+def timed_stage(timings: dict | None, name: str):
+    """Record the wall time of a pipeline stage in milliseconds when `timings` is given."""
+    start = time.perf_counter()
+    yield
+    if timings is not None:
+        timings[name] = (time.perf_counter() - start) * 1e3
+
+def phone_pipeline_native(img: np.ndarray, block_size: int = 16, outputs=("skeleton",),
+                          timings: dict | None = None) -> dict:
+    """phone_pipeline at the capture's own resolution, for high-dpi scanners."""
+    return phone_pipeline(img, block_size, outputs=outputs, timings=timings, graph=PHONE_PIPELINE_NATIVE_GRAPH)
+
+def phone_pipeline_skeleton(img: np.ndarray, block_size: int = 16, timings: dict | None = None) -> np.ndarray:
+    return phone_pipeline(img, block_size, outputs=("skeleton",), timings=timings)["skeleton"]
+
+def phone_pipeline_minutiae(img: np.ndarray, block_size: int = 16, timings: dict | None = None) -> np.ndarray:
+    """Minutiae template (MINUTIA_DTYPE structured array) of a capture."""
+    return phone_pipeline(img, block_size, outputs=("minutiae",), timings=timings)["minutiae"]
+
+def phone_pipeline_base64(img: np.ndarray, block_size: int = 16, timings: dict | None = None) -> str:
+    gabor_img = phone_pipeline_skeleton(img, block_size, timings)
+
+    # Convert to base64
+    with timed_stage(timings, "encode"):
+        _, buffer = cv2.imencode('.png', gabor_img)
+        img_base64 = base64.b64encode(buffer).decode('utf-8')
+
+    return img_base64
+
+# -------------------------
+# Output encodings
+# -------------------------
+def encode_image(arr: np.ndarray, media_type: str, compression: int) -> bytes:
+    """Encode a uint8 image as raw bytes or a lossless PNG/WebP at the given 0-9 compression level."""
+    if media_type == "application/octet-stream":
+        return np.ascontiguousarray(arr).tobytes()
+    if media_type == "image/webp":
+        buffer = io.BytesIO()
+        # WebP effort ("method") runs 0-6
+        Image.fromarray(arr).save(buffer, format="WEBP", lossless=True, method=round(compression * 6 / 9))
+        return buffer.getvalue()
+    _, buffer = cv2.imencode('.png', arr, [cv2.IMWRITE_PNG_COMPRESSION, compression])
+    return buffer.tobytes()
+
+def image_headers(arr: np.ndarray) -> dict:
+    return {"X-Image-Shape": ",".join(map(str, arr.shape)), "X-Image-Dtype": str(arr.dtype)}
+
+def decode_upload(contents: bytes) -> np.ndarray:
+    """Decode an uploaded capture and orient it. Raises InvalidUploadError when it is not an image."""
+    nparr = np.frombuffer(contents, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if img is None:
+        raise InvalidUploadError("Invalid image file")
+
+    # Rotate image 90 degrees clockwise
+    return cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
+
+def enhance_phone_upload(contents: bytes) -> tuple[str, dict]:
+    """Worker entry point: decode an uploaded capture, orient it and run the base64 pipeline.
+
+    Returns the base64 PNG and the per-stage timings in milliseconds.
+    Raises InvalidUploadError when the bytes are not a decodable image.
+    """
+    timings = {}
+    with timed_stage(timings, "decode"):
+        rotated_img = decode_upload(contents)
+
+    enhanced_image_base64 = phone_pipeline_base64(rotated_img, timings=timings)
+    return enhanced_image_base64, timings
+
+def enhance_phone_upload_as(contents: bytes, media_type: str, stages: tuple[str, ...],
+                            compression: int) -> tuple[bytes, dict, dict]:
+    """Worker entry point for the binary output modes.
+
+    Returns the response body, its headers (content type included) and the per-stage timings.
+    """
+    timings = {}
+    with timed_stage(timings, "decode"):
+        rotated_img = decode_upload(contents)
+
+    outputs = phone_pipeline(rotated_img, outputs=stages, timings=timings)
+
+    with timed_stage(timings, "encode"):
+        if media_type != "multipart/mixed":
+            arr = outputs[stages[0]]
+            return encode_image(arr, media_type, compression), {"Content-Type": media_type, **image_headers(arr)}, timings
+
+        # One lossless PNG part per requested stage
+        boundary = os.urandom(16).hex()
+        body = io.BytesIO()
+        for stage in stages:
+            arr = outputs[stage]
+            part_headers = {
+                "Content-Type": "image/png",
+                "Content-Disposition": f'inline; name="{stage}"; filename="{stage}.png"',
+                **image_headers(arr),
+            }
+            body.write(f"--{boundary}\r\n".encode())
+            body.write("".join(f"{key}: {value}\r\n" for key, value in part_headers.items()).encode())
+            body.write(b"\r\n")
+            body.write(encode_image(arr, "image/png", compression))
+            body.write(b"\r\n")
+        body.write(f"--{boundary}--\r\n".encode())
+        return body.getvalue(), {"Content-Type": f"multipart/mixed; boundary={boundary}"}, timings
+
+# -------------------------
+# Augmentations
+# -------------------------
+def generate_rotations_and_flips(img: np.ndarray):
+    """Generate rotated and flipped variants."""
+    results = {}
+    for angle in [90, 180, 270]:
+        rot = cv2.rotate(img, {
+            90: cv2.ROTATE_90_CLOCKWISE,
+            180: cv2.ROTATE_180,
+            270: cv2.ROTATE_90_COUNTERCLOCKWISE
+        }[angle])
+        results[f"rot{angle}"] = rot
+        results[f"rot{angle}_flip"] = cv2.flip(rot, 1)  # horizontal flip
+    return results
+
+# -------------------------
+# CLI
+# -------------------------
+AUGMENT_NAMES = tuple(f"rot{angle}{flip}" for angle in (90, 180, 270) for flip in ("", "_flip"))
+
+def encode_with_dpi(arr, dpi=(500, 500)) -> bytes:
+    """PNG bytes of `arr` as save_with_dpi would write them."""
+    buffer = io.BytesIO()
+    Image.fromarray(arr).save(buffer, format="PNG", dpi=dpi)
+    return buffer.getvalue()
+
+def input_root(paths: list[str]) -> str:
+    """Deepest directory holding every input: outputs mirror the inputs' paths below it."""
+    return os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+
+def cli_output_paths(path: str, outdir: str, root: str | None = None) -> dict:
+    """Output file per pipeline stage and skeleton augmentation for the capture at `path`, in the
+    subdirectory of `outdir` that mirrors its directory below `root` (default: its own directory)."""
+    path = os.path.abspath(path)
+    stem = os.path.splitext(os.path.relpath(path, root or os.path.dirname(path)))[0]
+    return {key: os.path.join(outdir, f"{stem}_{key}.png") for key in (*PHONE_PIPELINE_STAGES, *AUGMENT_NAMES)}
+
+def plan_outputs(paths: list[str], outdir: str) -> dict:
+    """Output files of every input. Raises ValueError when two inputs would write the same files
+    (x.png and x.jpg in one directory), rather than have the second overwrite the first or be
+    skipped as done by a resumed run."""
+    root = input_root(paths) if paths else outdir
+    plan, owners = {}, {}
+    for path in paths:
+        plan[path] = cli_output_paths(path, outdir, root)
+        for target in plan[path].values():
+            first = owners.setdefault(target, path)
+            if first != path:
+                raise ValueError(f"{first} and {path} would both be written to {target}; rename one of them")
+    return plan
+
+def enhance_capture_file(contents: bytes, native: bool = False) -> dict:
+    """Worker entry point for the CLI: decode a capture file, run the full pipeline plus the skeleton
+    augmentations and return the encoded PNG per output name. Encoding happens here, in parallel,
+    so the parent only has to write bytes."""
+    img = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise InvalidUploadError("Invalid image file")
+    graph = PHONE_PIPELINE_NATIVE_GRAPH if native else PHONE_PIPELINE_GRAPH
+    outputs = phone_pipeline(img, graph=graph)
+    outputs.update(generate_rotations_and_flips(outputs["skeleton"]))
+    return {key: encode_with_dpi(arr) for key, arr in outputs.items()}
+
+def _write_atomic(path: str, data: bytes):
+    # A run killed mid-write must not leave a truncated file that a resumed run would skip
+    tmp = f"{path}.part"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def expand_inputs(pattern: str) -> list[str]:
+    """A single file, every file in a directory, or the files matching a glob (** recurses)."""
+    import glob
+    if os.path.isdir(pattern):
+        return sorted(os.path.join(pattern, name) for name in os.listdir(pattern)
+                      if os.path.isfile(os.path.join(pattern, name)))
+    if os.path.isfile(pattern):
+        return [pattern]
+    return sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+
+def _prefetch(paths, queue, stop):
+    # Reader thread: keeps at most queue.maxsize files in memory ahead of the workers
+    for path in paths:
+        if stop.is_set():
+            break
+        try:
+            with open(path, "rb") as f:
+                item = (path, f.read(), None)
+        except OSError as exc:
+            item = (path, None, exc)
+        queue.put(item)
+    queue.put(None)
+
+def run_batch(paths: list[str], outdir: str, jobs: int = 1, prefetch: int = 8, overwrite: bool = False,
+              native: bool = False) -> dict:
+    """
+    Enhance every capture in `paths` into `outdir` on `jobs` worker processes, in subdirectories
+    mirroring those of the inputs (see `plan_outputs`).
+
+    A reader thread prefetches at most `prefetch` files, at most two captures per worker are in
+    flight, and PNGs are written by a small thread pool while the workers carry on. Captures whose
+    outputs all exist already are skipped unless `overwrite` is set, so an interrupted run resumes
+    where it stopped. With `native` captures are enhanced at their own resolution. Returns the run
+    counters.
+    """
+    import queue
+    import threading
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+    plan = plan_outputs(paths, outdir)
+    for directory in {os.path.dirname(targets["skeleton"]) for targets in plan.values()} | {outdir}:
+        os.makedirs(directory, exist_ok=True)
+    stats = {"total": len(paths), "processed": 0, "skipped": 0, "failed": 0, "bytes_written": 0}
+    todo = []
+    for path in paths:
+        if not overwrite and all(os.path.exists(out) for out in plan[path].values()):
+            stats["skipped"] += 1
+        else:
+            todo.append(path)
+
+    start = time.perf_counter()
+    files, stop = queue.Queue(maxsize=max(prefetch, 1)), threading.Event()
+    reader = threading.Thread(target=_prefetch, args=(todo, files, stop), daemon=True)
+    reader.start()
+
+    def report():
+        finished = stats["processed"] + stats["failed"]
+        rate = stats["processed"] / max(time.perf_counter() - start, 1e-9)
+        print(f"\r[{finished}/{len(todo)}] {rate:.2f} img/s", end="", flush=True)
+
+    with ProcessPoolExecutor(max_workers=jobs) as workers, ThreadPoolExecutor(max_workers=4) as writers:
+        in_flight, writes = {}, []
+
+        def collect(futures):
+            for future in futures:
+                path = in_flight.pop(future)
+                try:
+                    encoded = future.result()
+                except Exception as exc:
+                    stats["failed"] += 1
+                    print(f"\n[FAIL] {path}: {exc}")
+                    continue
+                targets = plan[path]
+                for key, data in encoded.items():
+                    writes.append(writers.submit(_write_atomic, targets[key], data))
+                    stats["bytes_written"] += len(data)
+                stats["processed"] += 1
+            # Surface write errors, and wait for the disk when it falls far behind the workers
+            for write in [w for w in writes if w.done()]:
+                writes.remove(write)
+                write.result()
+            while len(writes) > 16 * len(AUGMENT_NAMES + PHONE_PIPELINE_STAGES):
+                writes.pop(0).result()
+            report()
+
+        try:
+            while (item := files.get()) is not None:
+                path, contents, error = item
+                if error is not None:
+                    stats["failed"] += 1
+                    print(f"\n[FAIL] {path}: {error}")
+                    continue
+                in_flight[workers.submit(enhance_capture_file, contents, native)] = path
+                if len(in_flight) >= 2 * jobs:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+            if in_flight:
+                collect(list(in_flight))
+        finally:
+            stop.set()
+            for w in writes:
+                w.result()
+    if todo:
+        print()
+
+    stats["elapsed"] = time.perf_counter() - start
+    return stats
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--input", required=True,
+                    help="Fingerprint image (phone capture on paper), a directory of them, or a glob")
+    ap.add_argument("--outdir", default="out_phone", help="Output directory")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    ap.add_argument("--prefetch", type=int, default=8, help="Files read ahead of the workers")
+    ap.add_argument("--overwrite", action="store_true", help="Re-process captures whose outputs already exist")
+    ap.add_argument("--native", action="store_true",
+                    help="Enhance at the capture's own resolution instead of 512x512 (tiled, for high-dpi scans)")
+    args = ap.parse_args()
+
+    paths = expand_inputs(args.input)
+    if not paths:
+        raise FileNotFoundError(f"Could not read {args.input}")
+
+    stats = run_batch(paths, args.outdir, jobs=max(args.jobs, 1), prefetch=args.prefetch, overwrite=args.overwrite,
+                      native=args.native)
+    elapsed = stats["elapsed"]
+    print(f"[OK] {stats['processed']} processed, {stats['skipped']} skipped, {stats['failed']} failed "
+          f"of {stats['total']} in {elapsed:.1f} s "
+          f"({stats['processed'] / max(elapsed, 1e-9):.2f} img/s, "
+          f"{stats['bytes_written'] / max(elapsed, 1e-9) / 1e6:.1f} MB/s written)")
+    print(f"[OK] Saved results in {os.path.abspath(args.outdir)}")
@@ -0,0 +1,255 @@
+import io
+import json
+import os
+import time
+import zipfile
+from concurrent.futures.process import BrokenProcessPool
+from typing import List
+
+from fastapi import APIRouter, File, Header, Query, UploadFile, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from app.core.config import settings
+from app.modules.normalize_phone.cache import result_cache
+from app.modules.normalize_phone.constants import OUTPUT_MEDIA_TYPES, PHONE_PIPELINE_STAGES, PIPELINE_VERSION
+from app.modules.normalize_phone.executor import (
+    InvalidUploadError, PipelineBusyError, PipelineCrashedError, pipeline_executor,
+)
+
+# The pipeline (OpenCV, SciPy, Pillow) is only imported by the worker processes; the API process
+# refers to its entry points by name
+ENHANCE_UPLOAD = "app.modules.normalize_phone.pipeline:enhance_phone_upload"
+ENHANCE_UPLOAD_AS = "app.modules.normalize_phone.pipeline:enhance_phone_upload_as"
+
+router = APIRouter(prefix="/normalize-phone", tags=["normalize-phone"])
+
+
+def negotiate_media_type(accept: str | None) -> str | None:
+    """Pick the preferred supported output type from an Accept header (JSON when absent or */*)."""
+    if not accept:
+        return "application/json"
+    candidates = []
+    for position, entry in enumerate(accept.split(",")):
+        media_type, *params = [part.strip() for part in entry.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        candidates.append((-quality, position, media_type.lower()))
+
+    for negative_quality, _, media_type in sorted(candidates):
+        if negative_quality == 0:
+            break
+        if media_type in ("*/*", "application/*"):
+            return "application/json"
+        if media_type == "image/*":
+            return "image/png"
+        if media_type in OUTPUT_MEDIA_TYPES:
+            return media_type
+    return None
+
+
+def parse_stages(stages: str, media_type: str) -> tuple[str, ...]:
+    """Stages requested as a comma-separated list, checked against what `media_type` can carry."""
+    requested = tuple(stage.strip() for stage in stages.split(",") if stage.strip())
+    unknown = [stage for stage in requested if stage not in PHONE_PIPELINE_STAGES]
+    if not requested or unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown stages {unknown}; choose from {', '.join(PHONE_PIPELINE_STAGES)}")
+    if media_type != "multipart/mixed" and len(requested) > 1:
+        raise HTTPException(status_code=400, detail="Several stages can only be returned as multipart/mixed")
+    if media_type == "application/json" and requested != ("skeleton",):
+        raise HTTPException(status_code=400, detail="JSON output only carries the skeleton")
+    return requested
+
+
+def _cache_key(contents: bytes, *params) -> str:
+    # Everything that changes the output besides the request parameters
+    return result_cache.key(contents, PIPELINE_VERSION, settings.PIPELINE_DENOISE, *params)
+
+
+def server_timing(timings: dict) -> str:
+    return ", ".join(f"{name};dur={duration:.1f}" for name, duration in timings.items())
+
+
+@router.post("/enhance_phone")
+async def enhance_fingerprint(
+    file: UploadFile = File(...),
+    accept: str | None = Header(None),
+    stages: str = "skeleton",
+    compression: int = Query(settings.PIPELINE_PNG_COMPRESSION, ge=0, le=9),
+):
+    """Enhance one capture. The output format follows the Accept header:
+
+    - application/json (default): base64 PNG of the skeleton
+    - application/octet-stream: raw uint8 pixels, shape in X-Image-Shape
+    - image/png, image/webp: lossless image at `compression` level 0-9
+    - multipart/mixed: one PNG part per stage listed in `stages`
+    """
+    media_type = negotiate_media_type(accept)
+    if media_type is None:
+        raise HTTPException(status_code=406, detail=f"Supported types: {', '.join(OUTPUT_MEDIA_TYPES)}")
+    requested = parse_stages(stages, media_type)
+
+    # Read uploaded file
+    contents = await file.read()
+
+    # Retried uploads of the same capture are answered from the result cache
+    start = time.perf_counter()
+    if media_type == "application/json":
+        cache_key = _cache_key(contents, media_type)
+    else:
+        cache_key = _cache_key(contents, media_type, requested, compression)
+    cached = await result_cache.get(cache_key)
+    if cached is not None:
+        body, headers = cached
+        timings = {"cache": (time.perf_counter() - start) * 1e3}
+        return _enhance_response(media_type, body, dict(headers), timings, "HIT")
+
+    # Decoding and enhancement run in a worker process so the event loop keeps serving door checks
+    try:
+        if media_type == "application/json":
+            enhanced_image_base64, timings = await pipeline_executor.run(ENHANCE_UPLOAD, contents)
+            body, headers = enhanced_image_base64.encode(), {}
+        else:
+            body, headers, timings = await pipeline_executor.run(
+                ENHANCE_UPLOAD_AS, contents, media_type, requested, compression
+            )
+    except PipelineCrashedError:
+        raise HTTPException(status_code=503, detail="Enhancement worker crashed, retry later",
+                            headers={"Retry-After": "1"})
+    except PipelineBusyError:
+        raise HTTPException(status_code=503, detail="Enhancement queue is full, retry later",
+                            headers={"Retry-After": "1"})
+    except InvalidUploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
+
+    total = (time.perf_counter() - start) * 1e3
+    timings["queue"] = max(total - sum(timings.values()), 0.0)
+    timings["total"] = total
+
+    await result_cache.put(cache_key, body, headers)
+    return _enhance_response(media_type, body, dict(headers), timings, "MISS")
+
+
+def _enhance_response(media_type: str, body: bytes, headers: dict, timings: dict, cache_status: str) -> Response:
+    headers.update({"Server-Timing": server_timing(timings), "X-Cache": cache_status})
+    if media_type != "application/json":
+        content_type = headers.pop("Content-Type")
+        return Response(body, media_type=content_type, headers=headers)
+
+    return JSONResponse(
+        {
+            "status": "success",
+            "enhanced_image": body.decode()
+        },
+        headers=headers,
+    )
+
+
+@router.get("/cache")
+async def result_cache_stats():
+    """Hit/miss counters and occupancy of this process's enhancement result cache."""
+    return result_cache.stats()
+
+
+def batch_uploads(uploads: list[tuple[str, bytes]]) -> list[tuple[str, bytes]]:
+    """Expand zip archives among the uploaded files into their member images. The member count and
+    the sizes the archives declare are checked before any member is inflated, so a zip bomb is
+    rejected with 413 instead of expanding into memory (and into the jobs table). Plain uploads
+    count towards the same size limits."""
+    images = []
+    total = 0
+    for filename, contents in uploads:
+        if not zipfile.is_zipfile(io.BytesIO(contents)):
+            if len(contents) > settings.PIPELINE_MAX_IMAGE_BYTES:
+                raise HTTPException(status_code=413, detail=f"{filename} is too large")
+            total += len(contents)
+            if total > settings.PIPELINE_MAX_BATCH_BYTES:
+                raise HTTPException(status_code=413, detail="Batch is too large")
+            images.append((filename, contents))
+            continue
+        try:
+            with zipfile.ZipFile(io.BytesIO(contents)) as archive:
+                members = [
+                    member for member in archive.infolist()
+                    if not member.is_dir() and not os.path.basename(member.filename).startswith(".")
+                    and os.path.basename(member.filename) and "__MACOSX" not in member.filename
+                ]
+                if len(images) + len(members) > settings.PIPELINE_MAX_BATCH:
+                    raise HTTPException(status_code=413,
+                                        detail=f"At most {settings.PIPELINE_MAX_BATCH} images per batch")
+                for member in members:
+                    if member.file_size > settings.PIPELINE_MAX_IMAGE_BYTES:
+                        raise HTTPException(status_code=413, detail=f"{member.filename} is too large")
+                total += sum(member.file_size for member in members)
+                if total > settings.PIPELINE_MAX_BATCH_BYTES:
+                    raise HTTPException(status_code=413, detail="Batch is too large once uncompressed")
+                # ZipFile never reads past the declared file_size, so the checks above bound this
+                images.extend((member.filename, archive.read(member)) for member in members)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail=f"Invalid zip archive: {filename}")
+    return images
+
+
+@router.post("/enhance_phone/batch")
+async def enhance_fingerprint_batch(files: List[UploadFile] = File(...)):
+    """Enhance several captures (or zip archives of captures) in one request.
+
+    Results are streamed back as NDJSON, one line per image in completion order. Once the stream
+    has started, failures (including a full queue or a crashed worker) are reported per image.
+    """
+    images = batch_uploads([(file.filename, await file.read()) for file in files])
+    if not images:
+        raise HTTPException(status_code=400, detail="No images in upload")
+    if len(images) > settings.PIPELINE_MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {settings.PIPELINE_MAX_BATCH} images per batch")
+
+    keys = [_cache_key(data, "application/json") for _, data in images]
+    hits = [await result_cache.get(key) for key in keys]
+    misses = [index for index, cached in enumerate(hits) if cached is None]
+    # Only while a 503 can still be answered, and only if anything has to run at all
+    if misses:
+        try:
+            pipeline_executor.check_capacity()
+        except PipelineBusyError:
+            raise HTTPException(status_code=503, detail="Enhancement queue is full, retry later",
+                                headers={"Retry-After": "1"})
+
+    async def results():
+        for index, cached in enumerate(hits):
+            if cached is not None:
+                line = {"index": index, "filename": images[index][0], "status": "success",
+                        "enhanced_image": cached[0].decode(), "cached": True}
+                yield json.dumps(line) + "\n"
+
+        pending = set(misses)
+        contents = [images[index][1] for index in misses]
+        try:
+            async for position, future in pipeline_executor.map_unordered(ENHANCE_UPLOAD, contents):
+                index = misses[position]
+                pending.discard(index)
+                line = {"index": index, "filename": images[index][0]}
+                try:
+                    enhanced_image_base64, timings = future.result()
+                    await result_cache.put(keys[index], enhanced_image_base64.encode(), {})
+                    line.update(status="success", enhanced_image=enhanced_image_base64, timings=timings)
+                except InvalidUploadError as e:
+                    line.update(status="error", detail=str(e))
+                except BrokenProcessPool:
+                    line.update(status="error", detail="Enhancement worker crashed, retry later")
+                except Exception as e:
+                    line.update(status="error", detail=f"Error processing image: {str(e)}")
+                yield json.dumps(line) + "\n"
+        except PipelineBusyError:
+            # The queue filled up after the check above; the response has started, so report per image
+            for index in sorted(pending):
+                line = {"index": index, "filename": images[index][0], "status": "error",
+                        "detail": "Enhancement queue is full, retry later"}
+                yield json.dumps(line) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
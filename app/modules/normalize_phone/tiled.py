@@ -0,0 +1,260 @@
+"""
+Tiled execution of the normalize -> segment -> orientation -> frequency -> Gabor chain, so captures
+can be enhanced at native resolution without a dozen full-frame float64 arrays alive at once.
+
+Each stage only needs a few global statistics (image mean and variance, the segmentation threshold,
+the background mean and deviation, the median ridge frequency) plus a small neighbourhood around
+every pixel. The image is therefore swept tile by tile several times: the early sweeps reduce the
+statistics and the block-level orientation map, the last one filters every tile together with a
+halo wide enough for the mask morphology and the Gabor kernels. Only block-level arrays and the
+uint8 output are full-frame; float buffers never exceed one tile plus its halo.
+
+The result matches the skeleton stage of `phone_pipeline` on the same image, up to float rounding
+of the global statistics.
+"""
+import math
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+from app.modules.normalize_phone.utils.frequency import _project_blocks, _wavelengths
+from app.modules.normalize_phone.utils.gabor_filter import gabor_bank, gabor_filter
+from app.modules.normalize_phone.utils.normalization import normalize
+from app.modules.normalize_phone.utils.orientation import calculate_angles
+from app.modules.normalize_phone.utils.segmentation import _block_sums, _mask_kernel
+
+# gabor_filter picks its filter on a fixed 16 pixel block grid
+GABOR_GRID = 16
+# Tile-sized float64 buffers alive at once in the heaviest sweep (gradients, integral images,
+# Gabor responses); turns a memory budget into a tile side
+_TILE_BUFFERS = 10
+
+
+def tile_side(memory_budget: int, block_size: int = 16) -> int:
+    """Largest tile side, a multiple of both block grids, whose working set fits `memory_budget` bytes."""
+    grid = math.lcm(block_size, GABOR_GRID)
+    side = math.isqrt(max(memory_budget, 0) // (_TILE_BUFFERS * 8)) - 8 * block_size
+    return max(grid, side // grid * grid)
+
+
+def _tiles(rows, cols, tile):
+    for y0 in range(0, rows, tile):
+        for x0 in range(0, cols, tile):
+            yield y0, min(y0 + tile, rows), x0, min(x0 + tile, cols)
+
+
+def _weighted_median(values, weights):
+    """np.median of `values` repeated `weights` times, without materialising the repeats."""
+    total = int(weights.sum())
+    if total == 0:
+        return np.nan
+    order = np.argsort(values, kind="stable")
+    values, cum = values[order], np.cumsum(weights[order])
+    lo = values[np.searchsorted(cum, (total - 1) // 2, side="right")]
+    hi = values[np.searchsorted(cum, total // 2, side="right")]
+    return (lo + hi) / 2
+
+
+class _TiledChain:
+    """Global statistics of one image, gathered sweep by sweep; see `tiled_skeleton`."""
+
+    def __init__(self, img, block_size, tile, m0, v0, threshold):
+        self.img = img
+        self.w = block_size
+        self.tile = tile
+        self.m0, self.v0 = m0, v0
+        self.threshold = threshold
+
+    def tiles(self):
+        return _tiles(*self.img.shape, self.tile)
+
+    def normalized(self, y0, y1, x0, x1):
+        """iitk normalization of a window, with the statistics of the whole image."""
+        return normalize(self.img[y0:y1, x0:x1], self.m0, self.v0, stats=self.stats)
+
+    def mask(self, y0, y1, x0, x1):
+        """Segmentation mask of a window: the block mask smoothed with the same open/close as
+        `create_segmented_and_variance_images`. Four morphology passes of radius w each can move the
+        result at most 4w pixels, so a 4w halo makes the window exact."""
+        rows, cols = self.img.shape
+        halo = 4 * self.w
+        ry0, ry1 = max(y0 - halo, 0), min(y1 + halo, rows)
+        rx0, rx1 = max(x0 - halo, 0), min(x1 + halo, cols)
+        region = self.block_mask[(np.arange(ry0, ry1) // self.w)[:, np.newaxis], np.arange(rx0, rx1) // self.w]
+        kernel = _mask_kernel(self.w)
+        region = cv2.morphologyEx(region, cv2.MORPH_OPEN, kernel)
+        region = cv2.morphologyEx(region, cv2.MORPH_CLOSE, kernel)
+        return region[y0 - ry0:y1 - ry0, x0 - rx0:x1 - rx0]
+
+    def normim(self, y0, y1, x0, x1):
+        """The segmentation's standardised image over a window (float64, like the full-frame stage)."""
+        norm = np.subtract(self.normalized(y0, y1, x0, x1), self.bg_mean, dtype=np.float64)
+        norm /= self.bg_std
+        return norm
+
+    def image_stats(self):
+        s1 = s2 = 0.0
+        for y0, y1, x0, x1 in self.tiles():
+            window = self.img[y0:y1, x0:x1]
+            s1 += np.sum(window, dtype=np.float64)
+            s2 += np.sum(np.square(window, dtype=np.float64))
+        mean = s1 / self.img.size
+        self.stats = (mean, max(s2 / self.img.size - mean * mean, 0.0))
+
+    def segmentation_stats(self):
+        """Block mask of `create_segmented_and_variance_images`, from block sums of the normalized image."""
+        rows, cols = self.img.shape
+        w = self.w
+        sums = np.zeros((-(-rows // w), -(-cols // w)))
+        squares = np.zeros_like(sums)
+        dtype = None
+        for y0, y1, x0, x1 in self.tiles():
+            window = self.normalized(y0, y1, x0, x1)
+            dtype = window.dtype
+            blocks = np.s_[y0 // w:-(-y1 // w), x0 // w:-(-x1 // w)]
+            sums[blocks] = _block_sums(window, w)
+            squares[blocks] = _block_sums(np.square(window, dtype=np.float64), w)
+
+        counts = np.outer(np.diff(np.append(np.arange(0, rows, w), rows)),
+                          np.diff(np.append(np.arange(0, cols, w), cols)))
+        mean = sums.sum() / self.img.size
+        # Squared deviations from the global mean, as the full-frame stage accumulates them
+        squares += counts * mean ** 2 - 2 * mean * sums
+        self.norm_std = np.sqrt(squares.sum() / self.img.size)
+        block_mean = sums / counts - mean
+        block_stddev = np.sqrt(np.maximum(squares / counts - block_mean ** 2, 0))
+        self.block_mask = (block_stddev >= self.norm_std * self.threshold).astype(dtype)
+
+    def orientation_and_background(self):
+        """Block orientations of `calculate_angles` and the background mean of the normalized image."""
+        rows, cols = self.img.shape
+        w = self.w
+        self.angles = np.zeros((len(range(1, rows, w)), len(range(1, cols, w))))
+        count, total = 0, 0.0
+        for y0, y1, x0, x1 in self.tiles():
+            # calculate_angles' blocks start one pixel in and read one pixel past their end, so a
+            # window starting at the tile corner and two pixels longer lines its blocks up with the
+            # full-frame ones; the extra block past the tile is dropped unless it is the image edge
+            window = self.normalized(y0, min(y1 + 2, rows), x0, min(x1 + 2, cols))
+            angles = calculate_angles(window, W=w, smoth=False)
+            keep_rows = angles.shape[0] if y1 == rows else (y1 - y0) // w
+            keep_cols = angles.shape[1] if x1 == cols else (x1 - x0) // w
+            self.angles[y0 // w:y0 // w + keep_rows, x0 // w:x0 // w + keep_cols] = angles[:keep_rows, :keep_cols]
+
+            background = self.mask(y0, y1, x0, x1) == 0
+            count += np.count_nonzero(background)
+            total += np.sum(window[:y1 - y0, :x1 - x0], where=background, dtype=np.float64)
+        self.bg_count = count
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.bg_mean = np.float64(total) / count
+
+    def background_std(self):
+        squares = 0.0
+        for y0, y1, x0, x1 in self.tiles():
+            background = self.mask(y0, y1, x0, x1) == 0
+            deviation = np.subtract(self.normalized(y0, y1, x0, x1), self.bg_mean, dtype=np.float64)
+            squares += np.sum(np.square(deviation, out=deviation), where=background, dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            std = np.sqrt(np.float64(squares) / self.bg_count)
+        # Same fallback as the full-frame stage for a perfectly flat background
+        self.bg_std = std if std > 0 else self.norm_std
+
+    def median_frequency(self, kernel_size, min_wave_length, max_wave_length, frequency_block_size=None):
+        """Median of `ridge_freq`'s masked frequency map. Every block contributes its frequency once
+        per mask pixel it holds, so the median is taken over (frequency, pixel count) pairs.
+
+        `frequency_block_size`, a multiple of the block size, estimates frequencies on larger blocks
+        than the orientation grid, oriented by the mean doubled angle of the blocks they cover: a
+        projection only finds two ridge peaks when the block spans more than one ridge period."""
+        rows, cols = self.img.shape
+        w = self.w
+        fw = frequency_block_size or w
+        k = fw // w
+        n_rows, n_cols = len(range(0, rows - fw, fw)), len(range(0, cols - fw, fw))
+        angles = self.angles[:n_rows * k, :n_cols * k]
+        if angles.size:
+            cos2, sin2 = _block_sums(np.cos(2 * angles), k), _block_sums(np.sin(2 * angles), k)
+            oriented = _block_sums(angles != 0, k) > 0
+        else:
+            oriented = np.zeros((n_rows, n_cols), bool)
+        values, weights = [], []
+        total = 0.0
+        for y0, y1, x0, x1 in self.tiles():
+            norm = self.normim(y0, y1, x0, x1)
+            total += norm.sum()
+            blocks = np.s_[y0 // fw:min(y1 // fw, n_rows), x0 // fw:min(x1 // fw, n_cols)]
+            by, bx = np.nonzero(oriented[blocks])
+            if not by.size:
+                continue
+            block_orient = np.arctan2(sin2[blocks][by, bx], cos2[blocks][by, bx]) / 2
+            wave_length = _wavelengths(_project_blocks(norm, by * fw, bx * fw, block_orient, fw), kernel_size)
+            valid = (wave_length >= min_wave_length) & (wave_length <= max_wave_length)
+            pixels = _block_sums(self.mask(y0, y1, x0, x1), fw)[by, bx]
+            keep = valid & (pixels > 0)
+            values.append(1 / wave_length[keep])
+            weights.append(pixels[keep].astype(np.int64))
+        self.norm_mean = total / self.img.size
+        if not values:
+            return np.nan
+        return _weighted_median(np.concatenate(values), np.concatenate(weights))
+
+    def gabor(self, frequency, out):
+        rows, cols = self.img.shape
+        if not np.isfinite(frequency):
+            # gabor_filter's fallback: threshold on the mean of the image
+            for y0, y1, x0, x1 in self.tiles():
+                out[y0:y1, x0:x1] = (self.normim(y0, y1, x0, x1) > self.norm_mean) * 255
+            return out
+
+        # Rounded like gabor_filter rounds the frequency map; the halo covers the kernel and the
+        # border gabor_filter leaves unfiltered, on its 16 pixel grid
+        kernel_half = gabor_bank(np.double(np.round(frequency * 100)) / 100).shape[1] // 2
+        halo = -(-(kernel_half + 1) // GABOR_GRID) * GABOR_GRID
+        for y0, y1, x0, x1 in self.tiles():
+            ry0, ry1 = max(y0 - halo, 0), min(y1 + halo, rows)
+            rx0, rx1 = max(x0 - halo, 0), min(x1 + halo, cols)
+            mask = self.mask(ry0, ry1, rx0, rx1)
+            if not mask.any():
+                # Nothing to filter: gabor_filter leaves these pixels white
+                out[y0:y1, x0:x1] = 255
+                continue
+            orient = self.angles[ry0 // GABOR_GRID:-(-ry1 // GABOR_GRID), rx0 // GABOR_GRID:-(-rx1 // GABOR_GRID)]
+            region = gabor_filter(self.normim(ry0, ry1, rx0, rx1), orient, frequency * mask)
+            out[y0:y1, x0:x1] = region[y0 - ry0:y1 - ry0, x0 - rx0:x1 - rx0]
+        return out
+
+
+def tiled_skeleton(img: np.ndarray, block_size: int = 16, tile_size: int | None = None,
+                   memory_budget: int | None = None, threshold: float = 0.2, kernel_size: int = 5,
+                   min_wave_length: float = 5, max_wave_length: float = 15,
+                   frequency_block_size: int | None = None) -> np.ndarray:
+    """
+    Skeleton stage of `phone_pipeline` (normalize, segment, orientation, frequency, Gabor) for an
+    aligned binary image of any size, computed tile by tile.
+
+    :param img: aligned uint8 image
+    :param tile_size: tile side, rounded up to a multiple of the block grids; by default derived
+                      from `memory_budget`
+    :param memory_budget: bytes of float buffers a tile may use (default PIPELINE_TILE_MEMORY)
+    :param frequency_block_size: block side for the ridge frequency, a multiple of `block_size`
+                                 (default `block_size`); larger for high-resolution captures
+    :return: uint8 skeleton with the shape of `img`
+    """
+    frequency_block_size = frequency_block_size or block_size
+    if frequency_block_size % block_size:
+        raise ValueError(f"frequency_block_size must be a multiple of {block_size}")
+    grid = math.lcm(frequency_block_size, GABOR_GRID)
+    if tile_size is None:
+        tile_size = tile_side(memory_budget or settings.PIPELINE_TILE_MEMORY, frequency_block_size)
+    tile = max(grid, -(-tile_size // grid) * grid)
+
+    chain = _TiledChain(img, block_size, tile, 100.0, 100.0, threshold)
+    chain.image_stats()
+    chain.segmentation_stats()
+    chain.orientation_and_background()
+    chain.background_std()
+    frequency = chain.median_frequency(kernel_size, min_wave_length, max_wave_length, frequency_block_size)
+
+    out = chain.gabor(frequency, np.empty(img.shape, np.uint8))
+    return cv2.normalize(out, out, 0, 255, cv2.NORM_MINMAX)
@@ -0,0 +1,55 @@
+"""
+Sauvola binarization thresholds every pixel against the mean m and standard deviation s of the
+w x w window around it: T = m * (1 + k * (s / R - 1)), where R is the dynamic range of the standard
+deviation. Dark ridges on a bright background stay dark even when the illumination of a phone
+capture varies across the finger.
+J. Sauvola and M. Pietikainen, "Adaptive document image binarization", Pattern Recognition 33(2), 2000
+"""
+
+import cv2
+import numpy as np
+
+
+def threshold_sauvola(im, window_size=25, k=0.2, r=None, out=None):
+    """
+    Sauvola threshold map computed in float32 with OpenCV box filters (running sums, so the cost per
+    pixel does not depend on the window). Borders are reflected like scikit-image's
+    `threshold_sauvola`, whose result this matches to within float32 rounding.
+    :param im: 2D grayscale image
+    :param window_size: odd side of the square window
+    :param k: weight of the local standard deviation
+    :param r: dynamic range of the standard deviation; half the dtype range when None (127.5 for uint8)
+    :param out: optional float32 buffer of im's shape for the threshold map
+    :return: float32 threshold map
+    """
+    if r is None:
+        r = 0.5 * (np.iinfo(im.dtype).max - np.iinfo(im.dtype).min) if im.dtype.kind in "ui" else 1.0
+    if out is None:
+        out = np.empty(im.shape, np.float32)
+
+    # Statistics of the image shifted by its mean, so the float32 E[x^2] - E[x]^2 does not cancel
+    shift = float(im.mean())
+    np.subtract(im, shift, out=out, dtype=np.float32)
+    size = (window_size, window_size)
+    mean = cv2.boxFilter(out, cv2.CV_32F, size, borderType=cv2.BORDER_REFLECT_101)
+    sq_mean = cv2.sqrBoxFilter(out, cv2.CV_32F, size, borderType=cv2.BORDER_REFLECT_101)
+
+    # sq_mean becomes the standard deviation, out the threshold
+    np.subtract(sq_mean, np.square(mean), out=sq_mean)
+    np.maximum(sq_mean, 0, out=sq_mean)
+    np.sqrt(sq_mean, out=sq_mean)
+    mean += shift
+    sq_mean *= k / r
+    sq_mean += 1 - k
+    return np.multiply(mean, sq_mean, out=out)
+
+
+def sauvola_binarize(im, window_size=25, k=0.2, out=None):
+    """
+    Binarize with the Sauvola threshold: 255 where the pixel is brighter than its threshold, else 0.
+    :param im: 2D grayscale image
+    :param out: optional uint8 buffer of im's shape for the result
+    :return: uint8 binary image
+    """
+    threshold = threshold_sauvola(im, window_size, k)
+    return cv2.compare(im.astype(np.float32, copy=False), threshold, cv2.CMP_GT, dst=out)
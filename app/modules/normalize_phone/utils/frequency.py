@@ -49,26 +49,86 @@ def frequest(im, orientim, kernel_size, minWaveLength, maxWaveLength):
     return(freq_block)
 
 
+def _projection_grid(block_size):
+    """
+    Sampling offsets, relative to the block centre, of the central crop that `frequest` keeps
+    after rotating a block: the largest square that stays inside the block at any angle.
+    """
+    cropsze = int(np.fix(block_size/np.sqrt(2)))
+    offset = int(np.fix((block_size-cropsze)/2))
+    grid = np.arange(offset, offset + cropsze) - (block_size - 1) / 2
+    return grid[:, np.newaxis], grid[np.newaxis, :]
+
+
+def _project_blocks(im, rows, cols, block_orient, block_size):
+    """
+    Batched version of the rotate-crop-sum step of `frequest`. Every block is sampled at the
+    rotated positions of the crop grid (bilinear interpolation, coordinates clamped to the block
+    like mode='nearest') in a single gather over `im`, then summed down the columns.
+    :param rows, cols: top-left corner of each block
+    :param block_orient: mean ridge orientation of each block
+    :return: (n_blocks, cropsze) projections of the grey values down the ridges
+    """
+    gi, gj = _projection_grid(block_size)
+    theta = (block_orient + np.pi/2)[:, np.newaxis, np.newaxis]
+    cos, sin = np.cos(theta), np.sin(theta)
+    centre = (block_size - 1) / 2
+
+    # Input position sampled by each pixel of the block rotated so that the ridges are vertical
+    yi = np.clip(centre + cos*gi + sin*gj, 0, block_size - 1)
+    xi = np.clip(centre - sin*gi + cos*gj, 0, block_size - 1)
+    y0 = np.minimum(np.floor(yi).astype(np.intp), block_size - 2)
+    x0 = np.minimum(np.floor(xi).astype(np.intp), block_size - 2)
+    wy = yi - y0
+    wx = xi - x0
+
+    y0 += rows[:, np.newaxis, np.newaxis]
+    x0 += cols[:, np.newaxis, np.newaxis]
+    top = im[y0, x0] * (1 - wx) + im[y0, x0 + 1] * wx
+    bottom = im[y0 + 1, x0] * (1 - wx) + im[y0 + 1, x0 + 1] * wx
+    rotim = top * (1 - wy) + bottom * wy
+
+    return np.sum(rotim, axis=1)
+
+
+def _wavelengths(ridge_sum, kernel_size):
+    """Ridge wavelength of every projection (the peak detection of `frequest`), nan if < 2 peaks."""
+    dilation = scipy.ndimage.grey_dilation(ridge_sum, size=(1, kernel_size), structure=np.ones((1, kernel_size)))
+    ridge_noise = np.abs(dilation - ridge_sum); peak_thresh = 2
+    maxpts = (ridge_noise < peak_thresh) & (ridge_sum > np.mean(ridge_sum, axis=1, keepdims=True))
+
+    no_of_peaks = np.count_nonzero(maxpts, axis=1)
+    first = np.argmax(maxpts, axis=1)
+    last = maxpts.shape[1] - 1 - np.argmax(maxpts[:, ::-1], axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(no_of_peaks >= 2, (last - first)/(no_of_peaks - 1), np.nan)
+
+
 def ridge_freq(im, mask, orient, block_size, kernel_size, minWaveLength, maxWaveLength):
     # Function to estimate the fingerprint ridge frequency across a
-    # fingerprint image.
+    # fingerprint image. All blocks are estimated at once; see `frequest` for the per-block method.
     rows,cols = im.shape
-    freq = np.zeros((rows,cols))
+    im = np.asarray(im, dtype=np.float64)
+    block_rows = np.arange(0, rows - block_size, block_size)
+    block_cols = np.arange(0, cols - block_size, block_size)
 
-    for row in range(0, rows - block_size, block_size):
-        for col in range(0, cols - block_size, block_size):
-            image_block = im[row:row + block_size][:, col:col + block_size]
-            angle_block = orient[row // block_size][col // block_size]
-            if angle_block:
-                freq[row:row + block_size][:, col:col + block_size] = frequest(image_block, angle_block, kernel_size,
-                                                                               minWaveLength, maxWaveLength)
+    block_freq = np.zeros((block_rows.size, block_cols.size))
+    angles = np.asarray(orient)[:block_rows.size, :block_cols.size]
+    by, bx = np.nonzero(angles)
+    if by.size:
+        # Mean orientation of a single angle, as in `frequest`
+        block_orient = np.arctan2(np.sin(2*angles[by, bx]), np.cos(2*angles[by, bx]))/2
+        ridge_sum = _project_blocks(im, block_rows[by], block_cols[bx], block_orient, block_size)
+        waveLength = _wavelengths(ridge_sum, kernel_size)
+        valid = (waveLength >= minWaveLength) & (waveLength <= maxWaveLength)
+        block_freq[by[valid], bx[valid]] = 1/waveLength[valid]
+
+    freq = np.zeros((rows,cols))
+    covered = block_freq.repeat(block_size, axis=0).repeat(block_size, axis=1)
+    freq[:covered.shape[0], :covered.shape[1]] = covered
 
     freq = freq*mask
-    freq_1d = np.reshape(freq,(1,rows*cols))
-    ind = np.where(freq_1d>0)
-    ind = np.array(ind)
-    ind = ind[1,:]
-    non_zero_elems_in_freq = freq_1d[0][ind]
+    non_zero_elems_in_freq = freq[freq>0]
     medianfreq = np.median(non_zero_elems_in_freq) * mask
 
     return medianfreq
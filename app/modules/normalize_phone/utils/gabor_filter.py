@@ -9,12 +9,48 @@ the base filters in the direction and local frequency from the two directional a
 https://airccj.org/CSCP/vol7/csit76809.pdf pg.91
 """
 
+from functools import lru_cache
+
+import cv2
 import numpy as np
 import scipy
+
+
+@lru_cache(maxsize=32)
+def gabor_bank(frequency, kx=0.65, ky=0.65, angleInc=3):
+    """
+    Even-symmetric Gabor filters for one ridge frequency, rotated in `angleInc` degree steps.
+    Memoized: the pipeline rounds frequencies to 0.01, so the same few banks are reused across calls.
+    :return: read-only array of shape (180 // angleInc, 2 * block_size + 1, 2 * block_size + 1)
+    """
+    sigma_x = 1/frequency*kx
+    sigma_y = 1/frequency*ky
+    block_size = int(np.round(3*max(sigma_x, sigma_y)))
+    if block_size < 1:
+        block_size = 1
+    array = np.linspace(-block_size,block_size,(2*block_size + 1))
+    x, y = np.meshgrid(array, array)
+
+    # gabor filter equation
+    reffilter = np.exp(-(((np.power(x,2))/(sigma_x*sigma_x) + (np.power(y,2))/(sigma_y*sigma_y)))) * np.cos(2*np.pi*frequency*x)
+    filt_rows, filt_cols = reffilter.shape
+    gabor_filter = np.array(np.zeros((180//angleInc, filt_rows, filt_cols)))
+
+    # Generate rotated versions of the filter.
+    for degree in range(0,180//angleInc):
+        rot_filt = scipy.ndimage.rotate(reffilter,-(degree*angleInc + 90),reshape = False)
+        gabor_filter[degree] = rot_filt
+
+    gabor_filter.setflags(write=False)
+    return gabor_filter
+
+
 def gabor_filter(im, orient, freq, kx=0.65, ky=0.65):
     """
     Gabor filter is a linear filter used for edge detection. Gabor filter can be viewed as a sinusoidal plane of
     particular frequency and orientation, modulated by a Gaussian envelope.
+    Pixels are grouped by orientation bin; the image is filtered with cv2.filter2D once per run of
+    adjacent blocks sharing a bin and the response is picked per pixel through the orientation index map.
     :param im:
     :param orient:
     :param freq:
@@ -33,8 +69,7 @@ def gabor_filter(im, orient, freq, kx=0.65, ky=0.65):
     freq_1d = freq.flatten()
     if not np.all(np.isfinite(freq_1d)):
         freq_1d = freq_1d[np.isfinite(freq_1d)]
-    frequency_ind = np.array(np.where(freq_1d>0))
-    non_zero_elems_in_freq = freq_1d[frequency_ind]
+    non_zero_elems_in_freq = freq_1d[freq_1d>0]
     non_zero_elems_in_freq = np.double(np.round((non_zero_elems_in_freq*100)))/100
     unfreq = np.unique(non_zero_elems_in_freq)
 
@@ -45,47 +80,47 @@ def gabor_filter(im, orient, freq, kx=0.65, ky=0.65):
         gabor_img = (im > thresh).astype(np.uint8) * 255
         return gabor_img
 
-    # Generate filters corresponding to these distinct frequencies and
-    # orientations in 'angleInc' increments.
-    sigma_x = 1/unfreq*kx
-    sigma_y = 1/unfreq*ky
-    block_size = np.round(3*np.max([sigma_x,sigma_y]))
-    block_size = int(block_size)
-    if block_size < 1:
-        block_size = 1
-    array = np.linspace(-block_size,block_size,(2*block_size + 1))
-    x, y = np.meshgrid(array, array)
-
-    # gabor filter equation
-    reffilter = np.exp(-(((np.power(x,2))/(sigma_x*sigma_x) + (np.power(y,2))/(sigma_y*sigma_y)))) * np.cos(2*np.pi*unfreq[0]*x)
-    filt_rows, filt_cols = reffilter.shape
-    gabor_filter = np.array(np.zeros((180//angleInc, filt_rows, filt_cols)))
-
-    # Generate rotated versions of the filter.
-    for degree in range(0,180//angleInc):
-        rot_filt = scipy.ndimage.rotate(reffilter,-(degree*angleInc + 90),reshape = False)
-        gabor_filter[degree] = rot_filt
+    # Filters corresponding to the frequency, in 'angleInc' increments.
+    gabor_filter = gabor_bank(float(unfreq[0]), kx, ky, angleInc)
+    block_size = gabor_filter.shape[1] // 2
 
     # Convert orientation matrix values from radians to an index value that corresponds to round(degrees/angleInc)
     maxorientindex = np.round(180/angleInc)
     orientindex = np.round(orient/np.pi*180/angleInc)
-    for i in range(0,rows//16):
-        for j in range(0,cols//16):
-            if(orientindex[i][j] < 1):
-                orientindex[i][j] = orientindex[i][j] + maxorientindex
-            if(orientindex[i][j] > maxorientindex):
-                orientindex[i][j] = orientindex[i][j] - maxorientindex
+    wrapped = orientindex[:rows//16, :cols//16]
+    wrapped[wrapped < 1] += maxorientindex
+    wrapped[wrapped > maxorientindex] -= maxorientindex
+    # Filter used by each 16x16 block; the modulo mirrors negative indexing into the filter bank
+    filter_index = (orientindex.astype(np.intp) - 1) % gabor_filter.shape[0]
 
     # Find indices of matrix points greater than maxsze from the image boundary
-    block_size = int(block_size)
-    valid_row, valid_col = np.where(freq>0)
-    finalind = \
-        np.where((valid_row>block_size) & (valid_row<rows - block_size) & (valid_col>block_size) & (valid_col<cols - block_size))
-
-    for k in range(0, np.shape(finalind)[1]):
-        r = valid_row[finalind[0][k]]; c = valid_col[finalind[0][k]]
-        img_block = im[r-block_size:r+block_size + 1][:,c-block_size:c+block_size + 1]
-        return_img[r][c] = np.sum(img_block * gabor_filter[int(orientindex[r//16][c//16]) - 1])
+    valid = freq > 0
+    valid[:block_size + 1] = False
+    valid[rows - block_size:] = False
+    valid[:, :block_size + 1] = False
+    valid[:, cols - block_size:] = False
+
+    # Group the 16x16 blocks holding valid pixels into horizontal runs of adjacent blocks that use
+    # the same filter, so each filter2D call only covers pixels that need that filter
+    block_rows, block_cols = np.nonzero(np.add.reduceat(np.add.reduceat(valid, np.arange(0, rows, 16), axis=0),
+                                                        np.arange(0, cols, 16), axis=1))
+    block_filter = filter_index[block_rows, block_cols]
+    order = np.lexsort((block_cols, block_rows, block_filter))
+    block_rows, block_cols, block_filter = block_rows[order], block_cols[order], block_filter[order]
+    run_start = np.flatnonzero(np.diff(block_filter, prepend=-1) | np.diff(block_rows, prepend=-1)
+                               | (np.diff(block_cols, prepend=-2) != 1))
+    run_stop = np.append(run_start[1:], block_filter.size) - 1
+
+    for start, stop in zip(run_start, run_stop):
+        top = block_rows[start]*16; bottom = min(top + 16, rows)
+        left = block_cols[start]*16; right = min(block_cols[stop]*16 + 16, cols)
+        halo_top = max(top - block_size, 0); halo_left = max(left - block_size, 0)
+        region = im[halo_top:bottom + block_size, halo_left:right + block_size]
+        # filter2D computes the correlation, i.e. sum(img_block * filter) centred on each pixel
+        response = cv2.filter2D(region, cv2.CV_64F, gabor_filter[block_filter[start]], borderType=cv2.BORDER_CONSTANT)
+        response = response[top - halo_top:bottom - halo_top, left - halo_left:right - halo_left]
+        run_valid = valid[top:bottom, left:right]
+        return_img[top:bottom, left:right][run_valid] = response[run_valid]
 
     gabor_img = 255 - np.array((return_img < 0)*255).astype(np.uint8)
 
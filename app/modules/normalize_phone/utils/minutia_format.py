@@ -0,0 +1,11 @@
+"""
+Layout of the minutiae arrays the minutiae stage (minutiae.py) produces. Kept apart from it, with
+NumPy as its only import, so templates can be read and scored without loading OpenCV.
+"""
+import numpy as np
+
+MINUTIA_ENDING = 1
+MINUTIA_BIFURCATION = 3
+
+# x, y in pixels of the enhanced image, direction in radians [0, 2pi), kind one of the constants above
+MINUTIA_DTYPE = np.dtype([("x", np.uint16), ("y", np.uint16), ("angle", np.float32), ("kind", np.uint8)])
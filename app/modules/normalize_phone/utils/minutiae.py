@@ -0,0 +1,104 @@
+"""
+Minutiae are the points where a ridge ends (ridge ending) or splits in two (bifurcation); their
+positions and directions form the template two fingerprints are matched on.
+
+The binarized Gabor output is thinned to one pixel wide ridges (Zhang-Suen), then every ridge pixel
+is classified by its crossing number, half the number of 0/1 transitions around its 8 neighbours:
+1 is a ridge ending, 3 a bifurcation. Both steps only depend on the 8-neighbourhood of a pixel, so
+they are table lookups on an 8-bit neighbourhood code computed for the whole image at once.
+T. Y. Zhang and C. Y. Suen, "A fast parallel algorithm for thinning digital patterns", CACM 27(3), 1984
+"""
+import cv2
+import numpy as np
+
+from app.modules.normalize_phone.utils.minutia_format import MINUTIA_BIFURCATION, MINUTIA_DTYPE, MINUTIA_ENDING
+
+# Neighbours P2..P9 of Zhang-Suen, clockwise from north, as (dy, dx); bit i of a code is P(i + 2)
+_NEIGHBOURS = ((-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1))
+
+
+def _lookup_tables():
+    bits = (np.arange(256)[:, np.newaxis] >> np.arange(8)) & 1
+    count = bits.sum(axis=1)
+    transitions = np.count_nonzero((bits == 0) & (np.roll(bits, -1, axis=1) == 1), axis=1)
+    p2, p4, p6, p8 = bits[:, 0], bits[:, 2], bits[:, 4], bits[:, 6]
+    removable = (count >= 2) & (count <= 6) & (transitions == 1)
+    first = removable & (p2 * p4 * p6 == 0) & (p4 * p6 * p8 == 0)
+    second = removable & (p2 * p4 * p8 == 0) & (p2 * p6 * p8 == 0)
+    # Crossing number: transitions around the closed ring of neighbours
+    crossing = np.count_nonzero(bits != np.roll(bits, -1, axis=1), axis=1) // 2
+    dy, dx = np.array(_NEIGHBOURS).T
+    return first, second, crossing.astype(np.uint8), bits @ dy, bits @ dx
+
+
+_FIRST, _SECOND, _CROSSING, _SUM_DY, _SUM_DX = _lookup_tables()
+
+
+def neighbour_codes(im):
+    """8-bit code of the set neighbours of every pixel of a 0/1 uint8 image (outside counts as 0)."""
+    padded = np.pad(im, 1)
+    rows, cols = im.shape
+    code = np.zeros(im.shape, np.uint8)
+    for bit, (dy, dx) in enumerate(_NEIGHBOURS):
+        code |= padded[1 + dy:1 + dy + rows, 1 + dx:1 + dx + cols] << bit
+    return code
+
+
+def thin(ridges, max_iterations=100):
+    """
+    Zhang-Suen thinning of a boolean ridge image to one pixel wide lines. Each sub-iteration deletes,
+    all at once, the pixels whose neighbourhood code the corresponding table marks removable.
+    :return: uint8 image, 1 on the thinned ridges
+    """
+    im = np.ascontiguousarray(ridges, dtype=np.uint8)
+    for _ in range(max_iterations):
+        changed = False
+        for table in (_FIRST, _SECOND):
+            delete = table[neighbour_codes(im)] & (im == 1)
+            if delete.any():
+                im[delete] = 0
+                changed = True
+        if not changed:
+            break
+    return im
+
+
+def extract_minutiae(skeleton, mask, orient, block_size=16, border=None):
+    """
+    Ridge endings and bifurcations of the Gabor skeleton.
+    Direction comes from the block orientation field (`calculate_angles`, whose block (i, j) starts at
+    pixel (1 + i * block_size, 1 + j * block_size)); of the two directions along it the one pointing
+    away from the ridge pixels around the minutia is kept. Minutiae closer than `border` pixels to the
+    edge of the segmentation mask or of the image are dropped: that is where the Gabor filter cuts
+    ridges off and creates false endings.
+    :param skeleton: uint8 output of the skeleton stage, ridges dark
+    :param mask: segmentation mask (non-zero inside the fingerprint)
+    :param orient: block orientations in radians
+    :param border: margin in pixels, block_size by default
+    :return: MINUTIA_DTYPE structured array, sorted by row then column
+    """
+    border = block_size if border is None else border
+    thinned = thin(skeleton < 128)
+    code = neighbour_codes(thinned)
+    crossing = np.where(thinned == 1, _CROSSING[code], 0)
+
+    # Eroding with a zero border also drops minutiae near the image edge
+    inside = cv2.erode((np.asarray(mask) > 0).astype(np.uint8), np.ones((2 * border + 1, 2 * border + 1), np.uint8),
+                       borderType=cv2.BORDER_CONSTANT, borderValue=0)
+    ys, xs = np.nonzero(((crossing == MINUTIA_ENDING) | (crossing == MINUTIA_BIFURCATION)) & (inside == 1))
+
+    orient = np.asarray(orient)
+    by = np.clip((ys - 1) // block_size, 0, orient.shape[0] - 1)
+    bx = np.clip((xs - 1) // block_size, 0, orient.shape[1] - 1)
+    angle = orient[by, bx]
+    # Away from the ridge: opposite to the summed offsets of the set neighbours
+    codes = code[ys, xs]
+    away = np.cos(angle) * -_SUM_DX[codes] + np.sin(angle) * -_SUM_DY[codes]
+    angle = np.mod(np.where(away < 0, angle + np.pi, angle), 2 * np.pi)
+
+    template = np.empty(ys.size, MINUTIA_DTYPE)
+    template["x"] = xs
+    template["y"] = ys
+    template["angle"] = angle
+    template["kind"] = crossing[ys, xs]
+    return template
@@ -23,13 +23,36 @@ def normalize_pixel(x, v0, v, m, m0):
     dev_coeff = sqrt((v0 * ((x - m)**2)) / v)
     return m0 + dev_coeff if x > m else m0 - dev_coeff
 
-def normalize(im, m0, v0):
-    m = np.mean(im)
-    v = np.std(im) ** 2
-    (y, x) = im.shape
-    normilize_image = im.copy()
-    for i in range(x):
-        for j in range(y):
-            normilize_image[j, i] = normalize_pixel(im[j, i], v0, v, m, m0)
+def normalize(im, m0, v0, out=None, stats=None):
+    """
+    Whole-array form of `normalize_pixel`: m0 + dev when x > m and m0 - dev otherwise is simply
+    m0 + (x - m) * sqrt(v0 / v), so the image is normalized with three in-place array operations.
+    :param im: image
+    :param m0: desired mean
+    :param v0: desired variance
+    :param out: optional float buffer to write the result into; pass `im` itself (float32) to
+                normalize in place without any extra copy
+    :param stats: (mean, variance) to normalize with instead of those of `im`, e.g. the global
+                  statistics of the image `im` is a tile of
+    :return: normalized image, in the dtype of `im` unless `out` is given
+    """
+    if stats is None:
+        m = np.mean(im)
+        v = np.std(im) ** 2
+    else:
+        m, v = stats
+
+    if out is None:
+        normilize_image = np.array(im, dtype=np.result_type(im.dtype, np.float32))
+    else:
+        normilize_image = out
+        if out is not im:
+            np.copyto(normilize_image, im, casting="unsafe")
+
+    normilize_image -= m
+    normilize_image *= np.sqrt(v0 / v)
+    normilize_image += m0
 
+    if out is None and normilize_image.dtype != im.dtype:
+        return normilize_image.astype(im.dtype)
     return normilize_image
@@ -3,54 +3,49 @@ import numpy as np
 import cv2 as cv
 
 
+def _block_sums(values, W, y, x):
+    """
+    Sums `values` over the blocks visited by `calculate_angles`: block (j, i) covers rows
+    j..min(j + W, y - 1) - 1 and columns i..min(i + W, x - 1) - 1 for j in range(1, y, W) and
+    i in range(1, x, W). Every block is read off one integral image with four lookups.
+    """
+    integral = np.zeros((y + 1, x + 1))
+    np.cumsum(np.cumsum(values, axis=0), axis=1, out=integral[1:, 1:])
+
+    row_start = np.arange(1, y, W)
+    row_stop = np.minimum(row_start + W, y - 1)
+    col_start = np.arange(1, x, W)
+    col_stop = np.minimum(col_start + W, x - 1)
+
+    return (integral[np.ix_(row_stop, col_stop)] - integral[np.ix_(row_start, col_stop)]
+            - integral[np.ix_(row_stop, col_start)] + integral[np.ix_(row_start, col_start)])
+
+
 def calculate_angles(im, W, smoth=False):
     """
     anisotropy orientation estimate, based on equations 5 from:
     https://pdfs.semanticscholar.org/6e86/1d0b58bdf7e2e2bb0ecbf274cee6974fe13f.pdf
+    The per-pixel terms 2*Gx*Gy and Gx^2 - Gy^2 are computed once for the whole image and
+    reduced per block through integral images.
     :param im:
     :param W: int width of the ridge
     :return: array
     """
-    j1 = lambda x, y: 2 * x * y
-    j2 = lambda x, y: x ** 2 - y ** 2
-    j3 = lambda x, y: x ** 2 + y ** 2
-
     (y, x) = im.shape
 
     sobelOperator = [[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]]
     ySobel = np.array(sobelOperator).astype(np.int_)
     xSobel = np.transpose(ySobel).astype(np.int_)
 
-    result = [[] for i in range(1, y, W)]
-
-    Gx_ = cv.filter2D(im/125,-1, ySobel)*125
-    Gy_ = cv.filter2D(im/125,-1, xSobel)*125
-
-    for j in range(1, y, W):
-        for i in range(1, x, W):
-            nominator = 0
-            denominator = 0
-            for l in range(j, min(j + W, y - 1)):
-                for k in range(i, min(i + W , x - 1)):
-                    Gx = round(Gx_[l, k])  # horizontal gradients at l, k
-                    Gy = round(Gy_[l, k])  # vertial gradients at l, k
-                    nominator += j1(Gx, Gy)
-                    denominator += j2(Gx, Gy)
-
-            # nominator = round(np.sum(Gy_[j:min(j + W, y - 1), i:min(i + W , x - 1)]))
-            # denominator = round(np.sum(Gx_[j:min(j + W, y - 1), i:min(i + W , x - 1)]))
-            if nominator or denominator:
-                angle = (math.pi + math.atan2(nominator, denominator)) / 2
-                orientation = np.pi/2 + math.atan2(nominator,denominator)/2
-                result[int((j-1) // W)].append(angle)
-            else:
-                result[int((j-1) // W)].append(0)
-
-            # segment image
-            # focus_img = im[j:min(j + W, y - 1), i:min(i + W , x - 1)]
-            # segmentator = -1 if segmentator/W*W < np.max(focus_img)*
-
-    result = np.array(result)
+    Gx = np.rint(cv.filter2D(im/125,-1, ySobel)*125)  # horizontal gradients
+    Gy = np.rint(cv.filter2D(im/125,-1, xSobel)*125)  # vertical gradients
+
+    # The gradients are rounded to integers, so the block sums below are exact
+    nominator = _block_sums(2 * Gx * Gy, W, y, x)
+    denominator = _block_sums(Gx ** 2 - Gy ** 2, W, y, x)
+
+    result = np.where((nominator != 0) | (denominator != 0),
+                      (np.pi + np.arctan2(nominator, denominator)) / 2, 0.0)
 
     if smoth:
         result = smooth_angles(result)
@@ -60,15 +55,12 @@ def calculate_angles(im, W, smoth=False):
 
 def gauss(x, y):
     ssigma = 1.0
-    return (1 / (2 * math.pi * ssigma)) * math.exp(-(x * x + y * y) / (2 * ssigma))
+    return (1 / (2 * math.pi * ssigma)) * np.exp(-(x * x + y * y) / (2 * ssigma))
 
 
 def kernel_from_function(size, f):
-    kernel = [[] for i in range(0, size)]
-    for i in range(0, size):
-        for j in range(0, size):
-            kernel[i].append(f(i - size / 2, j - size / 2))
-    return kernel
+    offsets = np.arange(size) - size / 2
+    return f(offsets[:, np.newaxis], offsets[np.newaxis, :])
 
 
 def smooth_angles(angles):
@@ -82,15 +74,13 @@ def smooth_angles(angles):
     :param angles:
     :return:
     """
-    angles = np.array(angles)
-    cos_angles = np.cos(angles.copy()*2)
-    sin_angles = np.sin(angles.copy()*2)
-
-    kernel = np.array(kernel_from_function(5, gauss))
+    angles = np.asarray(angles, dtype=np.float64)
+    doubled = np.dstack((np.cos(angles * 2), np.sin(angles * 2)))
 
-    cos_angles = cv.filter2D(cos_angles/125,-1, kernel)*125
-    sin_angles = cv.filter2D(sin_angles/125,-1, kernel)*125
-    smooth_angles = np.arctan2(sin_angles, cos_angles)/2
+    # Both channels are filtered in a single pass
+    kernel = kernel_from_function(5, gauss)
+    doubled = cv.filter2D(doubled, -1, kernel)
+    smooth_angles = np.arctan2(doubled[..., 1], doubled[..., 0])/2
 
     return smooth_angles
 
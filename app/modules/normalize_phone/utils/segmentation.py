@@ -11,6 +11,8 @@ The selected threshold value is T = 0.2 and the selected block size is W = 16
 This step makes it possible to reduce the size of the useful part of the image and subsequently to
 optimize the extraction phase of the biometric data.
 """
+from functools import lru_cache
+
 import numpy as np
 import cv2 as cv
 
@@ -19,43 +21,75 @@ def normalise(img):
     return (img - np.mean(img))/(np.std(img))
 
 
-def create_segmented_and_variance_images(im, w, threshold=.2):
+@lru_cache(maxsize=8)
+def _mask_kernel(w):
+    return cv.getStructuringElement(cv.MORPH_ELLIPSE,(w*2, w*2))
+
+
+def _block_sums(values, w):
+    """Sums over the w x w grid of blocks (partial blocks at the right and bottom edges included)."""
+    (y, x) = values.shape
+    sums = np.add.reduceat(values, np.arange(0, y, w), axis=0, dtype=np.float64)
+    return np.add.reduceat(sums, np.arange(0, x, w), axis=1)
+
+
+def create_segmented_and_variance_images(im, w, threshold=.2, dtype=np.float64, out=None):
     """
     Returns mask identifying the ROI. Calculates the standard deviation in each image block and threshold the ROI
     It also normalises the intesity values of
     the image so that the ridge regions have zero mean, unit standard
     deviation.
+    Block statistics come from block sums of x and of squared deviations, so no full-size variance image
+    is built; a single full-size float buffer holds the deviations and is then reused for the normalized image.
     :param im: Image
     :param w: size of the block
     :param threshold: std threshold
+    :param dtype: float type of the normalized image; np.float32 halves its memory
+    :param out: optional preallocated buffer for the normalized image (its dtype overrides `dtype`)
     :return: segmented_image
     """
     (y, x) = im.shape
-    threshold = np.std(im)*threshold
+    work = out if out is not None else np.empty(im.shape, dtype)
+
+    rows = np.diff(np.append(np.arange(0, y, w), y))
+    cols = np.diff(np.append(np.arange(0, x, w), x))
+    counts = np.outer(rows, cols)
 
-    image_variance = np.zeros(im.shape)
-    segmented_image = im.copy()
-    mask = np.ones_like(im)
+    # Deviations are taken from the global mean so the block variances do not suffer from
+    # cancellation, even when `work` is float32
+    sums = _block_sums(im, w)
+    mean = sums.sum() / im.size
+    np.subtract(im, mean, out=work, dtype=work.dtype)
+    np.square(work, out=work)
+    squares = _block_sums(work, w)
 
-    for i in range(0, x, w):
-        for j in range(0, y, w):
-            box = [i, j, min(i + w, x), min(j + w, y)]
-            block_stddev = np.std(im[box[1]:box[3], box[0]:box[2]])
-            image_variance[box[1]:box[3], box[0]:box[2]] = block_stddev
+    threshold = np.sqrt(squares.sum() / im.size) * threshold
+    block_mean = sums / counts - mean
+    block_stddev = np.sqrt(np.maximum(squares / counts - block_mean ** 2, 0))
 
     # apply threshold
-    mask[image_variance < threshold] = 0
+    block_mask = (block_stddev >= threshold).astype(im.dtype)
+    mask = block_mask[(np.arange(y) // w)[:, np.newaxis], np.arange(x) // w]
 
     # smooth mask with a open/close morphological filter
-    kernel = cv.getStructuringElement(cv.MORPH_ELLIPSE,(w*2, w*2))
+    kernel = _mask_kernel(w)
     mask = cv.morphologyEx(mask, cv.MORPH_OPEN, kernel)
     mask = cv.morphologyEx(mask, cv.MORPH_CLOSE, kernel)
 
     # normalize segmented image
-    segmented_image *= mask
-    im = normalise(im)
-    mean_val = np.mean(im[mask==0])
-    std_val = np.std(im[mask==0])
-    norm_img = (im - mean_val)/(std_val)
+    segmented_image = im * mask
+
+    # normalise() followed by standardising on the background pixels reduces to standardising
+    # the raw image on the background statistics
+    background = mask == 0
+    count = np.count_nonzero(background)
+    mean_val = np.sum(im, where=background, dtype=np.float64) / count
+    norm_img = np.subtract(im, mean_val, out=work, dtype=work.dtype)
+    std_val = np.sqrt(np.sum(np.square(norm_img, out=norm_img), where=background, dtype=np.float64) / count)
+    if not std_val > 0:
+        # A perfectly flat background (e.g. after denoising a downsized capture) carries no scale
+        std_val = np.std(im)
+    np.subtract(im, mean_val, out=norm_img, dtype=norm_img.dtype)
+    norm_img /= std_val
 
     return segmented_image, norm_img, mask
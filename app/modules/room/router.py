@@ -3,6 +3,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from typing import List
 from app.core.database import get_db
+from app.modules.access.cache import access_cache
 from app.modules.room.models import Room, RoomState
 from pydantic import BaseModel
 
@@ -34,6 +35,7 @@ async def create_room(room: RoomCreate, db: AsyncSession = Depends(get_db)):
     db.add(db_room)
     await db.commit()
     await db.refresh(db_room)
+    access_cache.invalidate()
     return db_room
 
 
@@ -76,6 +78,7 @@ async def update_room(room_id: int, room_update: RoomUpdate, db: AsyncSession =
 
     await db.commit()
     await db.refresh(room)
+    access_cache.invalidate()
     return room
 
 
@@ -88,4 +91,5 @@ async def delete_room(room_id: int, db: AsyncSession = Depends(get_db)):
 
     await db.delete(room)
     await db.commit()
+    access_cache.invalidate()
     return {"message": "Room deleted successfully"}
\ No newline at end of file
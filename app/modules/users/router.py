@@ -1,8 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from typing import List
+from typing import List, Optional
 from app.core.database import get_db
+from app.modules.access.cache import access_cache
+from app.modules.matching.constants import FINGER_POSITIONS
+from app.modules.matching.identification import fingerprint_identifier
+from app.modules.matching.router import capture_template
+from app.modules.matching.store import fingerprint_templates
 from app.modules.users.models import User
 from pydantic import BaseModel
 
@@ -31,6 +36,7 @@ async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
     db.add(db_user)
     await db.commit()
     await db.refresh(db_user)
+    access_cache.invalidate()
     return db_user
 
 
@@ -60,6 +66,7 @@ async def update_user(user_id: int, user_update: UserUpdate, db: AsyncSession =
     user.name = user_update.name
     await db.commit()
     await db.refresh(user)
+    access_cache.invalidate()
     return user
 
 
@@ -72,4 +79,42 @@ async def delete_user(user_id: int, db: AsyncSession = Depends(get_db)):
 
     await db.delete(user)
     await db.commit()
-    return {"message": "User deleted successfully"}
\ No newline at end of file
+    access_cache.invalidate()
+    # The database deleted the user's templates along with the user
+    fingerprint_templates.invalidate()
+    await fingerprint_identifier.remove(user_id)
+    return {"message": "User deleted successfully"}
+
+
+@router.post("/{user_id}/fingerprints")
+async def enroll_fingerprint(
+    user_id: int,
+    file: UploadFile = File(...),
+    finger: int = Query(0, ge=FINGER_POSITIONS.start, lt=FINGER_POSITIONS.stop, description="ANSI/NIST finger position"),
+    db: AsyncSession = Depends(get_db),
+):
+    """Store a capture (or template) of one of the user's fingers, replacing the one enrolled for that finger."""
+    result = await db.execute(select(User).where(User.id == user_id))
+    if not result.scalar_one_or_none():
+        raise HTTPException(status_code=404, detail="User not found")
+
+    template, _ = await capture_template(file)
+    templates = await fingerprint_templates.save(db, user_id, finger, template)
+    await fingerprint_identifier.update(user_id, templates)
+    return {"user_id": user_id, "finger": finger, "templates": len(templates)}
+
+
+@router.delete("/{user_id}/fingerprints")
+async def delete_fingerprints(
+    user_id: int,
+    finger: Optional[int] = Query(None, ge=FINGER_POSITIONS.start, lt=FINGER_POSITIONS.stop),
+    db: AsyncSession = Depends(get_db),
+):
+    """Delete the user's fingerprints, or only those of `finger`."""
+    if not await fingerprint_templates.delete(db, user_id, finger):
+        raise HTTPException(status_code=404, detail="No fingerprints enrolled for this user")
+    if finger is None:
+        await fingerprint_identifier.remove(user_id)
+    else:
+        await fingerprint_identifier.update(user_id, await fingerprint_templates.user_templates(db, user_id))
+    return {"message": "Fingerprints deleted successfully"}
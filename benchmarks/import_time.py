@@ -0,0 +1,61 @@
+"""
+Import check for the API process, run from the repository root:
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --budget 1.5
+
+Imports `main` in a fresh interpreter under `-X importtime`, lists the slowest imports and exits
+non-zero when that loads one of the fingerprint pipeline's heavy dependencies, which belong in the
+pipeline worker processes only. FastAPI and SQLAlchemy alone take most of a second on a slow host,
+so the import time is only gated when a `--budget` is given.
+"""
+import argparse
+import subprocess
+import sys
+
+HEAVY_MODULES = ("cv2", "numpy", "scipy", "skimage", "PIL", "app.modules.normalize_phone.pipeline")
+
+
+def import_times(module):
+    """Cumulative import time in seconds of every module loaded by `import module`."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(proc.stderr)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--module", default="main", help="Module to import (default: the API app)")
+    ap.add_argument("--budget", type=float, default=None,
+                    help="Maximum import time in seconds (default: not checked)")
+    ap.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+    args = ap.parse_args()
+
+    # The first run also pays for compiling .pyc files
+    import_times(args.module)
+    times = import_times(args.module)
+
+    for name, seconds in sorted(times.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{seconds * 1e3:10.1f} ms  {name}")
+
+    failures = []
+    total = times.get(args.module, 0.0)
+    if args.budget is not None and total > args.budget:
+        failures.append(f"importing {args.module} took {total:.2f}s, budget is {args.budget:.2f}s")
+    heavy = sorted({name if name in HEAVY_MODULES else name.split(".")[0]
+                    for name in times if name in HEAVY_MODULES or name.split(".")[0] in HEAVY_MODULES})
+    if heavy:
+        failures.append(f"importing {args.module} loads {', '.join(heavy)}")
+    if failures:
+        sys.exit("FAIL: " + "; ".join(failures))
+    print(f"OK: {args.module} imports in {total * 1e3:.0f} ms")
@@ -0,0 +1,203 @@
+"""
+Reference copies of the original loop-based fingerprint utilities. The benchmarks time the current
+implementations against these and check that both produce the same output.
+"""
+import math
+
+import cv2 as cv
+import numpy as np
+import scipy.ndimage
+
+from app.modules.normalize_phone.utils.frequency import frequest
+from app.modules.normalize_phone.utils.normalization import normalize_pixel
+
+
+def normalize(im, m0, v0):
+    m = np.mean(im)
+    v = np.std(im) ** 2
+    (y, x) = im.shape
+    normilize_image = im.copy()
+    for i in range(x):
+        for j in range(y):
+            normilize_image[j, i] = normalize_pixel(im[j, i], v0, v, m, m0)
+
+    return normilize_image
+
+
+def calculate_angles(im, W, smoth=False):
+    j1 = lambda x, y: 2 * x * y
+    j2 = lambda x, y: x ** 2 - y ** 2
+
+    (y, x) = im.shape
+
+    sobelOperator = [[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]]
+    ySobel = np.array(sobelOperator).astype(np.int_)
+    xSobel = np.transpose(ySobel).astype(np.int_)
+
+    result = [[] for i in range(1, y, W)]
+
+    Gx_ = cv.filter2D(im/125,-1, ySobel)*125
+    Gy_ = cv.filter2D(im/125,-1, xSobel)*125
+
+    for j in range(1, y, W):
+        for i in range(1, x, W):
+            nominator = 0
+            denominator = 0
+            for l in range(j, min(j + W, y - 1)):
+                for k in range(i, min(i + W , x - 1)):
+                    Gx = round(Gx_[l, k])
+                    Gy = round(Gy_[l, k])
+                    nominator += j1(Gx, Gy)
+                    denominator += j2(Gx, Gy)
+
+            if nominator or denominator:
+                angle = (math.pi + math.atan2(nominator, denominator)) / 2
+                result[int((j-1) // W)].append(angle)
+            else:
+                result[int((j-1) // W)].append(0)
+
+    result = np.array(result)
+
+    if smoth:
+        result = smooth_angles(result)
+
+    return result
+
+
+def gauss(x, y):
+    ssigma = 1.0
+    return (1 / (2 * math.pi * ssigma)) * math.exp(-(x * x + y * y) / (2 * ssigma))
+
+
+def kernel_from_function(size, f):
+    kernel = [[] for i in range(0, size)]
+    for i in range(0, size):
+        for j in range(0, size):
+            kernel[i].append(f(i - size / 2, j - size / 2))
+    return kernel
+
+
+def smooth_angles(angles):
+    angles = np.array(angles)
+    cos_angles = np.cos(angles.copy()*2)
+    sin_angles = np.sin(angles.copy()*2)
+
+    kernel = np.array(kernel_from_function(5, gauss))
+
+    cos_angles = cv.filter2D(cos_angles/125,-1, kernel)*125
+    sin_angles = cv.filter2D(sin_angles/125,-1, kernel)*125
+    smooth_angles = np.arctan2(sin_angles, cos_angles)/2
+
+    return smooth_angles
+
+
+def create_segmented_and_variance_images(im, w, threshold=.2):
+    (y, x) = im.shape
+    threshold = np.std(im)*threshold
+
+    image_variance = np.zeros(im.shape)
+    segmented_image = im.copy()
+    mask = np.ones_like(im)
+
+    for i in range(0, x, w):
+        for j in range(0, y, w):
+            box = [i, j, min(i + w, x), min(j + w, y)]
+            block_stddev = np.std(im[box[1]:box[3], box[0]:box[2]])
+            image_variance[box[1]:box[3], box[0]:box[2]] = block_stddev
+
+    mask[image_variance < threshold] = 0
+
+    kernel = cv.getStructuringElement(cv.MORPH_ELLIPSE,(w*2, w*2))
+    mask = cv.morphologyEx(mask, cv.MORPH_OPEN, kernel)
+    mask = cv.morphologyEx(mask, cv.MORPH_CLOSE, kernel)
+
+    segmented_image *= mask
+    im = (im - np.mean(im))/(np.std(im))
+    mean_val = np.mean(im[mask==0])
+    std_val = np.std(im[mask==0])
+    norm_img = (im - mean_val)/(std_val)
+
+    return segmented_image, norm_img, mask
+
+
+def ridge_freq(im, mask, orient, block_size, kernel_size, minWaveLength, maxWaveLength):
+    rows,cols = im.shape
+    freq = np.zeros((rows,cols))
+
+    for row in range(0, rows - block_size, block_size):
+        for col in range(0, cols - block_size, block_size):
+            image_block = im[row:row + block_size][:, col:col + block_size]
+            angle_block = orient[row // block_size][col // block_size]
+            if angle_block:
+                freq[row:row + block_size][:, col:col + block_size] = frequest(image_block, angle_block, kernel_size,
+                                                                               minWaveLength, maxWaveLength)
+
+    freq = freq*mask
+    freq_1d = np.reshape(freq,(1,rows*cols))
+    ind = np.where(freq_1d>0)
+    ind = np.array(ind)
+    ind = ind[1,:]
+    non_zero_elems_in_freq = freq_1d[0][ind]
+    medianfreq = np.median(non_zero_elems_in_freq) * mask
+
+    return medianfreq
+
+
+def gabor_filter(im, orient, freq, kx=0.65, ky=0.65):
+    angleInc = 3
+    im = np.double(im)
+    rows, cols = im.shape
+    return_img = np.zeros((rows,cols))
+
+    freq_1d = freq.flatten()
+    if not np.all(np.isfinite(freq_1d)):
+        freq_1d = freq_1d[np.isfinite(freq_1d)]
+    frequency_ind = np.array(np.where(freq_1d>0))
+    non_zero_elems_in_freq = freq_1d[frequency_ind]
+    non_zero_elems_in_freq = np.double(np.round((non_zero_elems_in_freq*100)))/100
+    unfreq = np.unique(non_zero_elems_in_freq)
+
+    if unfreq.size == 0:
+        thresh = np.nanmean(im) if np.isfinite(im).any() else 0.0
+        gabor_img = (im > thresh).astype(np.uint8) * 255
+        return gabor_img
+
+    sigma_x = 1/unfreq*kx
+    sigma_y = 1/unfreq*ky
+    block_size = np.round(3*np.max([sigma_x,sigma_y]))
+    block_size = int(block_size)
+    if block_size < 1:
+        block_size = 1
+    array = np.linspace(-block_size,block_size,(2*block_size + 1))
+    x, y = np.meshgrid(array, array)
+
+    reffilter = np.exp(-(((np.power(x,2))/(sigma_x*sigma_x) + (np.power(y,2))/(sigma_y*sigma_y)))) * np.cos(2*np.pi*unfreq[0]*x)
+    filt_rows, filt_cols = reffilter.shape
+    gabor_filter = np.array(np.zeros((180//angleInc, filt_rows, filt_cols)))
+
+    for degree in range(0,180//angleInc):
+        rot_filt = scipy.ndimage.rotate(reffilter,-(degree*angleInc + 90),reshape = False)
+        gabor_filter[degree] = rot_filt
+
+    maxorientindex = np.round(180/angleInc)
+    orientindex = np.round(orient/np.pi*180/angleInc)
+    for i in range(0,rows//16):
+        for j in range(0,cols//16):
+            if(orientindex[i][j] < 1):
+                orientindex[i][j] = orientindex[i][j] + maxorientindex
+            if(orientindex[i][j] > maxorientindex):
+                orientindex[i][j] = orientindex[i][j] - maxorientindex
+
+    block_size = int(block_size)
+    valid_row, valid_col = np.where(freq>0)
+    finalind = \
+        np.where((valid_row>block_size) & (valid_row<rows - block_size) & (valid_col>block_size) & (valid_col<cols - block_size))
+
+    for k in range(0, np.shape(finalind)[1]):
+        r = valid_row[finalind[0][k]]; c = valid_col[finalind[0][k]]
+        img_block = im[r-block_size:r+block_size + 1][:,c-block_size:c+block_size + 1]
+        return_img[r][c] = np.sum(img_block * gabor_filter[int(orientindex[r//16][c//16]) - 1])
+
+    gabor_img = 255 - np.array((return_img < 0)*255).astype(np.uint8)
+
+    return gabor_img
@@ -0,0 +1,198 @@
+"""
+Benchmarks of the matcher, run from the repository root:
+
+    python -m benchmarks.matching --fingers 6 --repeat 3
+    python -m benchmarks.matching --fingers 6 --identify 1000,10000
+    python -m benchmarks.matching --fingers 60 --impressions 3 --repeat 0
+
+Enhances `impressions` impressions of each synthetic finger (all but the first rotated, shifted and
+re-noised) and reports the genuine and impostor score distributions: their false match and false
+non-match rates (FMR, FNMR) at MATCH_THRESHOLD, and the thresholds that would give a few target
+FMRs. Then times `score` over every template pair on a single core. With --identify, the first
+impressions of half the fingers are enrolled in an identification index among that many random
+templates; their other impressions are identified against it (genuine probes), and so is every
+impression of the other half (impostor probes), giving the false accept rate of 1:N identification
+at IDENTIFY_THRESHOLD and IDENTIFY_MARGIN.
+"""
+import argparse
+import itertools
+import time
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+from app.modules.matching.constants import identified_user
+from app.modules.matching.index import IdentificationIndex
+from app.modules.matching.matcher import score
+from app.modules.matching.template import CYLINDER_BYTES, build_template, pack_template
+from app.modules.normalize_phone.pipeline import phone_pipeline
+from app.modules.normalize_phone.utils.minutia_format import MINUTIA_DTYPE
+
+
+def synthetic_finger(size=512, seed=0, n_minutiae=24):
+    """Ridge pattern whose phase winds around random points, each of which becomes a ridge ending
+    or bifurcation; returns a float image in [-1, 1] and the finger area."""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:size, 0:size].astype(np.float64)
+    cy, cx = size * rng.uniform(0.35, 0.55), size * rng.uniform(0.4, 0.6)
+    r = np.hypot((yy - cy) * rng.uniform(0.9, 1.3), xx - cx)
+    phase = 2 * np.pi * r / 9.0 + 0.3 * np.sin(xx / rng.uniform(30, 60))
+    finger = ((yy - size * 0.45) / (size * 0.42)) ** 2 + ((xx - size * 0.5) / (size * 0.3)) ** 2 <= 1
+    points = np.argwhere(finger)[rng.choice(np.count_nonzero(finger), n_minutiae, replace=False)]
+    for (py, px), sign in zip(points, rng.choice((-1, 1), n_minutiae)):
+        phase += sign * np.arctan2(yy - py, xx - px)
+    return np.cos(phase), finger
+
+
+def synthetic_impression(finger, seed, angle=0.0, shift=(0, 0), scale=6):
+    """A phone-resolution capture of `finger`, rotated by `angle` degrees and shifted."""
+    rng = np.random.default_rng(seed)
+    ridges, area = finger
+    size = ridges.shape[0]
+    img = np.where(area & (ridges > 0), 0.0, 255.0) + 3 * rng.standard_normal(ridges.shape)
+    M = cv2.getRotationMatrix2D((size / 2, size / 2), angle, 1.0)
+    M[:, 2] += shift
+    img = cv2.warpAffine(img, M, (size, size), borderValue=255)
+    img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+    img = cv2.GaussianBlur(img, (0, 0), scale / 2) + 12 * rng.standard_normal(img.shape)
+    return cv2.cvtColor(np.clip(img, 0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+
+
+def enroll(img):
+    outputs = phone_pipeline(img, outputs=("minutiae", "segmentation"))
+    return build_template(outputs["minutiae"], outputs["segmentation"][1])
+
+
+def random_template(rng, size=512, n_minutiae=30):
+    """Template of minutiae scattered over a finger-shaped area, standing in for other users."""
+    minutiae = np.empty(n_minutiae, MINUTIA_DTYPE)
+    t = rng.uniform(0, 2 * np.pi, n_minutiae)
+    r = np.sqrt(rng.uniform(0, 1, n_minutiae))
+    minutiae["x"] = size * 0.5 + r * np.cos(t) * size * 0.28
+    minutiae["y"] = size * 0.45 + r * np.sin(t) * size * 0.4
+    minutiae["angle"] = rng.uniform(0, 2 * np.pi, n_minutiae)
+    minutiae["kind"] = rng.choice((1, 3), n_minutiae)
+    mask = np.zeros((size, size), np.uint8)
+    cv2.ellipse(mask, (size // 2, int(size * 0.45)), (int(size * 0.3), int(size * 0.42)), 0, 0, 360, 1, -1)
+    return build_template(minutiae, mask)
+
+
+def error_rates(genuine, impostor, threshold) -> tuple[float, float]:
+    """False match rate (impostor pairs accepted) and false non-match rate (genuine pairs rejected)."""
+    return np.mean(np.asarray(impostor) >= threshold), np.mean(np.asarray(genuine) < threshold)
+
+
+def bench_identify(templates, population, rng):
+    """Enroll the first impression of every even finger among `population` random users, identify
+    every other impression, and compare the index with scoring every enrolled template."""
+    index = IdentificationIndex()
+    start = time.perf_counter()
+    for user_id in range(population):
+        index.add(1_000_000 + user_id, random_template(rng))
+    enrolled_ids = set()
+    probes = []
+    for finger_id, template in templates:
+        if finger_id in enrolled_ids or finger_id % 2:
+            probes.append((finger_id, template))
+        else:
+            index.add(finger_id, template)
+            enrolled_ids.add(finger_id)
+    enroll_time = time.perf_counter() - start
+
+    shortlisted, hits, wrong, candidate_time, identify_time = 0, 0, 0, 0.0, 0.0
+    impostor_best, impostor_accepted = [], 0
+    for finger_id, template in probes:
+        start = time.perf_counter()
+        candidates = index.candidates(template, settings.IDENTIFY_CANDIDATES)
+        candidate_time += time.perf_counter() - start
+        start = time.perf_counter()
+        results = index.identify(template, settings.IDENTIFY_CANDIDATES)
+        identify_time += time.perf_counter() - start
+        user_id = identified_user(results)
+        if finger_id not in enrolled_ids:
+            impostor_best.append(results[0][1] if results else 0.0)
+            impostor_accepted += user_id is not None
+            continue
+        shortlisted += finger_id in candidates
+        hits += user_id == finger_id
+        wrong += user_id is not None and user_id != finger_id
+    genuine = len(probes) - len(impostor_best)
+
+    # A linear scan scores the probe against everyone
+    enrolled = [t for ts in index._templates.values() for t in ts]
+    sample = enrolled[:2000]
+    start = time.perf_counter()
+    for other in sample:
+        score(probes[0][1], other)
+    scan_time = (time.perf_counter() - start) / len(sample) * len(enrolled)
+
+    print(f"identify     {len(enrolled):>7} enrolled ({enroll_time:.1f} s): {shortlisted}/{genuine} shortlisted, "
+          f"{hits} identified, {wrong} as someone else, candidates {candidate_time / len(probes) * 1e3:6.2f} ms, "
+          f"identify {identify_time / len(probes) * 1e3:6.2f} ms, linear scan ~{scan_time * 1e3:8.1f} ms")
+    if impostor_best:
+        print(f"  impostors  {len(impostor_best)} probes: FAR {impostor_accepted / len(impostor_best):.2%} "
+              f"(threshold {settings.IDENTIFY_THRESHOLD}, margin {settings.IDENTIFY_MARGIN}), best candidate "
+              f"p50 {np.median(impostor_best):.3f}  p99 {np.quantile(impostor_best, 0.99):.3f}  max {max(impostor_best):.3f}")
+
+
+def main(args):
+    # Templates depend on the denoise mode: calibrate thresholds with the one deployed
+    settings.PIPELINE_DENOISE = args.denoise
+    rng = np.random.default_rng(args.seed)
+    templates = []
+    for finger_id in range(args.fingers):
+        finger = synthetic_finger(seed=args.seed + finger_id)
+        templates.append((finger_id, enroll(synthetic_impression(finger, seed=args.seed + 100 * finger_id))))
+        for impression in range(1, args.impressions):
+            img = synthetic_impression(finger, seed=args.seed + 100 * finger_id + impression,
+                                       angle=rng.uniform(-10, 10), shift=rng.uniform(-15, 15, 2))
+            templates.append((finger_id, enroll(img)))
+
+    sizes = [len(t) for _, t in templates]
+    packed = [len(pack_template(t)) for _, t in templates]
+    print(f"templates    {len(templates)}: {np.mean(sizes):.0f} cylinders ({CYLINDER_BYTES} + {CYLINDER_BYTES} bytes each), "
+          f"{np.mean(packed):.0f} bytes packed")
+
+    genuine, impostor = [], []
+    for (id_a, a), (id_b, b) in itertools.combinations(templates, 2):
+        (genuine if id_a == id_b else impostor).append(score(a, b))
+    print(f"genuine      {len(genuine):>7} pairs, min {min(genuine):.3f}  mean {np.mean(genuine):.3f}")
+    print(f"impostor     {len(impostor):>7} pairs, max {max(impostor):.3f}  mean {np.mean(impostor):.3f}  "
+          f"p99.9 {np.quantile(impostor, 0.999):.3f}")
+    fmr, fnmr = error_rates(genuine, impostor, settings.MATCH_THRESHOLD)
+    print(f"threshold    {settings.MATCH_THRESHOLD:.3f}: FMR {fmr:.2%}  FNMR {fnmr:.2%}")
+    for target in (1e-2, 1e-3, 1e-4):
+        if target * len(impostor) < 1:
+            break
+        # Smallest threshold that accepts at most `target` of the impostor pairs
+        threshold = np.quantile(impostor, 1 - target, method="higher") + 1e-6
+        fmr, fnmr = error_rates(genuine, impostor, threshold)
+        print(f"  FMR {target:<6g} at {threshold:.3f}: FNMR {fnmr:.2%}")
+
+    pairs = list(itertools.product([t for _, t in templates], repeat=2))
+    best = float("inf")
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        for a, b in pairs:
+            score(a, b)
+        best = min(best, time.perf_counter() - start)
+    if args.repeat:
+        print(f"score        {best / len(pairs) * 1e6:8.1f} us per comparison, "
+              f"{len(pairs) / best:,.0f} comparisons/s on one core")
+
+    for population in args.identify:
+        bench_identify(templates, population, rng)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--fingers", type=int, default=6, help="Synthetic fingers")
+    ap.add_argument("--impressions", type=int, default=2, help="Impressions of each finger")
+    ap.add_argument("--repeat", type=int, default=3, help="Timed passes over all pairs (best is reported)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--denoise", default=settings.PIPELINE_DENOISE,
+                    help=f"Denoise mode used while enrolling (default: PIPELINE_DENOISE, {settings.PIPELINE_DENOISE})")
+    ap.add_argument("--identify", type=lambda value: [int(n) for n in value.split(",")], default=[],
+                    help="Comma-separated numbers of random users to identify among")
+    main(ap.parse_args())
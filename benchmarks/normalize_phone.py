@@ -0,0 +1,268 @@
+"""
+Benchmarks for the fingerprint enhancement utilities, run from the repository root:
+
+    python -m benchmarks.normalize_phone normalize --size 512 --repeat 5
+    python -m benchmarks.normalize_phone denoise --fixtures path/to/captures
+    python -m benchmarks.normalize_phone tiled --size 4096
+"""
+import argparse
+import os
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from benchmarks import legacy_normalize_phone as legacy
+from app.core.config import settings
+from app.modules.normalize_phone.pipeline import (
+    DENOISE_MODES, PHONE_PIPELINE_GRAPH, phone_pipeline, preprocess_phone_capture,
+)
+from app.modules.normalize_phone.tiled import tiled_skeleton
+from app.modules.normalize_phone.utils.binarization import sauvola_binarize, threshold_sauvola
+from app.modules.normalize_phone.utils.frequency import ridge_freq
+from app.modules.normalize_phone.utils.gabor_filter import gabor_filter
+from app.modules.normalize_phone.utils.minutiae import extract_minutiae
+from app.modules.normalize_phone.utils.normalization import normalize
+from app.modules.normalize_phone.utils.orientation import calculate_angles, smooth_angles
+from app.modules.normalize_phone.utils.segmentation import create_segmented_and_variance_images
+
+
+def synthetic_fingerprint(size=512, seed=0):
+    """Concentric ridge pattern with noise inside an elliptical finger area on a white canvas,
+    roughly the texture of a binarized capture."""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:size, 0:size].astype(np.float64)
+    cy, cx = size * 0.45, size * 0.5
+    r = np.hypot((yy - cy) * 1.2, xx - cx)
+    ridges = np.cos(2 * np.pi * r / 9.0 + 0.3 * np.sin(xx / 40.0))
+    img = (ridges + 0.4 * rng.standard_normal((size, size))) > 0
+    finger = ((yy - cy) / (size * 0.42)) ** 2 + ((xx - cx) / (size * 0.3)) ** 2 <= 1
+    img = np.where(finger & ~img, 0, 255) + 3 * rng.standard_normal((size, size))
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def synthetic_capture(size=512, scale=6, seed=0):
+    """A synthetic fingerprint blown up to phone-camera resolution, softened and with sensor noise."""
+    rng = np.random.default_rng(seed)
+    img = cv2.resize(synthetic_fingerprint(size, seed), None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+    img = cv2.GaussianBlur(img, (0, 0), scale / 2) + 12 * rng.standard_normal(img.shape)
+    return cv2.cvtColor(np.clip(img, 0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+
+
+def load_captures(args):
+    if not args.fixtures:
+        return {"synthetic": synthetic_capture(args.size)}
+    captures = {}
+    for name in sorted(os.listdir(args.fixtures)):
+        img = cv2.imread(os.path.join(args.fixtures, name), cv2.IMREAD_COLOR)
+        if img is not None:
+            # Same orientation the API gives uploads
+            captures[name] = cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    if not captures:
+        raise SystemExit(f"No readable images in {args.fixtures}")
+    return captures
+
+
+def timeit(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def report(name, legacy_time, current_time):
+    print(f"{name:<12} legacy {legacy_time * 1e3:10.2f} ms   current {current_time * 1e3:10.2f} ms   "
+          f"speedup {legacy_time / current_time:8.1f}x")
+
+
+def bench_normalize(args):
+    img = synthetic_fingerprint(args.size)
+    legacy_time, expected = timeit(lambda: legacy.normalize(img.astype(np.float64), 100.0, 100.0), 1)
+    current_time, result = timeit(lambda: normalize(img.astype(np.float64), 100.0, 100.0), args.repeat)
+    np.testing.assert_allclose(result, expected, rtol=1e-6, atol=1e-4)
+
+    work = np.empty(img.shape, np.float32)
+    inplace_time, _ = timeit(lambda: normalize(img, 100.0, 100.0, out=work), args.repeat)
+    np.testing.assert_allclose(work, expected, rtol=1e-5, atol=1e-3)
+
+    report("normalize", legacy_time, current_time)
+    report("  float32", legacy_time, inplace_time)
+
+
+def bench_binarize(args):
+    from skimage.filters import threshold_sauvola as skimage_threshold_sauvola
+
+    # The pipeline binarizes the sharpened capture, not an already binary image
+    img = cv2.GaussianBlur(synthetic_fingerprint(args.size), (5, 5), 0)
+    legacy_time, expected = timeit(lambda: skimage_threshold_sauvola(img, window_size=25), args.repeat)
+    current_time, result = timeit(lambda: threshold_sauvola(img, window_size=25), args.repeat)
+    np.testing.assert_allclose(result, expected, rtol=0, atol=1e-2)
+
+    binary = np.empty(img.shape, np.uint8)
+    binarize_time, _ = timeit(lambda: sauvola_binarize(img, window_size=25, out=binary), args.repeat)
+    mismatch = np.count_nonzero(binary != (img > expected) * 255) / binary.size
+    assert mismatch < 1e-4, f"{mismatch:.2%} of pixels differ"
+    report("sauvola", legacy_time, current_time)
+    report("  binarize", legacy_time, binarize_time)
+
+
+def bench_orientation(args):
+    normalized = normalize(synthetic_fingerprint(args.size), 100.0, 100.0)
+    legacy_time, expected = timeit(lambda: legacy.calculate_angles(normalized, W=16), 1)
+    current_time, result = timeit(lambda: calculate_angles(normalized, W=16), args.repeat)
+    assert result.shape == expected.shape
+    np.testing.assert_allclose(result, expected, rtol=0, atol=1e-12)
+    report("orientation", legacy_time, current_time)
+
+    legacy_time, expected = timeit(lambda: legacy.smooth_angles(result), args.repeat)
+    current_time, smoothed = timeit(lambda: smooth_angles(result), args.repeat)
+    np.testing.assert_allclose(smoothed, expected, rtol=0, atol=1e-9)
+    report("  smoothing", legacy_time, current_time)
+
+
+def bench_segmentation(args):
+    normalized = normalize(synthetic_fingerprint(args.size), 100.0, 100.0)
+    legacy_time, expected = timeit(lambda: legacy.create_segmented_and_variance_images(normalized, 16, 0.2), 1)
+    current_time, result = timeit(lambda: create_segmented_and_variance_images(normalized, 16, 0.2), args.repeat)
+    for actual, wanted in zip(result, expected):
+        np.testing.assert_allclose(actual, wanted, rtol=1e-9, atol=1e-9)
+    report("segmentation", legacy_time, current_time)
+
+    work = np.empty(normalized.shape, np.float32)
+    float32_time, result = timeit(
+        lambda: create_segmented_and_variance_images(normalized, 16, 0.2, out=work), args.repeat
+    )
+    np.testing.assert_allclose(result[1], expected[1], rtol=1e-5, atol=1e-4)
+    report("  float32", legacy_time, float32_time)
+
+
+def bench_frequency(args):
+    normalized = normalize(synthetic_fingerprint(args.size), 100.0, 100.0)
+    _, normim, mask = create_segmented_and_variance_images(normalized, 16, 0.2)
+    angles = calculate_angles(normalized, W=16)
+
+    def run(fn):
+        return fn(normim, mask, angles, 16, kernel_size=5, minWaveLength=5, maxWaveLength=15)
+
+    legacy_time, expected = timeit(lambda: run(legacy.ridge_freq), 1)
+    current_time, result = timeit(lambda: run(ridge_freq), args.repeat)
+    # Blocks are now resampled bilinearly instead of with a cubic spline; the median frequency
+    # must still agree
+    np.testing.assert_allclose(result, expected, rtol=0.05)
+    report("frequency", legacy_time, current_time)
+
+
+def bench_gabor(args):
+    normalized = normalize(synthetic_fingerprint(args.size), 100.0, 100.0)
+    _, normim, mask = create_segmented_and_variance_images(normalized, 16, 0.2)
+    angles = calculate_angles(normalized, W=16)
+    freq = ridge_freq(normim, mask, angles, 16, kernel_size=5, minWaveLength=5, maxWaveLength=15)
+
+    legacy_time, expected = timeit(lambda: legacy.gabor_filter(normim, angles, freq), 1)
+    current_time, result = timeit(lambda: gabor_filter(normim, angles, freq), args.repeat)
+    # Responses are summed in a different order, so a pixel whose response is ~0 may flip
+    mismatch = np.count_nonzero(result != expected) / result.size
+    assert mismatch < 1e-4, f"{mismatch:.2%} of pixels differ"
+    report("gabor", legacy_time, current_time)
+
+
+def bench_minutiae(args):
+    """Cost of the minutiae stage relative to the skeleton it is extracted from."""
+    captures = load_captures(args)
+    for name, img in captures.items():
+        outputs = phone_pipeline(img, outputs=("skeleton", "segmentation", "orientation"))
+        skeleton_time, _ = timeit(lambda: phone_pipeline(img, outputs=("skeleton",)), 1)
+        minutiae_time, template = timeit(
+            lambda: extract_minutiae(outputs["skeleton"], outputs["segmentation"][1], outputs["orientation"]),
+            args.repeat,
+        )
+        print(f"{'minutiae':<12} {name}: {minutiae_time * 1e3:8.2f} ms on top of a {skeleton_time * 1e3:.1f} ms "
+              f"skeleton, {template.size} minutiae ({template.nbytes} bytes)")
+
+
+def bench_denoise(args):
+    """Preprocessing latency of each denoise mode, and how much of the final skeleton agrees with
+    the original full-resolution non-local means output."""
+    captures = load_captures(args)
+    configured = settings.PIPELINE_DENOISE
+    skeletons = {}
+    print(f"{'mode':<12} {'preprocess':>12} {'pipeline':>12} {'agreement':>10}   ({len(captures)} captures)")
+    try:
+        for mode in DENOISE_MODES:
+            settings.PIPELINE_DENOISE = mode
+            repeat = 1 if mode == "nlm" else args.repeat
+            pre_times, total_times, agreement = [], [], []
+            for name, img in captures.items():
+                pre_times.append(timeit(lambda: preprocess_phone_capture(img), repeat)[0])
+                total, outputs = timeit(lambda: phone_pipeline(img, outputs=("skeleton",)), 1)
+                total_times.append(total)
+                ridges = outputs["skeleton"] > 127
+                reference = skeletons.setdefault(name, ridges)
+                agreement.append(np.count_nonzero(ridges == reference) / ridges.size)
+            print(f"{mode:<12} {np.median(pre_times) * 1e3:9.1f} ms {np.median(total_times) * 1e3:9.1f} ms "
+                  f"{np.mean(agreement):10.1%}")
+    finally:
+        settings.PIPELINE_DENOISE = configured
+
+
+def peak_memory(fn):
+    """Wall time, peak traced allocation in bytes and result of one call."""
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        return elapsed, tracemalloc.get_traced_memory()[1], result
+    finally:
+        tracemalloc.stop()
+
+
+def bench_tiled(args):
+    """Skeleton chain on a native-resolution image: full frame against tiles within the budget."""
+    aligned = synthetic_fingerprint(args.size)
+
+    def full_frame():
+        results = {"aligned": aligned}
+        for name in ("normalized", "segmentation", "orientation", "frequency", "skeleton"):
+            deps, fn = PHONE_PIPELINE_GRAPH[name]
+            results[name] = fn(16, *(results[dep] for dep in deps))
+        return results["skeleton"]
+
+    full_time, full_peak, expected = peak_memory(full_frame)
+    tiled_time, tiled_peak, result = peak_memory(lambda: tiled_skeleton(aligned))
+    mismatch = np.count_nonzero(result != expected) / result.size
+    assert mismatch < 1e-4, f"{mismatch:.2%} of pixels differ"
+    print(f"{'tiled':<12} full frame {full_time * 1e3:10.2f} ms {full_peak / 2 ** 20:8.1f} MiB   "
+          f"tiled {tiled_time * 1e3:10.2f} ms {tiled_peak / 2 ** 20:8.1f} MiB   ({args.size}x{args.size}, "
+          f"budget {settings.PIPELINE_TILE_MEMORY / 2 ** 20:.0f} MiB)")
+
+
+BENCHMARKS = {
+    "normalize": bench_normalize,
+    "binarize": bench_binarize,
+    "orientation": bench_orientation,
+    "segmentation": bench_segmentation,
+    "frequency": bench_frequency,
+    "gabor": bench_gabor,
+    "minutiae": bench_minutiae,
+    "denoise": bench_denoise,
+    "tiled": bench_tiled,
+}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("names", nargs="*", metavar="NAME", help=f"Benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    ap.add_argument("--size", type=int, default=512, help="Side of the synthetic square capture")
+    ap.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark (best is reported)")
+    ap.add_argument("--fixtures", help="Directory of phone captures for the denoise benchmark (default: synthetic)")
+    args = ap.parse_args()
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        ap.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name](args)
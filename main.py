@@ -1,12 +1,35 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.modules.users.router import router as users_router
 from app.modules.room.router import router as rooms_router
 from app.modules.access.router import router as access_router
 from app.modules.log.router import router as logs_router
-# from app.modules.normalize_phone.pipeline import router as pipeline_router
+from app.modules.log.writer import log_writer
+from app.modules.normalize_phone.executor import pipeline_executor
+from app.modules.normalize_phone.router import router as pipeline_router
+from app.modules.matching.router import router as matching_router
+from app.modules.matching.identification import fingerprint_identifier
+from app.modules.matching.store import fingerprint_templates
+from app.modules.jobs.router import router as jobs_router
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_writer.start()
+    pipeline_executor.start()
+    # Loads the fingerprint templates and their index in the background: identification answers 503 until then
+    fingerprint_identifier.start()
+    yield
+    # Drain queued access logs before the process exits
+    await log_writer.stop()
+    await fingerprint_identifier.stop()
+    await fingerprint_templates.stop()
+    pipeline_executor.shutdown()
+
 
-app = FastAPI(title="Home Security API", version="1.0.0")
+app = FastAPI(title="Home Security API", version="1.0.0", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -22,7 +45,9 @@ app.include_router(users_router)
 app.include_router(rooms_router)
 app.include_router(access_router)
 app.include_router(logs_router)
-# app.include_router(pipeline_router)
+app.include_router(pipeline_router)
+app.include_router(matching_router)
+app.include_router(jobs_router)
 
 
 @app.get("/")
@@ -0,0 +1,35 @@
+"""
+Stand-ins for pipeline entry points, run in the executor's worker processes by name like the real
+ones ("tests.pipeline_stubs:enhance").
+"""
+import asyncio
+import os
+import time
+
+from app.modules.normalize_phone.executor import InvalidUploadError, PipelineExecutor
+
+ENHANCE = "tests.pipeline_stubs:enhance"
+SLEEP = "time:sleep"
+
+
+def enhance(contents: bytes):
+    """Like `enhance_phone_upload`: b"crash" kills the worker, b"invalid" is not an image, and
+    anything else comes back as its own text after a short while."""
+    if contents == b"crash":
+        os._exit(1)
+    if contents == b"invalid":
+        raise InvalidUploadError("Could not decode image")
+    time.sleep(0.05)
+    return contents.decode(), {"enhance": 50.0}
+
+
+def started_executor(workers: int, max_pending: int) -> PipelineExecutor:
+    """An executor whose workers are all up, so timings in tests are not skewed by process start-up."""
+    executor = PipelineExecutor(workers=workers, max_pending=max_pending)
+    executor.start()
+
+    async def warm():
+        await asyncio.gather(*(executor.run(SLEEP, 0.2) for _ in range(workers)))
+
+    asyncio.run(warm())
+    return executor
@@ -0,0 +1,122 @@
+import asyncio
+import io
+import json
+import zipfile
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.modules.normalize_phone import router as pipeline_router
+from app.modules.normalize_phone.cache import ResultCache
+from app.modules.normalize_phone.executor import PipelineBusyError, PipelineExecutor
+
+from tests.pipeline_stubs import ENHANCE, started_executor
+
+
+@pytest.fixture(scope="module")
+def executor():
+    executor = started_executor(workers=2, max_pending=4)
+    yield executor
+    executor.shutdown()
+
+
+@pytest.fixture
+def client(monkeypatch, executor):
+    monkeypatch.setattr(pipeline_router, "ENHANCE_UPLOAD", ENHANCE)
+    monkeypatch.setattr(pipeline_router, "pipeline_executor", executor)
+    monkeypatch.setattr(pipeline_router, "result_cache", ResultCache(max_bytes=1 << 20))
+    app = FastAPI()
+    app.include_router(pipeline_router.router)
+    return TestClient(app)
+
+
+def _post(client, uploads):
+    return client.post("/normalize-phone/enhance_phone/batch",
+                       files=[("files", (name, contents)) for name, contents in uploads])
+
+
+def _lines(response) -> dict:
+    return {line["index"]: line for line in map(json.loads, response.text.splitlines())}
+
+
+def _remember(contents: bytes, text: str):
+    key = pipeline_router._cache_key(contents, "application/json")
+    asyncio.run(pipeline_router.result_cache.put(key, text.encode(), {}))
+
+
+def test_cache_hits_and_misses(client, executor):
+    _remember(b"b", "cached b")
+
+    response = _post(client, [("a.png", b"a"), ("b.png", b"b"), ("c.png", b"invalid"), ("d.png", b"d")])
+
+    assert response.status_code == 200
+    lines = _lines(response)
+    assert lines[0]["enhanced_image"] == "a" and "cached" not in lines[0]
+    assert lines[1]["enhanced_image"] == "cached b" and lines[1]["cached"]
+    assert lines[2] == {"index": 2, "filename": "c.png", "status": "error", "detail": "Could not decode image"}
+    assert lines[3]["status"] == "success"
+    assert executor.pending == 0
+
+    # Enhanced results were cached on the way
+    lines = _lines(_post(client, [("a.png", b"a"), ("d.png", b"d")]))
+    assert lines[0]["cached"] and lines[1]["cached"]
+
+
+def test_busy_before_the_stream_starts(client, monkeypatch):
+    monkeypatch.setattr(pipeline_router, "pipeline_executor", PipelineExecutor(workers=1, max_pending=0))
+    _remember(b"b", "cached b")
+
+    response = _post(client, [("a.png", b"a"), ("b.png", b"b")])
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+    # Nothing to run: answered from the cache however busy the pool is
+    response = _post(client, [("b.png", b"b")])
+    assert response.status_code == 200
+    assert _lines(response)[0]["enhanced_image"] == "cached b"
+
+
+def test_busy_after_the_stream_started(client, executor, monkeypatch):
+    # The queue fills up between the capacity check and the first submission
+    checks = []
+
+    def fills_up():
+        checks.append(None)
+        if len(checks) > 1:
+            raise PipelineBusyError("4 enhancement requests already queued")
+
+    monkeypatch.setattr(executor, "check_capacity", fills_up)
+    response = _post(client, [("a.png", b"a"), ("b.png", b"b")])
+
+    assert response.status_code == 200
+    lines = _lines(response)
+    assert [lines[index]["status"] for index in (0, 1)] == ["error", "error"]
+    assert lines[0]["detail"] == "Enhancement queue is full, retry later"
+
+
+def test_crashed_worker_is_reported_per_image(client, executor):
+    response = _post(client, [("a.png", b"a"), ("crash.png", b"crash"), ("b.png", b"b")])
+
+    assert response.status_code == 200
+    lines = _lines(response)
+    assert sorted(lines) == [0, 1, 2]
+    assert lines[1] == {"index": 1, "filename": "crash.png", "status": "error",
+                        "detail": "Enhancement worker crashed, retry later"}
+    assert executor.pending == 0
+    assert _lines(_post(client, [("c.png", b"c")]))[0]["enhanced_image"] == "c"
+
+
+def test_batch_size_limits(client, monkeypatch):
+    monkeypatch.setattr(settings, "PIPELINE_MAX_BATCH_BYTES", 10)
+
+    assert _post(client, [("a.png", b"a" * 6), ("b.png", b"b" * 6)]).status_code == 413
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("a.png", b"a" * 6)
+        zf.writestr("b.png", b"b" * 6)
+    assert _post(client, [("batch.zip", archive.getvalue())]).status_code == 413
+
+    assert _post(client, [("a.png", b"a" * 5), ("b.png", b"b" * 5)]).status_code == 200
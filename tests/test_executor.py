@@ -0,0 +1,126 @@
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app.modules.normalize_phone.executor import PipelineBusyError, PipelineCrashedError
+
+from tests.pipeline_stubs import ENHANCE, SLEEP, started_executor
+
+
+@pytest.fixture(scope="module")
+def executor():
+    executor = started_executor(workers=4, max_pending=4)
+    yield executor
+    executor.shutdown()
+
+
+async def _drain(batch) -> dict:
+    return {index: future.result() async for index, future in batch}
+
+
+def test_map_unordered_yields_every_item(executor):
+    results = asyncio.run(_drain(executor.map_unordered(ENHANCE, [b"a", b"b", b"c", b"d", b"e", b"f"], window=2)))
+
+    assert {index: text for index, (text, _) in results.items()} == dict(enumerate("abcdef"))
+    assert executor.pending == 0
+
+
+def test_overlapping_batches_past_the_budget(executor):
+    # Batches that each keep one item in flight take the pool past max_pending; another batch with
+    # items in flight must then wait for room instead of failing
+    async def scenario():
+        long_batch = executor.map_unordered(SLEEP, [1.0, 0.3], window=2)
+        long_next = asyncio.ensure_future(long_batch.__anext__())
+        await asyncio.sleep(0)
+        short_batches = [executor.map_unordered(SLEEP, [0.05, 1.0], window=1) for _ in range(2)]
+        short_next = [asyncio.ensure_future(batch.__anext__()) for batch in short_batches]
+        await asyncio.sleep(0)
+        assert executor.pending == 4
+
+        # Both first short items are done; single calls take their room before the batches resume
+        await asyncio.gather(*short_next)
+        runs = [asyncio.ensure_future(executor.run(SLEEP, 1.0)) for _ in range(2)]
+        await asyncio.sleep(0)
+        short_next = [asyncio.ensure_future(batch.__anext__()) for batch in short_batches]
+        await asyncio.sleep(0)
+        assert executor.pending == 6
+
+        index, _ = await long_next
+        assert index == 1
+        index, _ = await long_batch.__anext__()
+        assert index == 0
+        with pytest.raises(StopAsyncIteration):
+            await long_batch.__anext__()
+
+        await asyncio.gather(*short_next, *runs)
+        for batch in short_batches:
+            with pytest.raises(StopAsyncIteration):
+                await batch.__anext__()
+
+    asyncio.run(scenario())
+    assert executor.pending == 0
+
+
+def test_concurrent_batches_and_calls(executor):
+    async def scenario():
+        batches = [_drain(executor.map_unordered(ENHANCE, [b"x"] * 8, window=1)) for _ in range(2)]
+        calls = [executor.run(ENHANCE, b"y") for _ in range(2)]
+        return await asyncio.gather(*batches, *calls)
+
+    *batches, first, second = asyncio.run(scenario())
+
+    assert [sorted(results) for results in batches] == [list(range(8))] * 2
+    assert first[0] == second[0] == "y"
+    assert executor.pending == 0
+
+
+def test_busy_when_the_budget_is_full(executor):
+    async def scenario():
+        runs = [asyncio.ensure_future(executor.run(SLEEP, 0.2)) for _ in range(executor.max_pending)]
+        await asyncio.sleep(0)
+        with pytest.raises(PipelineBusyError):
+            await executor.run(SLEEP, 0)
+        with pytest.raises(PipelineBusyError):
+            await _drain(executor.map_unordered(SLEEP, [0]))
+        await asyncio.gather(*runs)
+
+    asyncio.run(scenario())
+    assert executor.pending == 0
+
+
+def test_abandoned_batch_releases_its_budget(executor):
+    async def scenario():
+        batch = executor.map_unordered(SLEEP, [0.2] * 8, window=4)
+        await batch.__anext__()
+        await batch.aclose()
+        # Items already running keep their share until they end
+        await asyncio.sleep(0.5)
+
+    asyncio.run(scenario())
+    assert executor.pending == 0
+
+
+def test_crashed_worker_fails_its_batch_items_and_is_replaced():
+    executor = started_executor(workers=2, max_pending=8)
+    try:
+        async def scenario():
+            outcomes = {}
+            async for index, future in executor.map_unordered(ENHANCE, [b"a", b"crash", b"b", b"c"], window=1):
+                outcomes[index] = future.exception()
+            return outcomes
+
+        # The rest of the batch runs on a new pool
+        outcomes = asyncio.run(scenario())
+        assert outcomes[0] is None
+        assert isinstance(outcomes[1], BrokenProcessPool)
+        assert outcomes[2] is None and outcomes[3] is None
+        assert executor.pending == 0
+        assert asyncio.run(executor.run(ENHANCE, b"e"))[0] == "e"
+
+        with pytest.raises(PipelineCrashedError):
+            asyncio.run(executor.run(ENHANCE, b"crash"))
+        assert asyncio.run(executor.run(ENHANCE, b"f"))[0] == "f"
+        assert executor.pending == 0
+    finally:
+        executor.shutdown()
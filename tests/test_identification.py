@@ -0,0 +1,134 @@
+import asyncio
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.modules.matching.identification import FingerprintIdentifier, IndexNotReadyError
+from app.modules.matching.index import IdentificationIndex
+from app.modules.matching.template import build_template, pack_template
+from app.modules.matching.template_file import mapped_template_file, write_template_file
+from app.modules.normalize_phone.utils.minutia_format import MINUTIA_DTYPE
+
+SIZE = 512
+# Finger-shaped area the minutiae are scattered over
+_YY, _XX = np.mgrid[0:SIZE, 0:SIZE]
+MASK = (((_YY - SIZE * 0.45) / (SIZE * 0.42)) ** 2 + ((_XX - SIZE * 0.5) / (SIZE * 0.3)) ** 2 <= 1).astype(np.uint8)
+
+
+def random_minutiae(rng, n=30):
+    minutiae = np.empty(n, MINUTIA_DTYPE)
+    t = rng.uniform(0, 2 * np.pi, n)
+    r = np.sqrt(rng.uniform(0, 1, n))
+    minutiae["x"] = SIZE * 0.5 + r * np.cos(t) * SIZE * 0.28
+    minutiae["y"] = SIZE * 0.45 + r * np.sin(t) * SIZE * 0.4
+    minutiae["angle"] = rng.uniform(0, 2 * np.pi, n)
+    minutiae["kind"] = rng.choice((1, 3), n)
+    return minutiae
+
+
+def impression(minutiae, rng):
+    """Another capture of the same finger: every minutia moved by a pixel or two."""
+    moved = minutiae.copy()
+    moved["x"] = moved["x"] + rng.integers(-2, 3, len(moved))
+    moved["y"] = moved["y"] + rng.integers(-2, 3, len(moved))
+    moved["angle"] = np.mod(moved["angle"] + rng.normal(0, 0.05, len(moved)), 2 * np.pi)
+    return build_template(moved, MASK)
+
+
+@pytest.fixture(scope="module")
+def fingers():
+    rng = np.random.default_rng(7)
+    return [random_minutiae(rng) for _ in range(20)]
+
+
+def test_identify_add_and_remove(fingers):
+    rng = np.random.default_rng(1)
+    index = IdentificationIndex()
+    index.add_many((user_id, build_template(minutiae, MASK)) for user_id, minutiae in enumerate(fingers))
+    assert len(index) == 20
+
+    for user_id in (0, 7, 19):
+        results = index.identify(impression(fingers[user_id], rng))
+        assert results[0][0] == user_id
+
+    index.remove(7)
+    assert 7 not in index
+    assert 7 not in [user_id for user_id, _ in index.identify(impression(fingers[7], rng))]
+
+    # A second finger, given packed like the template file holds them
+    index.add(3, pack_template(build_template(fingers[7], MASK)))
+    assert index.identify(impression(fingers[7], rng))[0][0] == 3
+    index.replace(3, [build_template(fingers[3], MASK)])
+    assert index.identify(impression(fingers[3], rng))[0][0] == 3
+    assert dict(index.identify(impression(fingers[7], rng))).get(3, 0.0) < settings.MATCH_THRESHOLD
+
+
+def test_snapshot_round_trip(fingers, tmp_path):
+    templates = [(user_id, pack_template(build_template(minutiae, MASK))) for user_id, minutiae in enumerate(fingers)]
+    index = IdentificationIndex()
+    index.add_many(templates)
+    index.remove(5)
+    index.save(str(tmp_path / "index.npz"), b"stamp")
+
+    kept = [(user_id, template) for user_id, template in templates if user_id != 5]
+    loaded = IdentificationIndex.load(str(tmp_path / "index.npz"), b"stamp", kept)
+    probe = impression(fingers[11], np.random.default_rng(2))
+    assert loaded.identify(probe) == index.identify(probe)
+    # Taken of another file
+    assert IdentificationIndex.load(str(tmp_path / "index.npz"), b"other", kept) is None
+
+
+class _SlowStore:
+    """Template store whose startup waits for `loaded`."""
+
+    def __init__(self, path):
+        self.path = path
+        self.loaded = asyncio.Event()
+        self._file = None
+
+    async def start(self):
+        await self.loaded.wait()
+        self._file = mapped_template_file(self.path)
+
+    def file(self):
+        return self._file
+
+    async def refreshed(self):
+        return self._file
+
+
+def test_identify_is_refused_until_the_startup_build_is_done(fingers, tmp_path):
+    path = str(tmp_path / "templates.bin")
+    rows = [(user_id, user_id, 0, pack_template(build_template(minutiae, MASK)))
+            for user_id, minutiae in enumerate(fingers)]
+    write_template_file(path, rows, b"stamp")
+    probe = pack_template(impression(fingers[4], np.random.default_rng(3)))
+
+    async def scenario():
+        store = _SlowStore(path)
+        identifier = FingerprintIdentifier(store, candidates=10, snapshot_path=None)
+        identifier.start()
+        await asyncio.sleep(0)
+        with pytest.raises(IndexNotReadyError):
+            await identifier.identify(probe)
+
+        store.loaded.set()
+        await identifier._start_task
+        assert identifier.ready
+        results = await identifier.identify(probe)
+        await identifier.stop()
+        return results
+
+    assert asyncio.run(scenario())[0][0] == 4
+
+
+def test_scoring_does_not_load_opencv():
+    modules = "main, app.modules.matching.index, app.modules.matching.identification"
+    code = f"import sys, {modules}; print(','.join(m for m in ('cv2', 'skimage', 'scipy') if m in sys.modules))"
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                          cwd=Path(__file__).resolve().parents[1])
+    assert proc.stdout.strip() == ""
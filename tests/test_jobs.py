@@ -0,0 +1,172 @@
+import asyncio
+import uuid
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.modules.jobs import worker
+from app.modules.jobs.models import JobStatus
+from app.modules.jobs.queue import JobQueue
+from app.modules.normalize_phone.executor import InvalidUploadError, PipelineCrashedError
+
+
+class RecordingSession:
+    """Session that compiles every statement for Postgres instead of running it."""
+
+    def __init__(self, rowcount: int = 1):
+        self.rowcount = rowcount
+        self.statements = []
+
+    async def execute(self, statement, *args):
+        self.statements.append(statement.compile(dialect=postgresql.dialect()))
+        return SimpleNamespace(rowcount=self.rowcount, one_or_none=lambda: None)
+
+    async def commit(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+@pytest.fixture
+def queue():
+    return JobQueue(poll_interval=0.01, timeout=0.2, max_attempts=3, retry_delay=5, retention=3600)
+
+
+def _job(attempts: int, crashes: int = 0):
+    return SimpleNamespace(id=uuid.uuid4(), kind="enhance", params={}, input=b"", attempts=attempts, crashes=crashes)
+
+
+def _fail(queue, job, **outcome):
+    db = RecordingSession()
+    assert asyncio.run(queue.fail(db, job, "worker-1", "boom", **outcome))
+    (statement,) = db.statements
+    return str(statement), statement.params
+
+
+def test_failed_job_is_retried_with_exponential_backoff(queue):
+    for attempts, delay in ((1, 5), (2, 10)):
+        sql, params = _fail(queue, _job(attempts), retry=True)
+        assert params["status"] == JobStatus.QUEUED
+        assert params["worker"] is None and params["heartbeat_at"] is None
+        assert "available_at=(now() + " in sql
+        assert timedelta(seconds=delay) in params.values()
+        # The attempt counts
+        assert "attempts=" not in sql
+        # Only while the job is still ours
+        assert params["worker_1"] == "worker-1" and params["status_1"] == JobStatus.RUNNING
+
+
+def test_job_out_of_attempts_fails(queue):
+    _, params = _fail(queue, _job(attempts=3), retry=True)
+    assert params["status"] == JobStatus.FAILED and params["input"] is None
+
+    _, params = _fail(queue, _job(attempts=1), retry=False)
+    assert params["status"] == JobStatus.FAILED
+
+
+def test_crashed_job_is_requeued_without_counting_the_attempt(queue):
+    sql, params = _fail(queue, _job(attempts=3, crashes=1), retry=True, crashed=True)
+    assert params["status"] == JobStatus.QUEUED
+    assert "attempts=(jobs.attempts - " in sql and params["attempts_1"] == 1
+    assert "crashes=(jobs.crashes + " in sql
+    assert timedelta(seconds=5) in params.values()
+
+    # A job that keeps crashing the pool is given up on
+    sql, params = _fail(queue, _job(attempts=1, crashes=3), retry=True, crashed=True)
+    assert params["status"] == JobStatus.QUEUED and "crashes=" not in sql
+    _, params = _fail(queue, _job(attempts=3, crashes=3), retry=True, crashed=True)
+    assert params["status"] == JobStatus.FAILED
+
+
+def test_claim_skips_jobs_backing_off(queue):
+    db = RecordingSession()
+    asyncio.run(queue.claim(db, "worker-1"))
+    sql = str(db.statements[0])
+    assert "jobs.available_at <= now()" in sql and "FOR UPDATE SKIP LOCKED" in sql
+    assert "heartbeat_at=now()" in sql
+
+
+def test_recover_goes_by_the_heartbeat(queue):
+    db = RecordingSession()
+    asyncio.run(queue.recover(db))
+    requeued, failed, purged = map(str, db.statements)
+    assert "jobs.heartbeat_at < now() - " in requeued and "started_at <" not in requeued
+    assert "jobs.attempts < " in requeued
+    assert "jobs.heartbeat_at < now() - " in failed
+
+
+class FakeQueue:
+    """Hands out `job` once, then records what the worker reports."""
+
+    def __init__(self, job, stopping, timeout=0.2):
+        self.job = job
+        self.stopping = stopping
+        self.timeout = timeout
+        self.poll_interval = 0.01
+        self.heartbeats = 0
+        self.outcome = None
+
+    async def claim(self, db, name):
+        job, self.job = self.job, None
+        if job is None:
+            self.stopping.set()
+        return job
+
+    async def heartbeat(self, db, job_id, name):
+        self.heartbeats += 1
+        return True
+
+    async def complete(self, db, job_id, name, body, headers, timings):
+        self.outcome = dict(done=True)
+        return True
+
+    async def fail(self, db, job, name, **outcome):
+        self.outcome = outcome
+        return True
+
+
+class FakeExecutor:
+    def __init__(self, error=None, duration=0.0):
+        self.error = error
+        self.duration = duration
+
+    async def run(self, fn, *args):
+        await asyncio.sleep(self.duration)
+        if self.error is not None:
+            raise self.error
+        return b"png", {"Content-Type": "image/png"}, {"enhance": 1.0}
+
+
+def _work(monkeypatch, executor):
+    monkeypatch.setattr(worker, "AsyncSessionLocal", RecordingSession)
+
+    async def scenario():
+        stopping = asyncio.Event()
+        queue = FakeQueue(_job(attempts=1), stopping)
+        queue.job.params = {"media_type": "image/png", "stages": ["skeleton"], "compression": 1}
+        await worker.work(queue, executor, "worker-1", stopping)
+        return queue
+
+    return asyncio.run(scenario())
+
+
+def test_worker_sends_heartbeats_while_a_job_runs(monkeypatch):
+    queue = _work(monkeypatch, FakeExecutor(duration=0.25))
+    assert queue.outcome == dict(done=True)
+    assert queue.heartbeats >= 3
+
+
+@pytest.mark.parametrize("error, outcome", [
+    (PipelineCrashedError("An enhancement worker crashed"), dict(retry=True, crashed=True)),
+    (InvalidUploadError("Invalid image file"), dict(retry=False)),
+    (ValueError("bad stage"), dict(retry=True)),
+])
+def test_worker_outcomes(monkeypatch, error, outcome):
+    queue = _work(monkeypatch, FakeExecutor(error=error))
+    assert {key: value for key, value in queue.outcome.items() if key != "error"} == outcome
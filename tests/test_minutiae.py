@@ -0,0 +1,47 @@
+import cv2
+import numpy as np
+
+from app.modules.normalize_phone.utils.minutia_format import MINUTIA_BIFURCATION, MINUTIA_DTYPE, MINUTIA_ENDING
+from app.modules.normalize_phone.utils.minutiae import extract_minutiae, thin
+
+SIZE = 128
+
+
+def _skeleton(*lines):
+    """Skeleton-stage image (ridges dark) of 3 px wide ridges along `lines`."""
+    im = np.full((SIZE, SIZE), 255, np.uint8)
+    for start, end in lines:
+        cv2.line(im, start, end, 0, 3)
+    return im
+
+
+def test_thinning_leaves_one_pixel_wide_ridges():
+    thinned = thin(_skeleton(((20, 64), (108, 64))) < 128)
+    columns = thinned[:, 24:104].sum(axis=0)
+    assert (columns == 1).all()
+
+
+def test_ridge_endings_point_away_from_the_ridge():
+    minutiae = extract_minutiae(_skeleton(((30, 64), (100, 64))), np.ones((SIZE, SIZE)), np.zeros((8, 8)), border=8)
+
+    assert minutiae.dtype == MINUTIA_DTYPE
+    assert (minutiae["kind"] == MINUTIA_ENDING).all() and len(minutiae) == 2
+    left, right = sorted(minutiae, key=lambda minutia: minutia["x"])
+    assert abs(int(left["x"]) - 30) <= 2 and abs(int(right["x"]) - 100) <= 2
+    assert np.isclose(left["angle"], np.pi) and np.isclose(right["angle"], 0)
+
+
+def test_bifurcation_and_border():
+    skeleton = _skeleton(((30, 64), (100, 64)), ((64, 64), (64, 100)))
+    minutiae = extract_minutiae(skeleton, np.ones((SIZE, SIZE)), np.zeros((8, 8)), border=8)
+
+    bifurcations = minutiae[minutiae["kind"] == MINUTIA_BIFURCATION]
+    assert len(bifurcations) == 1
+    assert abs(int(bifurcations["x"][0]) - 64) <= 2 and abs(int(bifurcations["y"][0]) - 64) <= 2
+    assert np.count_nonzero(minutiae["kind"] == MINUTIA_ENDING) == 3
+
+    # Endings closer than `border` to the edge of the mask are cut-off ridges, not minutiae
+    mask = np.ones((SIZE, SIZE))
+    mask[:, 95:] = 0
+    minutiae = extract_minutiae(skeleton, mask, np.zeros((8, 8)), border=8)
+    assert int(minutiae["x"].max()) < 95 - 8
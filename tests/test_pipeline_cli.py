@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+from app.modules.normalize_phone.pipeline import cli_output_paths, expand_inputs, plan_outputs, run_batch
+
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"not an image")
+
+
+def test_outputs_mirror_the_input_tree(tmp_path):
+    for name in ("a/001.png", "b/001.png", "b/c/002.png"):
+        _touch(str(tmp_path / "in" / name))
+    paths = expand_inputs(str(tmp_path / "in" / "**" / "*.png"))
+
+    plan = plan_outputs(paths, "out")
+
+    assert sorted(targets["skeleton"] for targets in plan.values()) == [
+        os.path.join("out", "a", "001_skeleton.png"),
+        os.path.join("out", "b", "001_skeleton.png"),
+        os.path.join("out", "b", "c", "002_skeleton.png"),
+    ]
+
+
+def test_flat_inputs_keep_flat_names(tmp_path):
+    _touch(str(tmp_path / "x.png"))
+    assert cli_output_paths(str(tmp_path / "x.png"), "out")["skeleton"] == os.path.join("out", "x_skeleton.png")
+    assert plan_outputs([str(tmp_path / "x.png")], "out")[str(tmp_path / "x.png")]["rot90"] == \
+        os.path.join("out", "x_rot90.png")
+
+
+def test_clashing_inputs_are_refused_before_anything_runs(tmp_path):
+    for name in ("x.png", "x.jpg"):
+        _touch(str(tmp_path / "in" / name))
+    paths = expand_inputs(str(tmp_path / "in"))
+
+    with pytest.raises(ValueError, match="x.png"):
+        run_batch(paths, str(tmp_path / "out"))
+    assert not os.path.exists(tmp_path / "out")
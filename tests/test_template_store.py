@@ -0,0 +1,79 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from app.modules.matching import store as store_module
+from app.modules.matching.constants import template_version
+from app.modules.matching.models import FingerprintTemplate
+from app.modules.matching.store import FingerprintTemplateStore
+from app.modules.users.models import User
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    engine = create_async_engine("sqlite+aiosqlite://")
+    sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def create():
+        async with engine.begin() as conn:
+            await conn.run_sync(lambda sync_conn: User.metadata.create_all(
+                sync_conn, tables=[User.__table__, FingerprintTemplate.__table__]))
+
+    asyncio.run(create())
+    monkeypatch.setattr(store_module, "AsyncSessionLocal", sessions)
+    yield sessions
+    asyncio.run(engine.dispose())
+
+
+async def _enroll(sessions, rows):
+    async with sessions() as db:
+        await db.execute(insert(FingerprintTemplate), [
+            {"user_id": user_id, "finger": finger, "version": version, "template": template,
+             "created_at": datetime.now()}
+            for user_id, finger, version, template in rows
+        ])
+        await db.commit()
+
+
+def test_templates_of_other_versions_are_not_read_but_kept(sessions, monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "PIPELINE_DENOISE", "nlm")
+    current = template_version()
+    monkeypatch.setattr(settings, "PIPELINE_DENOISE", "gaussian")
+    other = template_version()
+    assert other != current
+
+    store = FingerprintTemplateStore(path=str(tmp_path / "templates.bin"))
+
+    async def scenario():
+        await _enroll(sessions, [(1, 1, current, b"new 1"), (1, 2, current, b"new 2"), (1, 1, other, b"old 1")])
+        monkeypatch.setattr(settings, "PIPELINE_DENOISE", "nlm")
+        await store.start()
+        async with sessions() as db:
+            templates = await store.user_templates(db, 1)
+            counts = await store.version_counts(db)
+        # A process with the other settings reads its own templates
+        monkeypatch.setattr(settings, "PIPELINE_DENOISE", "gaussian")
+        async with sessions() as db:
+            others = await store.user_templates(db, 1)
+        return templates, counts, others
+
+    templates, counts, others = asyncio.run(scenario())
+
+    assert templates == [b"new 1", b"new 2"]
+    assert others == [b"old 1"]
+    assert counts == {current: 2, other: 1}
+
+
+def test_purge_keeps_the_listed_versions(sessions):
+    async def scenario():
+        await _enroll(sessions, [(1, 1, "a", b"1"), (1, 1, "b", b"2"), (2, 1, "b", b"3"), (2, 1, "c", b"4")])
+        async with sessions() as db:
+            purged = await FingerprintTemplateStore.purge_versions(db, ["b", "c"])
+            counts = await FingerprintTemplateStore.version_counts(db)
+        return purged, counts
+
+    assert asyncio.run(scenario()) == (1, {"b": 2, "c": 1})